@@ -0,0 +1,501 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from trigger_index import TriggerIndex, evaluate
+
+WEI = 10**18
+PRICE = 60000
+ARTIFACT_PATH = os.path.join("..", "artifacts", "contracts", "PredictionMarket.sol", "PredictionMarket.json")
+IMPORT_MODULES = ("contract_service", "price_monitor", "event_listener", "main", "discord_bot", "cluster")
+IMPORT_BUDGET = 3.0
+
+
+def make_pools(count, price, now, seed=0):
+    """Generates random active pools with thresholds around the given price."""
+    rng = random.Random(seed)
+    pools = []
+    for pool_id in range(count):
+        target_price = int(price * rng.uniform(1.01, 1.5))
+        stop_loss = int(price * rng.uniform(0.5, 0.99))
+        end_time = now + rng.randint(60, 30 * 86400)
+        pools.append((pool_id, target_price * WEI, stop_loss * WEI, end_time))
+    return pools
+
+
+def bench_trigger_index(count, ticks):
+    price, now = 60000, int(time.time())
+    pools = make_pools(count, price, now)
+    rng = random.Random(1)
+    prices = [int(price * rng.uniform(0.995, 1.015)) * WEI for _ in range(ticks)]
+
+    index = TriggerIndex()
+    started = time.perf_counter()
+    index.rebuild(pools)
+    build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    triggered = 0
+    for i, tick in enumerate(prices):
+        triggered += len(index.triggered(tick, now + i * 60))
+    per_tick = (time.perf_counter() - started) / ticks
+
+    scan_ticks = max(1, ticks // 10)
+    started = time.perf_counter()
+    for i, tick in enumerate(prices[:scan_ticks]):
+        [pool for pool in pools if evaluate(tick, now + i * 60, *pool[1:])]
+    per_scan = (time.perf_counter() - started) / scan_ticks
+
+    extra = make_pools(ticks, price, now, seed=2)
+    started = time.perf_counter()
+    for pool_id, target_price, stop_loss, end_time in extra:
+        index.add(count + pool_id, target_price, stop_loss, end_time)
+    for pool_id, _, _, _ in extra:
+        index.remove(count + pool_id)
+    per_update = (time.perf_counter() - started) / (2 * ticks)
+
+    print(f"trigger index: {count} active pools, {ticks} ticks")
+    print(f"  build:             {build * 1e3:10.2f} ms")
+    print(f"  per tick (index):  {per_tick * 1e6:10.2f} us  ({triggered / ticks:.1f} pools triggered per tick)")
+    print(f"  per tick (scan):   {per_scan * 1e6:10.2f} us")
+    print(f"  per insert/remove: {per_update * 1e6:10.2f} us")
+    return {
+        "pools": count,
+        "ticks": ticks,
+        "build_seconds": build,
+        "tick_seconds": per_tick,
+        "scan_tick_seconds": per_scan,
+        "update_seconds": per_update,
+    }
+
+
+def bench_replay(count, minutes):
+    from replay import random_walk, synthetic_pools, replay, summarize, finalization_load
+
+    series = random_walk(minutes)
+    pools = synthetic_pools(count, series)
+    started = time.perf_counter()
+    result = replay(pools, series)
+    elapsed = time.perf_counter() - started
+    load = finalization_load(result)
+
+    print(f"replay: {count} pools, {minutes} minute candles")
+    print(f"  replay:            {elapsed * 1e3:10.2f} ms")
+    print(f"  peak per hour:     {load['peak']:10d} finalizations")
+    return {"pools": count, "candles": minutes, "seconds": elapsed, "outcomes": summarize(result),
+            "finalizations_per_hour": load}
+
+
+def bench_import_time(modules=IMPORT_MODULES, budget=IMPORT_BUDGET):
+    """
+    Times a cold import of each entry module in a fresh interpreter.
+
+    The node and Vault addresses point at a closed port, so an import that reaches
+    for the network fails or overruns the budget instead of passing.
+    """
+    results = {}
+    print(f"import time (budget {budget:.2f} s)")
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {
+            **os.environ,
+            "WEB3_SOCKET_URL": "ws://127.0.0.1:9",
+            "VAULT_ADDR": "http://127.0.0.1:9",
+            "LOG_FILE": os.path.join(workdir, "microservice.log"),
+            "POOL_ARCHIVE_PATH": os.path.join(workdir, "pool_archive.db"),
+        }
+        for module in modules:
+            code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+            try:
+                process = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True,
+                                         timeout=budget * 10)
+            except subprocess.TimeoutExpired:
+                results[module] = {"seconds": None, "within_budget": False, "error": "timed out"}
+                print(f"  {module:<18} timed out")
+                continue
+            if process.returncode != 0:
+                error = (process.stderr.strip().splitlines() or ["failed"])[-1]
+                results[module] = {"seconds": None, "within_budget": False, "error": error}
+                print(f"  {module:<18} failed: {error}")
+                continue
+            seconds = float(process.stdout.strip().splitlines()[-1])
+            results[module] = {"seconds": seconds, "within_budget": seconds <= budget}
+            print(f"  {module:<18} {seconds * 1e3:10.2f} ms" + ("" if seconds <= budget else "  OVER BUDGET"))
+    return {"budget_seconds": budget, "modules": results}
+
+
+def bytecode_path(path=None):
+    """Returns the given bytecode file, else the artifact written by `npx hardhat compile` if it exists."""
+    if path is None and os.path.exists(ARTIFACT_PATH):
+        return ARTIFACT_PATH
+    return path
+
+
+def load_bytecode(path=None):
+    """
+    Returns the PredictionMarket creation bytecode from a hex file or a Hardhat artifact.
+
+    Nothing is compiled or downloaded here, so the offline run needs no network access.
+    """
+    path = bytecode_path(path)
+    if path is None:
+        raise FileNotFoundError(f"No contract bytecode: run `npx hardhat compile` to write {ARTIFACT_PATH} or pass --bytecode")
+    with open(path) as file:
+        content = file.read().strip()
+    return json.loads(content)["bytecode"] if path.endswith(".json") else content
+
+
+def fake_coingecko(quote):
+    """Returns an httpx transport answering /simple/price with the USD price in quote["usd"] for every asset."""
+    import httpx
+
+    def handler(request):
+        asset_ids = request.url.params["ids"].split(",")
+        return httpx.Response(200, json={asset_id: {"usd": quote["usd"]} for asset_id in asset_ids})
+
+    return httpx.MockTransport(handler)
+
+
+def to_wire(value):
+    """Encodes eth-tester results the way a JSON-RPC node sends them."""
+    if value is None or isinstance(value, (bool, float, str)):
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return {key: to_wire(item) for key, item in value.items()}
+    return [to_wire(item) for item in value]
+
+
+def local_node(chain=None):
+    """
+    Returns an in-process eth-tester chain that speaks the JSON-RPC wire format.
+
+    The service sends raw requests and batches and parses hex results itself, so
+    the tester's Python-typed results are encoded as a node would encode them.
+
+    :param chain: EthereumTester of another local node to share, so that several nodes serve one chain
+    """
+    from web3.providers.eth_tester import AsyncEthereumTesterProvider
+    from web3.providers.eth_tester.middleware import request_formatters, result_formatters
+    from eth_tester.exceptions import TransactionFailed
+
+    class LocalNodeProvider(AsyncEthereumTesterProvider):
+        _middleware = ()
+
+        async def make_request(self, method, params):
+            if method in ("eth_call", "eth_estimateGas") and "from" not in params[0]:
+                # Nodes default the sender of calls; eth-tester insists on one.
+                params = [{**params[0], "from": self.ethereum_tester.get_accounts()[0]}, *params[1:]]
+            formatter = request_formatters.get(method)
+            try:
+                response = await super().make_request(method, formatter(params) if formatter else params)
+            except TransactionFailed as e:
+                # Nodes answer a reverting call with a JSON-RPC error rather than failing the request.
+                return {"jsonrpc": "2.0", "error": {"code": 3, "message": str(e)}}
+            if "result" in response:
+                formatter = result_formatters.get(method)
+                result = formatter(response["result"]) if formatter else response["result"]
+                response = {**response, "result": to_wire(result)}
+            return response
+
+        async def make_batch_request(self, requests):
+            return [{**await self.make_request(method, params), "id": i} for i, (method, params) in enumerate(requests)]
+
+    node = LocalNodeProvider()
+    if chain is not None:
+        node.ethereum_tester = chain
+    return node
+
+
+def flaky_node(node, seed, latency=0.002, stall_rate=0.02, stall=0.2, failure_rate=0.01):
+    """Wraps a local node so that it answers like a congested public endpoint: some requests stall, some fail."""
+    from web3.providers.async_base import AsyncBaseProvider
+
+    class FlakyNodeProvider(AsyncBaseProvider):
+        rng = random.Random(seed)
+
+        async def delay(self):
+            draw = self.rng.random()
+            await asyncio.sleep(latency + (stall if draw < stall_rate else 0))
+            if draw > 1 - failure_rate:
+                raise ConnectionError("Connection reset by peer")
+
+        async def make_request(self, method, params):
+            await self.delay()
+            return await node.make_request(method, params)
+
+        async def make_batch_request(self, requests):
+            await self.delay()
+            return await node.make_batch_request(requests)
+
+        async def is_connected(self, show_traceback=False):
+            return True
+
+    return FlakyNodeProvider()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"p50": None, "p99": None}
+    return {"p50": samples[len(samples) // 2], "p99": samples[min(len(samples) - 1, int(len(samples) * 0.99))]}
+
+
+async def bench_router(requests, nodes=3):
+    """Compares reads through one flaky node with reads routed over several flaky nodes serving the same chain."""
+    from web3 import AsyncWeb3
+    from rpc_router import RpcRouter
+
+    chain = local_node().ethereum_tester
+    account = chain.get_accounts()[0]
+    results = {}
+    for name, provider in (
+        ("single", flaky_node(local_node(chain), seed=0)),
+        ("router", RpcRouter({f"node-{i}": flaky_node(local_node(chain), seed=i) for i in range(nodes)},
+                             hedge_delay=0.01)),
+    ):
+        web3 = AsyncWeb3(provider)
+        latencies, errors = [], 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            try:
+                await web3.eth.get_balance(account)
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+        results[name] = {"requests": requests, "errors": errors, **percentiles(latencies)}
+
+    print(f"router: {requests} reads, {nodes} nodes")
+    for name, result in results.items():
+        print(f"  {name:18s} p50 {result['p50'] * 1e3:8.2f} ms, p99 {result['p99'] * 1e3:8.2f} ms, "
+              f"{result['errors']} errors")
+    return results
+
+
+class OfflineHarness:
+    """
+    Runs the microservice against an in-process eth-tester chain and a fake CoinGecko.
+
+    The service modules read their configuration at import time, so they are
+    imported only once the contract is deployed and the environment points at it.
+    """
+
+    def __init__(self, bytecode, workdir):
+        self.bytecode = bytecode
+        self.workdir = workdir
+        self.quote = {"usd": PRICE}
+        self.rng = random.Random(0)
+
+    async def setup(self):
+        from web3 import AsyncWeb3
+
+        if "config" in sys.modules:
+            raise RuntimeError("The offline harness must set up its environment before config is imported; "
+                               "run it with run_isolated().")
+
+        self.provider = local_node()
+        web3 = AsyncWeb3(self.provider)
+        private_key = self.provider.ethereum_tester.backend.account_keys[0].to_hex()
+        with open("abi.json") as file:
+            abi = json.load(file)
+        tx_hash = await web3.eth.contract(abi=abi, bytecode=self.bytecode).constructor().transact(
+            {"from": (await web3.eth.accounts)[0]}
+        )
+        receipt = await web3.eth.wait_for_transaction_receipt(tx_hash)
+        self.deploy_block = receipt["blockNumber"]
+
+        os.environ.update({
+            "CONTRACT_ADDRESS": receipt["contractAddress"],
+            "CHAIN_ID": str(await web3.eth.chain_id),
+            "WEB3_SOCKET_URL": "ws://127.0.0.1:8546",
+            "LOG_FILE": os.path.join(self.workdir, "microservice.log"),
+            "POOL_ARCHIVE_PATH": os.path.join(self.workdir, "pool_archive.db"),
+            "PRICE_TTL": "0",
+        })
+        import vault
+        vault.get_private_key = lambda: private_key
+
+        import contract_service
+        from clients import clients
+        import event_listener
+        import price_monitor
+        from price_service import PriceService
+        from rpc_router import RpcRouter
+
+        # Route through the RpcRouter the service uses, with the local node as its only endpoint.
+        clients.web3.provider = RpcRouter({"local": self.provider})
+        event_listener.BLOCK_TRACK_FILE = os.path.join(self.workdir, "last_processed_block.json")
+        price_monitor.price_service = PriceService(ttl=0, transport=fake_coingecko(self.quote))
+        self.contract_service = contract_service
+        self.clients = clients
+        self.event_listener = event_listener
+        self.price_monitor = price_monitor
+        self.checkpoint = event_listener.Checkpoint()
+        self.checkpoint.advance(self.deploy_block)
+
+    async def wait_for_receipts(self):
+        tracker = self.clients.receipt_tracker
+        while len(tracker):
+            await tracker.poll()
+
+    async def create_pools(self, count, chunk_size=1000):
+        """Creates count pools with thresholds around PRICE and waits for them to be mined."""
+        created = 0
+        for start in range(0, count, chunk_size):
+            pools = []
+            for _ in range(min(chunk_size, count - start)):
+                target_price = int(PRICE * self.rng.uniform(1.01, 1.5)) * WEI
+                stop_loss = int(PRICE * self.rng.uniform(0.5, 0.99)) * WEI
+                pools.append((target_price, stop_loss, self.rng.randint(86400, 30 * 86400)))
+            results = await self.contract_service.create_pools(pools)
+            created += sum(1 for result in results if result["status"] == "submitted")
+            await self.wait_for_receipts()
+        return created
+
+    async def count_logs(self, from_block, to_block):
+        return len(await self.clients.web3.eth.get_logs({
+            "address": self.clients.contract.address,
+            "fromBlock": from_block,
+            "toBlock": to_block,
+        }))
+
+    async def run_size(self, size, repeats):
+        from pool_cache import pool_cache
+        results = {}
+
+        missing = size - len(pool_cache) if pool_cache.is_seeded else size
+        started = time.perf_counter()
+        created = await self.create_pools(missing)
+        results["create_pools"] = rate(created, time.perf_counter() - started)
+
+        # Ingest everything since the last size the way the event listener backfills on startup.
+        from_block = self.checkpoint.block_number + 1
+        started = time.perf_counter()
+        await self.event_listener.backfill(self.checkpoint)
+        elapsed = time.perf_counter() - started
+        results["ingest_events"] = rate(await self.count_logs(from_block, self.checkpoint.block_number), elapsed)
+
+        started = time.perf_counter()
+        await pool_cache.seed()
+        results["seed_pool_cache"] = rate(len(pool_cache), time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            active_pools = await self.price_monitor.get_active_pools()
+        results["get_active_pools"] = per_call(len(active_pools), time.perf_counter() - started, repeats)
+
+        self.quote["usd"] = PRICE
+        started = time.perf_counter()
+        for _ in range(repeats):
+            await self.price_monitor.check_pool_conditions()
+        results["check_pool_conditions"] = per_call(len(pool_cache), time.perf_counter() - started, repeats)
+
+        # Price the asset so that a tenth of the active pools hit their target.
+        target_prices = sorted(pool.target_price for _, pool in await pool_cache.active_pools())
+        self.quote["usd"] = target_prices[len(target_prices) // 10] / WEI
+        started = time.perf_counter()
+        outcome = await self.price_monitor.check_pool_conditions()
+        await self.wait_for_receipts()
+        elapsed = time.perf_counter() - started
+        submitted = sum(1 for result in outcome.get("results", []) if result["status"] == "submitted")
+        results["finalize_pools"] = {**rate(submitted, elapsed), "triggered": len(outcome.get("results", []))}
+
+        # Let the mirror see the finalizations before the next size tops it up.
+        await self.event_listener.backfill(self.checkpoint)
+        return results
+
+
+def rate(count, seconds):
+    return {"count": count, "seconds": seconds, "per_second": count / seconds if seconds else None}
+
+
+def per_call(pools, seconds, calls):
+    return {"pools": pools, "calls": calls, "seconds_per_call": seconds / calls}
+
+
+async def bench_offline(sizes, repeats, bytecode_path=None):
+    """Measures the service hot paths at each active pool count, growing one chain between sizes."""
+    with tempfile.TemporaryDirectory() as workdir:
+        harness = OfflineHarness(load_bytecode(bytecode_path), workdir)
+        await harness.setup()
+        results = {}
+        for size in sorted(sizes):
+            results[str(size)] = await harness.run_size(size, repeats)
+            print(f"offline: {size} pools: {json.dumps(results[str(size)])}")
+        return results
+
+
+def run_isolated(call):
+    """
+    Runs a benchmark coroutine call, e.g. "bench_offline([100], 10)", in a fresh interpreter.
+
+    The service modules read their configuration once, at import, so a harness that
+    points them at a local chain cannot share a process with a benchmark that
+    already imported them.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, "result.json")
+        code = (f"import asyncio, benchmark, json\n"
+                f"with open({output!r}, 'w') as file: json.dump(asyncio.run(benchmark.{call}), file)")
+        subprocess.run([sys.executable, "-c", code], check=True)
+        with open(output) as file:
+            return json.load(file)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microservice hot-path benchmarks.")
+    parser.add_argument("--pools", type=int, default=100_000, help="Active pools for the trigger index benchmark")
+    parser.add_argument("--ticks", type=int, default=1_000)
+    parser.add_argument("--replay-pools", type=int, default=1_000_000, help="Pools for the replay benchmark, 0 to skip")
+    parser.add_argument("--replay-minutes", type=int, default=525_600, help="Minute candles for the replay benchmark")
+    parser.add_argument("--offline", action="store_true",
+                        help="Also run the service against a local eth-tester chain and a fake CoinGecko "
+                             "(needs requirements-bench.txt; py-evm mines roughly 10 transactions per second)")
+    parser.add_argument("--sizes", default="100,1000",
+                        help="Comma separated active pool counts for --offline. Every pool is created by its own "
+                             "transaction on one growing chain, so the run costs about one transaction per pool of "
+                             "the largest size (1000 pools take a few minutes, 100000 take hours)")
+    parser.add_argument("--repeats", type=int, default=10, help="Calls per read-only measurement for --offline")
+    parser.add_argument("--router-requests", type=int, default=1000, help="Reads per provider for --offline")
+    parser.add_argument("--bytecode", help="Contract bytecode as a hex file or Hardhat artifact for --offline, "
+                                           "defaults to the artifact written by `npx hardhat compile`")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET,
+                        help="Seconds a cold import of each entry module may take")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+    if args.offline and bytecode_path(args.bytecode) is None:
+        parser.error(f"--offline needs --bytecode or a Hardhat artifact at {ARTIFACT_PATH} (run `npx hardhat compile`)")
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "timestamp": int(time.time()),
+        "trigger_index": bench_trigger_index(args.pools, args.ticks),
+        "import_time": bench_import_time(budget=args.import_budget),
+    }
+    if args.replay_pools:
+        report["replay"] = bench_replay(args.replay_pools, args.replay_minutes)
+    if args.offline:
+        sizes = [int(size) for size in args.sizes.split(",")]
+        report["offline"] = run_isolated(f"bench_offline({sizes!r}, {args.repeats!r}, {args.bytecode!r})")
+        report["router"] = asyncio.run(bench_router(args.router_requests))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
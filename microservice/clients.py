@@ -0,0 +1,176 @@
+from web3 import AsyncWeb3, WebSocketProvider
+from config import (CONTRACT_ADDRESS, RPC_BATCH_SIZE, CHAIN_ID, CLIENT_HEALTH_CHECK_INTERVAL,
+                    CLIENT_HEALTH_CHECK_TIMEOUT, SIGNER_LOCK_FILE, load_contract_abi)
+from rpc_router import RpcRouter, configured_endpoints
+from tx_submitter import TransactionSubmitter
+from fee_oracle import FeeOracle
+from receipt_tracker import ReceiptTracker, REVERTED
+from finalizations import FinalizationRegistry
+from metrics import RpcMetricsMiddleware, PENDING_TRANSACTIONS, IN_FLIGHT_FINALIZATIONS
+import asyncio
+import logging
+import time
+import vault
+
+logger = logging.getLogger(__name__)
+
+
+class Clients:
+    """
+    Shared factory for the web3 provider, the contract, the signing key and the services built on them.
+
+    Every client is created on first use and then reused, so importing the service
+    does no network I/O: the nodes are dialled on the first connect() and the key is
+    read from Vault when the first transaction is signed. Requests are routed over
+    every configured node by an RpcRouter; log subscriptions use a separate
+    websocket to the first websocket node. Once connected, the nodes are probed
+    every CLIENT_HEALTH_CHECK_INTERVAL seconds and reconnected if none answers.
+    """
+
+    def __init__(self, provider_urls=None, contract_address=CONTRACT_ADDRESS, chain_id=CHAIN_ID):
+        self.provider_urls = configured_endpoints() if provider_urls is None else provider_urls
+        self.contract_address = contract_address
+        self.chain_id = chain_id
+        self._web3 = None
+        self._stream_web3 = None
+        self._contract = None
+        self._private_key = None
+        self._fee_oracle = None
+        self._submitter = None
+        self._receipt_tracker = None
+        self.finalizations = FinalizationRegistry()
+        IN_FLIGHT_FINALIZATIONS.set_function(self.finalizations.__len__)
+        self._connect_lock = asyncio.Lock()
+        self._healthy_at = None
+        self._health_task = None
+
+    @property
+    def abi(self):
+        return load_contract_abi()
+
+    @property
+    def web3(self):
+        if self._web3 is None:
+            self._web3 = AsyncWeb3(RpcRouter.from_urls(self.provider_urls))
+            self._web3.middleware_onion.add(RpcMetricsMiddleware, 'rpc_metrics')
+        return self._web3
+
+    @property
+    def stream_url(self):
+        """The websocket node that log subscriptions are made on, or None if no node is a websocket."""
+        return next((url for url in self.provider_urls if url.startswith(("ws://", "wss://"))), None)
+
+    @property
+    def stream_web3(self):
+        if self._stream_web3 is None:
+            if self.stream_url is None:
+                raise ValueError("Log subscriptions need a ws:// or wss:// node.")
+            self._stream_web3 = AsyncWeb3(WebSocketProvider(self.stream_url))
+        return self._stream_web3
+
+    async def connect_stream(self):
+        """Opens the websocket used for log subscriptions, unless it is already open."""
+        if not await self.stream_web3.provider.is_connected():
+            await self.stream_web3.provider.connect()
+
+    @property
+    def contract(self):
+        if self._contract is None:
+            self._contract = self.web3.eth.contract(address=self.contract_address, abi=self.abi)
+        return self._contract
+
+    @property
+    def private_key(self):
+        if self._private_key is None:
+            self._private_key = vault.get_private_key()
+        return self._private_key
+
+    @property
+    def address(self):
+        """Address of the signing account."""
+        return self.submitter.address
+
+    @property
+    def fee_oracle(self):
+        if self._fee_oracle is None:
+            self._fee_oracle = FeeOracle(self.web3, RPC_BATCH_SIZE)
+        return self._fee_oracle
+
+    @property
+    def submitter(self):
+        if self._submitter is None:
+            self._submitter = TransactionSubmitter(self.web3, self.contract, self.private_key, self.chain_id,
+                                                   self.fee_oracle, RPC_BATCH_SIZE, SIGNER_LOCK_FILE)
+        return self._submitter
+
+    @property
+    def receipt_tracker(self):
+        if self._receipt_tracker is None:
+            self._receipt_tracker = ReceiptTracker(self.web3, RPC_BATCH_SIZE)
+            self._receipt_tracker.add_callback(self._on_transaction_finished)
+            PENDING_TRANSACTIONS.set_function(self._receipt_tracker.__len__)
+        return self._receipt_tracker
+
+    def _on_transaction_finished(self, transaction):
+        self.finalizations.finish(transaction)
+        if transaction["status"] == REVERTED and transaction.get("gas_used") == transaction.get("gas"):
+            # Ran out of gas: the memoized estimate for this function is too low.
+            self.fee_oracle.invalidate_gas(transaction.get("kind"))
+
+    async def _healthy(self):
+        try:
+            await asyncio.wait_for(self.web3.eth.block_number, CLIENT_HEALTH_CHECK_TIMEOUT)
+            return True
+        except Exception as e:
+            logger.warning(f"Web3 health check failed: {str(e)}")
+            return False
+
+    async def connect(self):
+        """
+        Connects to the RPC nodes, or reconnects if none of them answers.
+
+        A connection that passed a health check within the last CLIENT_HEALTH_CHECK_INTERVAL
+        seconds is reused without a round trip.
+        """
+        async with self._connect_lock:
+            if self._healthy_at is not None:
+                if time.monotonic() - self._healthy_at < CLIENT_HEALTH_CHECK_INTERVAL:
+                    return
+                if await self._healthy():
+                    self._healthy_at = time.monotonic()
+                    return
+                logger.warning(f"No answer from any of {len(self.provider_urls)} RPC nodes, reconnecting.")
+                self._healthy_at = None
+                try:
+                    await self.web3.provider.disconnect()
+                except Exception as e:
+                    logger.warning(f"Error closing the stale web3 connection: {str(e)}")
+
+            await self.web3.provider.connect()
+            if not await self.web3.is_connected():
+                raise ConnectionError("Failed to connect to the Ethereum network.")
+            self._healthy_at = time.monotonic()
+            if self._health_task is None:
+                self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(CLIENT_HEALTH_CHECK_INTERVAL)
+            try:
+                await self.connect()
+            except Exception as e:
+                logger.error(f"Error reconnecting to the Ethereum network: {str(e)}")
+
+    async def close(self):
+        """Stops the health checks and closes the node connections, if any were opened."""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._healthy_at is not None:
+            self._healthy_at = None
+            await self.web3.provider.disconnect()
+        if self._stream_web3 is not None and await self._stream_web3.provider.is_connected():
+            await self._stream_web3.provider.disconnect()
+
+
+clients = Clients()
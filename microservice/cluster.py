@@ -0,0 +1,272 @@
+from config import (BROKER_ADDRESS, BROKER_AUTHKEY, CLUSTER_WORKERS, RING_REPLICAS, WORKER_HEARTBEAT_INTERVAL,
+                    WORKER_TIMEOUT, WORKER_REFRESH_INTERVAL, POOL_RECONCILE_INTERVAL, CHECK_MAX_INTERVAL,
+                    LEADER_RETRY_INTERVAL, RPC_BATCH_SIZE, PRICE_TTL, PRICE_MAX_AGE)
+from hash_ring import HashRing
+from leader_lease import LeaderLease
+from multiprocessing.managers import BaseManager, DictProxy
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import socket
+import time
+
+logger = logging.getLogger(__name__)
+
+_resolutions = queue.Queue()
+_members = {}
+_state = {}
+
+
+def _get_resolutions():
+    return _resolutions
+
+
+def _get_members():
+    return _members
+
+
+def _get_state():
+    return _state
+
+
+class Broker(BaseManager):
+    """
+    Local stand-in for a message broker, served over TCP by a manager process.
+
+    It holds the queue of resolution requests consumed by the signer, the worker
+    membership table and shared state such as the latest prices. Processes on
+    other hosts join by connecting to the same address and authkey.
+    """
+
+
+Broker.register("resolutions", callable=_get_resolutions)
+Broker.register("members", callable=_get_members, proxytype=DictProxy)
+Broker.register("state", callable=_get_state, proxytype=DictProxy)
+
+
+def parse_address(address):
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+def connect_broker(address=BROKER_ADDRESS):
+    broker = Broker(parse_address(address), authkey=BROKER_AUTHKEY.encode())
+    broker.connect()
+    return broker
+
+
+def live_members(members):
+    """Returns {worker id: (requested check delay, assets)} for the workers with a recent heartbeat."""
+    now = time.time()
+    return {worker_id: (delay, assets) for worker_id, (heartbeat, delay, assets) in members.items()
+            if now - heartbeat <= WORKER_TIMEOUT}
+
+
+def expired_prices(prices, fetched_at, now):
+    """Returns the assets whose published price was fetched more than PRICE_MAX_AGE seconds before now."""
+    return {asset for asset, price in prices.items() if price is not None and now - fetched_at[asset] > PRICE_MAX_AGE}
+
+
+def fresh_resolutions(batch, now):
+    """Returns {pool id: price} for the queued (pool id, price, fetched at) resolutions whose price is not expired."""
+    return {pool_id: price for pool_id, price, fetched_at in batch if now - fetched_at <= PRICE_MAX_AGE}
+
+
+def drain(resolutions, limit, timeout=1):
+    """Waits up to timeout for one resolution request, then takes whatever else is queued, up to limit."""
+    try:
+        batch = [resolutions.get(timeout=timeout)]
+    except queue.Empty:
+        return []
+    while len(batch) < limit:
+        try:
+            batch.append(resolutions.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+async def publish_prices(members, state):
+    """
+    Fetches the prices of every asset the workers monitor in one request, as often as
+    the most demanding worker asks for, and shares them through the broker with the
+    time each was fetched.
+    """
+    from price_service import price_service
+
+    while True:
+        live = live_members(members).values()
+        max_age = min((delay for delay, _ in live if delay is not None), default=CHECK_MAX_INTERVAL)
+        assets = set().union(*(assets for _, assets in live))
+        if assets:
+            prices = await price_service.get_prices(assets, max_age)
+            state["prices"] = (prices, {asset: price_service.fetched_at(asset) for asset in prices})
+        await asyncio.sleep(max_age)
+
+
+async def run_signer(address=BROKER_ADDRESS):
+    """
+    Runs the only process that signs transactions.
+
+    It holds the leader lease, so single-process schedulers on this host stand by,
+    fetches the prices for the workers and submits the resolutions they queue;
+    finalize_pools skips pools whose resolution is still in flight. Resolutions
+    whose price is older than PRICE_MAX_AGE, e.g. queued before a signer restart,
+    are dropped; their pools come back with the workers' next reconcile.
+    """
+    from contract_service import connect, finalize_pools
+    from clients import clients
+
+    lease = LeaderLease()
+    while not lease.acquire():
+        logger.info("Signer: Waiting for the leader lease held by another process.")
+        await asyncio.sleep(LEADER_RETRY_INTERVAL)
+
+    broker = connect_broker(address)
+    resolutions, members, state = broker.resolutions(), broker.members(), broker.state()
+    await connect()
+    clients.receipt_tracker.start()
+    price_task = asyncio.create_task(publish_prices(members, state))
+    logger.info(f"Signer: Consuming resolution requests from {address}")
+
+    try:
+        while True:
+            batch = await asyncio.to_thread(drain, resolutions, RPC_BATCH_SIZE)
+            fresh = fresh_resolutions(batch, time.time())
+            if len(fresh) < len(batch):
+                logger.warning(f"Signer: Dropped {len(batch) - len(fresh)} resolutions priced more than "
+                               f"{PRICE_MAX_AGE}s ago.")
+            if fresh:
+                await finalize_pools(list(fresh.items()))
+    finally:
+        price_task.cancel()
+        clients.receipt_tracker.stop()
+        lease.release()
+
+
+async def run_worker(worker_id, address=BROKER_ADDRESS):
+    """
+    Monitors the shard of pools that the hash ring of live workers assigns to worker_id.
+
+    Triggered pools are queued for the signer and dropped from the local shard.
+    Prices older than PRICE_MAX_AGE, left over when the signer stops publishing,
+    are not used: their assets' pools wait for a new price. Workers run no event listener and hear nothing back from the signer, so a pool
+    whose resolution failed, reverted or was dropped is only monitored again after
+    the next reconcile, up to POOL_RECONCILE_INTERVAL seconds later; lower it if
+    that delay matters more than the reconcile's load on the node.
+    """
+    from contract_service import connect
+    from pool_cache import pool_cache
+    from scheduler import earliest_check_delay
+
+    broker = connect_broker(address)
+    resolutions, members, state = broker.resolutions(), broker.members(), broker.state()
+    await connect()
+    members[worker_id] = (time.time(), None, set())
+    ring = None
+    delay = None
+    stale = set()
+    refreshed_at = reconciled_at = time.monotonic()
+
+    try:
+        while True:
+            live = live_members(members)
+            if ring is None or ring.nodes != set(live):
+                ring = HashRing(live, RING_REPLICAS)
+                pool_cache.set_shard(lambda pool_id, ring=ring: ring.owner(pool_id) == worker_id)
+                logger.info(f"Worker {worker_id}: Shard rebalanced across {len(ring)} workers")
+
+            if not pool_cache.is_seeded or time.monotonic() - refreshed_at >= WORKER_REFRESH_INTERVAL:
+                await pool_cache.refresh()
+                refreshed_at = time.monotonic()
+            if time.monotonic() - reconciled_at >= POOL_RECONCILE_INTERVAL:
+                await pool_cache.reconcile()
+                reconciled_at = time.monotonic()
+
+            quote = state.get("prices")
+            if quote is not None:
+                (prices, fetched_at), now = quote, int(time.time())
+                expired = expired_prices(prices, fetched_at, now)
+                if expired != stale:
+                    if expired:
+                        logger.warning(f"Worker {worker_id}: Prices of {', '.join(sorted(expired))} are older than "
+                                       f"{PRICE_MAX_AGE}s; their pools are not checked until new ones are published.")
+                    stale = expired
+                prices = {asset: None if asset in stale else price for asset, price in prices.items()}
+                for pool_id, _, _, price in await pool_cache.triggered_pools(prices, now):
+                    resolutions.put((pool_id, price, fetched_at[pool_cache.asset_of(pool_id)]))
+                    pool_cache.discard(pool_id)
+                delay = earliest_check_delay(prices, now, await pool_cache.nearest_triggers(prices, now),
+                                             lambda asset: max(0, PRICE_TTL - (time.time() - fetched_at[asset])))
+
+            members[worker_id] = (time.time(), delay, await pool_cache.assets())
+            await asyncio.sleep(min(delay or WORKER_HEARTBEAT_INTERVAL, WORKER_HEARTBEAT_INTERVAL))
+    finally:
+        members.pop(worker_id, None)
+
+
+def _process_main(name, coroutine_function, *args):
+    # Every process rotates its own log file; RotatingFileHandler cannot share one.
+    from log_service import setup_logging, process_log_file
+    setup_logging(process_log_file(name))
+    try:
+        asyncio.run(coroutine_function(*args))
+    except KeyboardInterrupt:
+        pass
+
+
+def signer_main(address=BROKER_ADDRESS):
+    _process_main("signer", run_signer, address)
+
+
+def worker_main(worker_id, address=BROKER_ADDRESS):
+    _process_main(worker_id, run_worker, worker_id, address)
+
+
+def run_local(workers=CLUSTER_WORKERS, address=BROKER_ADDRESS):
+    """Runs the broker, the signer and the monitor workers as separate processes on this host."""
+    context = multiprocessing.get_context("spawn")
+    broker = Broker(parse_address(address), authkey=BROKER_AUTHKEY.encode(), ctx=context)
+    broker.start()
+    processes = [context.Process(target=signer_main, args=(address,), name="signer")]
+    processes += [
+        context.Process(target=worker_main, args=(f"{socket.gethostname()}-worker-{i}", address), name=f"worker-{i}")
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        broker.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded pool monitoring with a single transaction signer.")
+    parser.add_argument("--broker", default=BROKER_ADDRESS, help="host:port of the broker")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Run the broker, the signer and the workers on this host")
+    run.add_argument("--workers", type=int, default=CLUSTER_WORKERS)
+    commands.add_parser("broker", help="Serve only the broker, for workers and a signer on other hosts")
+    commands.add_parser("signer", help="Join a broker as the signer")
+    worker = commands.add_parser("worker", help="Join a broker as a monitor worker")
+    worker.add_argument("--id", default=f"{socket.gethostname()}-{os.getpid()}")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_local(args.workers, args.broker)
+    elif args.command == "broker":
+        Broker(parse_address(args.broker), authkey=BROKER_AUTHKEY.encode()).get_server().serve_forever()
+    elif args.command == "signer":
+        signer_main(args.broker)
+    else:
+        worker_main(args.id, args.broker)
@@ -1,4 +1,5 @@
 from dotenv import load_dotenv
+import functools
 import os
 import json
 
@@ -12,6 +13,75 @@ CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS")
 PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 WEB3_SOCK_PROVIDER = os.getenv("WEB3_SOCKET_URL")
 DISCORD_BOT = os.getenv("DISCORD_BOT")
-with open("abi.json", "r") as file:
-    CONTRACT_ABI = json.load(file)
+PRICE_TTL = float(os.getenv("PRICE_TTL", 30))
+EVENT_LISTENER_MODE = os.getenv("EVENT_LISTENER_MODE", "subscribe")
+BACKFILL_CHUNK_SIZE = int(os.getenv("BACKFILL_CHUNK_SIZE", 2000))
+BACKFILL_MAX_CHUNK_SIZE = int(os.getenv("BACKFILL_MAX_CHUNK_SIZE", 100000))
+CHECKPOINT_INTERVAL = float(os.getenv("CHECKPOINT_INTERVAL", 5))
+BLOCK_TIME = float(os.getenv("BLOCK_TIME", 2))
+FEE_HISTORY_BLOCKS = int(os.getenv("FEE_HISTORY_BLOCKS", 10))
+PRIORITY_FEE_PERCENTILE = float(os.getenv("PRIORITY_FEE_PERCENTILE", 50))
+GAS_ESTIMATE_MARGIN = float(os.getenv("GAS_ESTIMATE_MARGIN", 1.2))
+GAS_ESTIMATE_TTL = float(os.getenv("GAS_ESTIMATE_TTL", 300))
+BALANCE_REFRESH_INTERVAL = float(os.getenv("BALANCE_REFRESH_INTERVAL", 60))
+TX_DROP_TIMEOUT = float(os.getenv("TX_DROP_TIMEOUT", 600))
+TX_HISTORY_SIZE = int(os.getenv("TX_HISTORY_SIZE", 10000))
+MAX_BULK_POOLS = int(os.getenv("MAX_BULK_POOLS", 1000))
+POOL_ARCHIVE_PATH = os.getenv("POOL_ARCHIVE_PATH", "pool_archive.db")
+BACKFILL_START_BLOCK = os.getenv("BACKFILL_START_BLOCK")
+CHAIN_ID = int(os.getenv("CHAIN_ID", 84532))
+RPC_BATCH_SIZE = int(os.getenv("RPC_BATCH_SIZE", 500))
+POOL_RECONCILE_INTERVAL = int(os.getenv("POOL_RECONCILE_INTERVAL", 600))
+LOG_FILE = os.getenv("LOG_FILE", "microservice.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 1000))
+TRACE_SLOW_TICK = float(os.getenv("TRACE_SLOW_TICK", 5))
+CHECK_MIN_INTERVAL = float(os.getenv("CHECK_MIN_INTERVAL", 0.5))
+CHECK_MAX_INTERVAL = float(os.getenv("CHECK_MAX_INTERVAL", 60))
+CHECK_PRICE_RANGE = float(os.getenv("CHECK_PRICE_RANGE", 0.02))
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "scheduler.lock")
+LEADER_RETRY_INTERVAL = float(os.getenv("LEADER_RETRY_INTERVAL", 10))
+SIGNER_LOCK_FILE = os.getenv("SIGNER_LOCK_FILE", "signer.lock")
+BROKER_ADDRESS = os.getenv("BROKER_ADDRESS", "127.0.0.1:50505")
+BROKER_AUTHKEY = os.getenv("BROKER_AUTHKEY", "prediction-market")
+CLUSTER_WORKERS = int(os.getenv("CLUSTER_WORKERS", os.cpu_count() or 1))
+RING_REPLICAS = int(os.getenv("RING_REPLICAS", 64))
+WORKER_HEARTBEAT_INTERVAL = float(os.getenv("WORKER_HEARTBEAT_INTERVAL", 2))
+WORKER_TIMEOUT = float(os.getenv("WORKER_TIMEOUT", 10))
+WORKER_REFRESH_INTERVAL = float(os.getenv("WORKER_REFRESH_INTERVAL", 5))
+CLIENT_HEALTH_CHECK_INTERVAL = float(os.getenv("CLIENT_HEALTH_CHECK_INTERVAL", 30))
+CLIENT_HEALTH_CHECK_TIMEOUT = float(os.getenv("CLIENT_HEALTH_CHECK_TIMEOUT", 10))
+CONTRACT_ABI_FILE = os.getenv("CONTRACT_ABI_FILE", "abi.json")
+NOTIFY_WEBHOOKS = os.getenv("NOTIFY_WEBHOOKS", "")
+NOTIFY_COALESCE_WINDOW = float(os.getenv("NOTIFY_COALESCE_WINDOW", 2))
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", 1000))
+NOTIFY_RESOLVE_TTL = float(os.getenv("NOTIFY_RESOLVE_TTL", 300))
+PRICE_SCALE = int(os.getenv("PRICE_SCALE", 10 ** 10))
+TICK_INTERVAL = float(os.getenv("TICK_INTERVAL", 10))
+TICK_HISTORY_SIZE = int(os.getenv("TICK_HISTORY_SIZE", 100000))
+TICK_HISTORY_DIR = os.getenv("TICK_HISTORY_DIR")
+WEB3_PROVIDERS = os.getenv("WEB3_PROVIDERS", "")
+RPC_REQUEST_TIMEOUT = float(os.getenv("RPC_REQUEST_TIMEOUT", 30))
+RPC_HEDGE_DELAY = float(os.getenv("RPC_HEDGE_DELAY", 0.25))
+RPC_BROADCAST_COUNT = int(os.getenv("RPC_BROADCAST_COUNT", 3))
+RPC_BREAKER_THRESHOLD = int(os.getenv("RPC_BREAKER_THRESHOLD", 3))
+RPC_BREAKER_COOLDOWN = float(os.getenv("RPC_BREAKER_COOLDOWN", 30))
+PRICE_MAX_AGE = float(os.getenv("PRICE_MAX_AGE", 120))
+EVENT_LISTENER_RETRY_MIN = float(os.getenv("EVENT_LISTENER_RETRY_MIN", 1))
+EVENT_LISTENER_RETRY_MAX = float(os.getenv("EVENT_LISTENER_RETRY_MAX", 60))
+
+
+@functools.cache
+def load_contract_abi():
+    """Parses the contract ABI on first use; every caller shares the same copy."""
+    with open(CONTRACT_ABI_FILE, "r") as file:
+        return json.load(file)
+
+
+def __getattr__(name):
+    # CONTRACT_ABI used to be parsed at import time.
+    if name == "CONTRACT_ABI":
+        return load_contract_abi()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
@@ -1,145 +1,256 @@
-from web3 import Web3
-from config import CONTRACT_ADDRESS, PRIVATE_KEY, WEB3_SOCK_PROVIDER
+from web3 import AsyncWeb3
+from config import RPC_BATCH_SIZE, ASSET_ID
+from typing import NamedTuple
+import asyncio
+import functools
 import logging
-import json
 from dotenv import load_dotenv
-from vault import get_private_key
+from clients import clients
+from rpc import batch_request
+from metrics import FINALIZATIONS
+from log_service import setup_logging
 
-logging.basicConfig(
-    filename="microservice.log",
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+setup_logging()
 
 logger = logging.getLogger(__name__)
 load_dotenv()
-web3_provider = Web3(Web3.LegacyWebSocketProvider(WEB3_SOCK_PROVIDER))
-private_key = get_private_key()
 
-if not web3_provider.is_connected():
-    raise ConnectionError("Failed to connect to the Ethereum network.")
 
-with open("abi.json") as f:
-    contract_abi = json.load(f)
+async def connect():
+    """Opens the persistent websocket connection shared by every caller, or reopens it if it dropped."""
+    await clients.connect()
 
-contract = web3_provider.eth.contract(address=CONTRACT_ADDRESS, abi=contract_abi)
 
+@functools.cache
+def pool_output_types():
+    return [output['type'] for output in next(item for item in clients.abi if item.get('name') == 'pools')['outputs']]
 
-def create_pool(target_price: int, stop_loss: int, duration: int) -> dict:
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+
+
+class PoolRecord(NamedTuple):
+    """Compact decoded form of the contract's Pool struct."""
+    pool_id: int
+    creator: str
+    target_price: int
+    stop_loss: int
+    end_time: int
+    is_finalized: bool
+    final_price: int
+    outcome: str
+
+    def as_dict(self):
+        return {
+            "creator": self.creator,
+            "target_price": self.target_price,
+            "stop_loss": self.stop_loss,
+            "end_time": self.end_time,
+            "is_finalized": self.is_finalized,
+            "final_price": self.final_price,
+            "outcome": self.outcome
+        }
+
+
+def validate_pool(target_price: int, stop_loss: int, duration: int):
+    """Returns an error message if the pool parameters are invalid, otherwise None."""
+    if target_price <= 0:
+        return "Target price must be positive."
+    if stop_loss < 0:
+        return "Stop loss must not be negative."
+    if stop_loss >= target_price:
+        return "Stop loss must be below the target price."
+    if duration <= 0:
+        return "Duration must be positive."
+    return None
+
+
+async def create_pools(pools, assets=None) -> list:
     """
-    Creates a pool on the blockchain with the given parameters.
+    Submits one pool creation transaction per pool as a single pipelined batch.
 
-    :param target_price: Target price in wei
-    :param stop_loss: Stop loss in wei
-    :param duration: Duration in seconds
-    :return: Dictionary with transaction details
+    Each transaction is tagged with its pool's asset by hash once signed and before
+    it is broadcast, so the PoolCreated event can never arrive ahead of the tag.
+
+    :param pools: List of (target_price, stop_loss, duration) tuples, prices in wei and duration in seconds
+    :param assets: List of the asset of each pool; ASSET_ID for every pool if None
+    :return: List of per-pool dictionaries with the transaction handle or the error
     """
+    from pool_cache import pool_cache
+
+    assets = assets or [ASSET_ID] * len(pools)
     try:
-        account = web3_provider.eth.account.from_key(private_key)
-
-        tx = contract.functions.createPool(
-            target_price,
-            stop_loss,
-            duration
-        ).build_transaction({
-            "chainId": 84532,
-            "gasPrice": web3_provider.to_wei("20", "gwei"),
-            "nonce": web3_provider.eth.get_transaction_count(account.address),
-        })
+        submitted = await clients.submitter.submit_many(
+            [("createPool", [target_price, stop_loss, duration]) for target_price, stop_loss, duration in pools],
+            on_signed=lambda i, tx_hash: pool_cache.tag_transaction(tx_hash, assets[i])
+        )
+    except Exception as e:
+        logger.error(f"Error creating pools: {str(e)}")
+        return [{"status": "error", "message": str(e)} for _ in pools]
+
+    results = []
+    for (target_price, stop_loss, _), result in zip(pools, submitted):
+        if result["status"] != "submitted":
+            results.append({"status": "error", "message": result["message"]})
+            continue
 
-        gas_estimate = web3_provider.eth.estimate_gas({
-            'from': account.address,
-            'to': contract.address,
-            'data': tx['data'],
+        tx_hash = result["transaction_hash"]
+        clients.receipt_tracker.track(tx_hash, kind="createPool", nonce=result["nonce"], gas=result["gas"])
+        results.append({
+            "status": "submitted",
+            "message": f"Pool creation submitted with transaction hash: {tx_hash}",
+            "transaction_hash": tx_hash,
+            "target_price": target_price,
+            "stop_loss": stop_loss,
         })
+    return results
 
-        tx['gas'] = gas_estimate
 
-        signed_tx = web3_provider.eth.account.sign_transaction(tx, private_key=private_key)
-        tx_hash = web3_provider.eth.send_raw_transaction(signed_tx.raw_transaction)
-        tx_receipt = web3_provider.eth.wait_for_transaction_receipt(tx_hash)
+async def create_pool(target_price: int, stop_loss: int, duration: int, asset: str = ASSET_ID) -> dict:
+    """
+    Submits a pool creation transaction with the given parameters.
 
-        if tx_receipt.status == 1:
-            return {
-                "status": "success",
-                "message": f"Pool created successfully with transaction hash: {tx_hash.hex()}",
-                "target_price": target_price,
-                "stop_loss": stop_loss,
-            }
-        else:
-            return {"status": "failed", "message": "Transaction failed."}
+    :param target_price: Target price in wei
+    :param stop_loss: Stop loss in wei
+    :param duration: Duration in seconds
+    :param asset: Asset whose price the pool tracks
+    :return: Dictionary with the transaction handle; the outcome is published by the receipt tracker
+    """
+    error = validate_pool(target_price, stop_loss, duration)
+    if error:
+        return {"status": "failed", "message": error}
+    return (await create_pools([(target_price, stop_loss, duration)], [asset]))[0]
 
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
 
+async def finalize_pools(resolutions):
+    """
+    Submits one resolvePool transaction per pool, back to back.
 
-def finalize_pool(pool_id, current_price):
-    """Finalizes a pool on the smart contract."""
-    try:
-        account = web3_provider.eth.account.from_key(private_key)
-        balance = web3_provider.eth.get_balance(account.address)
-        max_fee_per_gas, max_priority_fee_per_gas = get_dynamic_gas_price()
-
-        txn = contract.functions.resolvePool(pool_id, current_price).build_transaction({
-            'chainId': 84532,
-            'maxFeePerGas': max_fee_per_gas,
-            'maxPriorityFeePerGas': max_priority_fee_per_gas,
-            'nonce': web3_provider.eth.get_transaction_count(account.address, 'pending'),
-        })
+    Pools whose finalization is already in flight get the existing transaction back
+    with the status "in_flight" rather than a second one. The rest are dry-run with
+    eth_call first, and those that would revert are not sent; the rest are sent with
+    the gas estimated in the same batch.
 
-        gas_estimate = web3_provider.eth.estimate_gas({
-            'from': account.address,
-            'to': contract.address,
-            'data': txn['data'],
-        })
+    :param resolutions: List of (pool_id, current_price) tuples
+    :return: List of per-pool result dictionaries
+    """
+    claimed, existing = clients.finalizations.claim(pool_id for pool_id, _ in resolutions)
+    calls = {pool_id: current_price for pool_id, current_price in resolutions if pool_id in claimed}
+    results = {}
+    try:
+        if calls:
+            results = await _submit_resolutions(calls)
+    finally:
+        for pool_id in calls:
+            clients.finalizations.publish(pool_id, results.get(pool_id, {"status": "error", "message": "Not submitted"}))
 
-        txn['gas'] = gas_estimate
+    for pool_id, future in existing.items():
+        result = await asyncio.shield(future)
+        if result["status"] == "submitted":
+            result = {**result, "status": "in_flight"}
+            FINALIZATIONS.labels("in_flight").inc()
+            logger.info(f"Pool {pool_id} finalization already in flight. Transaction hash: {result['transaction_hash']}")
+        results[pool_id] = result
+    return [{"pool_id": pool_id, **results[pool_id]} for pool_id, _ in resolutions]
 
-        total_gas_fee = gas_estimate * max_fee_per_gas
 
-        if balance < total_gas_fee:
-            logger.error(f"Insufficient funds for gas. Required: {web3_provider.from_wei(total_gas_fee, 'ether')} ETH, Available: {web3_provider.from_wei(balance, 'ether')} ETH")
-            return None
+async def _submit_resolutions(calls):
+    try:
+        simulated = await clients.submitter.simulate([("resolvePool", [pool_id, price]) for pool_id, price in calls.items()])
+    except Exception as e:
+        logger.warning(f"Error simulating finalizations, submitting without it: {str(e)}")
+        simulated = None
 
-        signed_txn = web3_provider.eth.account.sign_transaction(txn, private_key=private_key)
-        txn_hash = web3_provider.eth.send_raw_transaction(signed_txn.raw_transaction)
-        logger.info(f"Pool {pool_id} finalized. Transaction hash: {txn_hash.hex()}")
-        return txn_hash.hex()
+    results = {}
+    gas_limits = {}
+    for pool_id, (error, gas) in zip(list(calls), simulated or []):
+        gas_limits[pool_id] = gas
+        if error is not None:
+            results[pool_id] = {"status": "error", "message": f"Simulation failed: {error}"}
+            FINALIZATIONS.labels("simulation_failed").inc()
+            logger.warning(f"Pool {pool_id} finalization would revert, not sending it: {error}")
+    calls = {pool_id: price for pool_id, price in calls.items() if pool_id not in results}
+    if not calls:
+        return results
 
+    try:
+        # resolvePool gas depends on where the pool sits in the active pool array, so each
+        # call is sent with the estimate made alongside its simulation.
+        submitted = await clients.submitter.submit_many(
+            [("resolvePool", [pool_id, price]) for pool_id, price in calls.items()],
+            gas_limits=[gas_limits[pool_id] for pool_id in calls] if simulated is not None else None
+        )
     except Exception as e:
-        logger.error(f"Error finalizing pool {pool_id}: {str(e)}")
+        logger.error(f"Error finalizing pools: {str(e)}")
         if hasattr(e, 'response') and 'error' in e.response:
             logger.error(f"RPC Error: {e.response['error']}")
+        submitted = [{"status": "error", "message": str(e)}] * len(calls)
+
+    for pool_id, result in zip(calls, submitted):
+        results[pool_id] = result
+        if result["status"] == "submitted":
+            clients.receipt_tracker.track(result["transaction_hash"], kind="resolvePool", pool_id=pool_id,
+                                  nonce=result["nonce"], gas=result["gas"])
+            FINALIZATIONS.labels("submitted").inc()
+            logger.info(f"Pool {pool_id} finalization submitted. Transaction hash: {result['transaction_hash']}")
+        else:
+            FINALIZATIONS.labels("failed").inc()
+            logger.error(f"Error finalizing pool {pool_id}: {result['message']}")
+    return results
+
+
+async def finalize_pool(pool_id, current_price):
+    """Finalizes a pool on the smart contract, returning the hash of the new or already in-flight transaction."""
+    result = (await finalize_pools([(pool_id, current_price)]))[0]
+    return result.get("transaction_hash")
+
+
+def _decode_pool(pool_id, return_data):
+    pool = clients.web3.codec.decode(pool_output_types(), return_data)
+    if pool[0] == ZERO_ADDRESS:
         return None
+    return PoolRecord(pool_id, AsyncWeb3.to_checksum_address(pool[0]), *pool[1:])
 
 
-def get_pool_details(pool_id):
+async def get_pool_details(pool_id):
     """Retrieves the details of a specific pool."""
     try:
-        pool = contract.functions.pools(pool_id).call()
+        pool = await clients.contract.functions.pools(pool_id).call()
 
-        if pool[0] == '0x0000000000000000000000000000000000000000':
+        if pool[0] == ZERO_ADDRESS:
             logger.info(f"No pools active or pool {pool_id} does not exist.")
             return "No pools active or pool does not exist."
 
-        return {
-            "creator": pool[0],
-            "target_price": pool[1],
-            "stop_loss": pool[2],
-            "end_time": pool[3],
-            "is_finalized": pool[4],
-            "final_price": pool[5],
-            "outcome": pool[6]
-        }
+        return PoolRecord(pool_id, *pool).as_dict()
 
     except Exception as e:
         logger.error(f"Error retrieving pool details: {str(e)}")
         return None
 
 
-def get_dynamic_gas_price():
-    base_fee = web3_provider.eth.gas_price
-    priority_fee = web3_provider.to_wei('2', 'gwei')
-    max_fee_per_gas = base_fee + priority_fee
-    return max_fee_per_gas, priority_fee
+async def get_pool_details_many(pool_ids, chunk_size=RPC_BATCH_SIZE):
+    """
+    Retrieves the details of many pools, one JSON-RPC batch request per chunk.
+
+    :param pool_ids: Iterable of pool ids
+    :param chunk_size: Maximum number of calls per batch request
+    :return: Dictionary of pool id to PoolRecord; pools that do not exist are omitted
+    """
+    pool_ids = list(pool_ids)
+    responses = await batch_request(clients.web3, [
+        ('eth_call', [{'to': clients.contract.address, 'data': clients.contract.encode_abi('pools', args=[pool_id])}, 'latest'])
+        for pool_id in pool_ids
+    ], chunk_size)
+
+    records = {}
+    for pool_id, response in zip(pool_ids, responses):
+        if 'error' in response:
+            raise ValueError(f"Error retrieving pool {pool_id}: {response['error'].get('message')}")
+        record = _decode_pool(pool_id, AsyncWeb3.to_bytes(hexstr=response['result']))
+        if record is not None:
+            records[pool_id] = record
+    return records
+
+
+async def get_dynamic_gas_price():
+    """Returns the cached (max_fee_per_gas, max_priority_fee_per_gas) from the fee oracle."""
+    return await clients.fee_oracle.fees()
@@ -1,14 +1,23 @@
+from log_service import setup_logging, process_log_file
+
+# Before the service modules are imported, so that this process logs to its own file.
+setup_logging(process_log_file("bot"))
+
 import discord
 from discord.ext import commands, tasks
 import logging
 import asyncio
-from price_monitor import get_current_price, check_pool_conditions
-from contract_service import create_pool, finalize_pool
+from price_monitor import get_current_price
+from price_service import price_service
+from pool_cache import pool_cache
+from scheduler import start_scheduler
+from contract_service import create_pool, create_pools, validate_pool, finalize_pool, connect
+from clients import clients
+from notifier import notifier, PRICE_CHANNEL, POOL_CHANNEL
 from event_listener import event_listener
 from web3 import Web3
 from config import *
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 intents = discord.Intents.default()
@@ -20,30 +29,39 @@ bot = commands.Bot(command_prefix='!', intents=intents)
 async def on_ready():
     logger.info(f'Bot is ready. Logged in as {bot.user}')
     print("Bot is online and ready to accept commands.")
+    await connect()
+    clients.receipt_tracker.start()
+    notifier.attach_bot(bot)
+    notifier.start()
     fetch_price.start()
-    check_pools_periodically.start()
+    start_scheduler().add_callback(report_pool_checks)
     asyncio.create_task(event_listener())
 
 @tasks.loop(minutes=1)
 async def fetch_price():
-    """Fetch the current price every minute and send it to the Discord chat."""
-    current_price = await get_current_price()
-    if current_price is not None:
-        current_price_converted = Web3.from_wei(current_price, 'ether')
-        message = f"The current BITCOIN price is ${current_price_converted}."
-        channel = discord.utils.get(bot.get_all_channels(), name="price-updates")
-        if channel:
-            await channel.send(message)
-        logger.info(message)
-
-@tasks.loop(minutes=1)
-async def check_pools_periodically():
-    """Periodically check pool conditions and finalize them if necessary."""
-    result = await check_pool_conditions()
+    """Fetch the current price of every asset with active pools every minute and send it to the Discord chat."""
+    prices = await price_service.get_prices(await pool_cache.assets() | {ASSET_ID})
+    for asset, current_price in sorted(prices.items()):
+        if current_price is not None:
+            current_price_converted = Web3.from_wei(current_price, 'ether')
+            message = f"The current {asset.upper()} price is ${current_price_converted}."
+            notifier.notify(PRICE_CHANNEL, message, key=f"price:{asset}")
+            logger.info(message)
+
+async def report_pool_checks(result):
+    """Posts the outcome of a scheduled pool check that submitted finalizations."""
     logger.info(result['message'])
-    channel = discord.utils.get(bot.get_all_channels(), name="pool-updates")
-    if channel:
-        await channel.send(result['message'])
+    notifier.notify(POOL_CHANNEL, result['message'])
+
+async def report_transaction(ctx, tx_hash, description):
+    """Posts the outcome of a submitted transaction once the receipt tracker resolves it."""
+    transaction = await clients.receipt_tracker.wait(tx_hash)
+    if transaction is None:
+        return
+    if transaction["status"] == "success":
+        await ctx.send(f"{description} confirmed in block {transaction['block_number']}. Transaction Hash: {tx_hash}")
+    else:
+        await ctx.send(f"{description} {transaction['status']}. Transaction Hash: {tx_hash}")
 
 @bot.command(name='finalize_pool')
 async def finalize_pool_command(ctx, pool_id: int):
@@ -51,22 +69,23 @@ async def finalize_pool_command(ctx, pool_id: int):
     Manually finalize a specific pool by pool ID.
     """
     await ctx.send(f"Attempting to finalize pool {pool_id}...")
-    current_price_in_wei = await get_current_price()
+    current_price_in_wei = await get_current_price(asset=pool_cache.asset_of(pool_id))
     if current_price_in_wei is None:
         await ctx.send("Failed to fetch the current price. Please try again later.")
         return
 
-    txn_hash = finalize_pool(pool_id, current_price_in_wei)
+    txn_hash = await finalize_pool(pool_id, current_price_in_wei)
     if txn_hash:
-        await ctx.send(f"Pool {pool_id} finalized successfully! Transaction Hash: {txn_hash}")
+        await ctx.send(f"Finalization of pool {pool_id} submitted! Transaction Hash: {txn_hash}")
+        asyncio.create_task(report_transaction(ctx, txn_hash, f"Finalization of pool {pool_id}"))
     else:
         await ctx.send(f"Failed to finalize pool {pool_id}.")
 
 
 @bot.command(name='create_pool')
-async def create_pool_command(ctx):
+async def create_pool_command(ctx, asset: str = ASSET_ID):
     """
-    Collects parameters from the user and creates a new pool on the blockchain.
+    Collects parameters from the user and creates a new pool on the blockchain, for ASSET_ID unless an asset is given.
     """
     await ctx.send("Let's create a new pool! Please provide the target price in USD (e.g., 1500):")
 
@@ -77,7 +96,7 @@ async def create_pool_command(ctx):
         target_price_message = await bot.wait_for('message', check=check, timeout=60.0)
         target_price_in_usd = float(target_price_message.content)
 
-        current_price_in_wei = await get_current_price()
+        current_price_in_wei = await get_current_price(asset=asset)
         current_price_in_eth = Web3.from_wei(current_price_in_wei, 'ether')
 
         target_price_in_eth = target_price_in_usd / float(current_price_in_eth)
@@ -93,10 +112,11 @@ async def create_pool_command(ctx):
         duration_message = await bot.wait_for('message', check=check, timeout=60.0)
         duration = int(duration_message.content)
 
-        result = create_pool(target_price_in_wei, stop_loss_in_wei, duration)
-        if result["status"] == "success":
+        result = await create_pool(target_price_in_wei, stop_loss_in_wei, duration, asset)
+        if result["status"] == "submitted":
             await ctx.send(f"{result['message']}")
-            logger.info(f"Pool created successfully: {result}")
+            logger.info(f"Pool creation submitted: {result}")
+            asyncio.create_task(report_transaction(ctx, result["transaction_hash"], "Pool creation"))
         else:
             await ctx.send(f"Failed to create pool: {result['message']}")
             logger.error(f"Failed to create pool: {result}")
@@ -108,4 +128,53 @@ async def create_pool_command(ctx):
         logger.error(f"Error creating pool: {str(e)}")
 
 
-bot.run(DISCORD_BOT)
+@bot.command(name='create_pools')
+async def create_pools_command(ctx, *, pools: str = ""):
+    """
+    Creates many pools in one batch. Give one pool per line after the command:
+    <target price in USD> <stop loss in USD> <duration in seconds> [asset]
+    """
+    lines = [line.split() for line in pools.splitlines() if line.strip()]
+    if not lines:
+        await ctx.send("Please provide one pool per line: <target price USD> <stop loss USD> <duration seconds> [asset]")
+        return
+
+    assets = [fields[3] if len(fields) > 3 else ASSET_ID for fields in lines]
+    prices = await price_service.get_prices(assets)
+    missing = sorted(asset for asset, price in prices.items() if price is None)
+    if missing:
+        await ctx.send(f"Failed to fetch the current price of {', '.join(missing)}. Please try again later.")
+        return
+
+    args, errors = [], []
+    for line_number, (fields, asset) in enumerate(zip(lines, assets), start=1):
+        try:
+            target_price_in_usd, stop_loss_in_usd, duration = float(fields[0]), float(fields[1]), int(fields[2])
+        except (ValueError, IndexError):
+            errors.append(f"Line {line_number}: expected <target price USD> <stop loss USD> <duration seconds> [asset]")
+            continue
+        current_price_in_eth = float(Web3.from_wei(prices[asset], 'ether'))
+        pool = (Web3.to_wei(target_price_in_usd / current_price_in_eth, 'ether'),
+                Web3.to_wei(stop_loss_in_usd / current_price_in_eth, 'ether'),
+                duration)
+        error = validate_pool(*pool)
+        if error:
+            errors.append(f"Line {line_number}: {error}")
+        args.append(pool)
+
+    if errors:
+        await ctx.send("No pools were created:\n" + "\n".join(errors[:20]))
+        return
+
+    results = await create_pools(args, assets)
+    tx_hashes = [result["transaction_hash"] for result in results if result["status"] == "submitted"]
+    await ctx.send(f"Submitted {len(tx_hashes)} of {len(results)} pool creations.")
+    logger.info(f"Bulk pool creation submitted {len(tx_hashes)} of {len(results)} pools")
+
+    transactions = await asyncio.gather(*(clients.receipt_tracker.wait(tx_hash) for tx_hash in tx_hashes))
+    confirmed = sum(1 for transaction in transactions if transaction and transaction["status"] == "success")
+    await ctx.send(f"Bulk pool creation finished: {confirmed} of {len(results)} pools created.")
+
+
+if __name__ == "__main__":
+    bot.run(DISCORD_BOT)
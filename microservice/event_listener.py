@@ -1,43 +1,132 @@
-from contract_service import contract
+from contract_service import connect
+from clients import clients
+from pool_cache import pool_cache
+from pool_archive import pool_archive
+from notifier import notifier, POOL_CHANNEL
+from scheduler import scheduler
+from metrics import BLOCK_LAG, EVENT_LAG, timed
+from collections import OrderedDict
+from eth_utils import encode_hex, event_abi_to_log_topic
 import asyncio
+import functools
+import json
 import logging
+import os
+import time
 from config import *
-import httpx
 
 logger = logging.getLogger(__name__)
 
 BLOCK_TRACK_FILE = "last_processed_block.json"
+# How providers reject eth_getLogs queries spanning too many blocks or matching too many logs,
+# e.g. geth/Infura "query returned more than 10000 results", Alchemy "Log response size exceeded",
+# "exceed maximum block range: 5000", "block range is too wide", QuickNode "limited to a 10,000 blocks range".
+RESULT_SIZE_ERRORS = ('returned more than', 'response size', 'too many results', 'too many logs', 'max results',
+                      'maximum block range', 'block range', 'blocks range', 'range is too', 'range too large',
+                      'requested blocks')
+RATE_LIMIT_ERRORS = ('rate limit', 'rate-limit', 'ratelimit', 'too many requests', '429', 'request limit',
+                     'throttl', 'capacity', 'compute units')
 
-# async def send_discord_notification(message: str):
-#     """Send a message to the Discord channel via the webhook."""
-#     try:
-#         async with httpx.AsyncClient() as client:
-#             response = await client.post(DISCORD_WEBHOOK_URL, json={"content": message})
-#             response.raise_for_status()
-#     except Exception as e:
-#         logger.error(f"Failed to send Discord notification: {str(e)}")
+@functools.cache
+def contract_events():
+    """Returns {topic: event name} for the contract's events."""
+    return {
+        event_abi_to_log_topic(item): item['name']
+        for item in clients.abi if item.get('type') == 'event'
+    }
+
+def event_topics():
+    return [encode_hex(topic) for topic in contract_events()]
 
 def get_last_processed_block():
-    """Retrieve the last processed block number from the file."""
+    """
+    Retrieve the last processed position from the file.
+
+    :return: Tuple of (block number, log index), where a log index of None means the
+             whole block was processed, or None if no checkpoint exists
+    """
     try:
         with open(BLOCK_TRACK_FILE, 'r') as f:
             data = json.load(f)
-            return data.get("last_processed_block", None)
+            block_number = data.get("last_processed_block", None)
+            if block_number is None:
+                return None
+            return block_number, data.get("last_log_index", None)
     except FileNotFoundError:
         return None
 
-def store_last_processed_block(block_number):
-    """Store the last processed block number in a file."""
-    with open(BLOCK_TRACK_FILE, 'w') as f:
-        json.dump({"last_processed_block": block_number}, f)
+def store_last_processed_block(block_number, log_index=None):
+    """Atomically store the last processed position in a file."""
+    tmp_file = f"{BLOCK_TRACK_FILE}.tmp"
+    with open(tmp_file, 'w') as f:
+        json.dump({"last_processed_block": block_number, "last_log_index": log_index}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, BLOCK_TRACK_FILE)
+
+class Checkpoint:
+    """Tracks the position of the last handled log and persists it at a fixed cadence."""
+
+    def __init__(self, interval=CHECKPOINT_INTERVAL):
+        self.interval = interval
+        self.block_number = None
+        self.log_index = None
+        self._stored = None
+        self._stored_at = 0
+
+    def load(self):
+        position = get_last_processed_block()
+        if position is not None:
+            self.block_number, self.log_index = position
+            self._stored = position
+        return position
+
+    def is_processed(self, block_number, log_index):
+        if self.block_number is None or block_number > self.block_number:
+            return False
+        if block_number < self.block_number:
+            return True
+        return self.log_index is None or log_index <= self.log_index
+
+    def advance(self, block_number, log_index=None):
+        self.block_number, self.log_index = block_number, log_index
+
+    def maybe_store(self):
+        """Stores the position if the cadence interval has elapsed since the last write."""
+        if time.monotonic() - self._stored_at >= self.interval:
+            self.store()
+
+    def store(self):
+        position = (self.block_number, self.log_index)
+        if self.block_number is None or position == self._stored:
+            return
+        store_last_processed_block(*position)
+        self._stored = position
+        self._stored_at = time.monotonic()
+
+_block_timestamps = OrderedDict()
+
+async def get_block_timestamp(block_number):
+    """Returns a block's timestamp, caching recent blocks so each is fetched at most once."""
+    timestamp = _block_timestamps.get(block_number)
+    if timestamp is None:
+        timestamp = (await clients.web3.eth.get_block(block_number))['timestamp']
+        _block_timestamps[block_number] = timestamp
+        if len(_block_timestamps) > 1024:
+            _block_timestamps.popitem(last=False)
+    return timestamp
+
+def notify_event(message):
+    """
+    Posts a pool event to Discord from the process holding the leader lease only.
+
+    The API and the bot both run an event listener, so every event is seen twice.
+    """
+    if scheduler.lease.held:
+        notifier.notify(POOL_CHANNEL, message)
 
 async def handle_pool_created_event(event):
     pool_id = event['args']['poolId']
-    pool = contract.functions.pools(pool_id).call()
-    logger.info(f"Event {pool[4]})")
-    if pool[4]:
-        return
-
     creator = event['args']['creator']
     target_price = event['args']['targetPrice']
     stop_loss = event['args']['stopLoss']
@@ -51,14 +140,13 @@ async def handle_pool_created_event(event):
                     Stop Loss: {stop_loss}, \
                         End Time: {end_time}, ")
 
-    # message = (f"New Pool Created!\n"
-    #            f"**Pool ID:** {pool_id}\n"
-    #            f"**Creator:** {creator}\n"
-    #            f"**Target Price:** {target_price}\n"
-    #            f"**Stop Loss:** {stop_loss}\n"
-    #            f"**End Time:** {end_time}")
-
-    # await send_discord_notification(message)
+    # Our own transactions are tagged before they are sent; pools created any other way track ASSET_ID.
+    asset = pool_archive.record_created(pool_id, creator, target_price, stop_loss, end_time,
+                                        event['blockNumber'], await get_block_timestamp(event['blockNumber']),
+                                        transaction_hash=encode_hex(event['transactionHash']))
+    pool_cache.on_pool_created(pool_id, creator, target_price, stop_loss, end_time, asset)
+    notify_event(f"New {asset} pool {pool_id} by {creator}: target price {target_price}, "
+                 f"stop loss {stop_loss}, ends at {end_time}")
 
 async def handle_pool_finalized_event(event):
     pool_id = event['args']['poolId']
@@ -71,12 +159,14 @@ async def handle_pool_finalized_event(event):
                     Final Price: {final_price}, \
                         Outcome: {outcome}")
 
-    # message = (f"Pool Finalized!\n"
-    #            f"**Pool ID:** {pool_id}\n"
-    #            f"**Final Price:** {final_price}\n"
-    #            f"**Outcome:** {outcome}")
-
-    # await send_discord_notification(message)
+    timestamp = await get_block_timestamp(event['blockNumber'])
+    if not pool_archive.record_finalized(pool_id, final_price, outcome, event['blockNumber'], timestamp):
+        pool = await pool_cache.get(pool_id)
+        if pool is not None:
+            pool = pool._replace(is_finalized=True, final_price=final_price, outcome=outcome)
+            pool_archive.record_pool(pool, event['blockNumber'], timestamp)
+    pool_cache.on_pool_finalized(pool_id, final_price, outcome)
+    notify_event(f"Pool {pool_id} finalized at {final_price}: {outcome}")
 
 async def handle_event(event):
     event_name = event.event
@@ -87,29 +177,204 @@ async def handle_event(event):
     else:
         logger.warning(f"Event listener: Unhandled event type: {event_name}")
 
-async def event_listener():
-    try:
-        last_processed_block = get_last_processed_block()
-        if last_processed_block is None:
-            last_processed_block = 'latest'
+def decode_logs(logs):
+    """Decodes a batch of raw contract logs into events, skipping removed and unknown logs."""
+    events = []
+    for log in logs:
+        if log.get('removed'):
+            logger.warning(f"Event listener: Skipping log removed by reorg: {log['transactionHash'].hex()}")
+            continue
+        event_name = contract_events().get(bytes(log['topics'][0])) if log['topics'] else None
+        if event_name is None:
+            logger.warning(f"Event listener: Unknown log topic in transaction {log['transactionHash'].hex()}")
+            continue
+        events.append(getattr(clients.contract.events, event_name)().process_log(log))
+    return events
 
-        pool_created_filter = contract.events.PoolCreated.create_filter(from_block='latest')
-        pool_finalized_filter = contract.events.PoolFinalized.create_filter(from_block='latest')
+@timed("event_listener")
+async def handle_logs(logs, checkpoint):
+    """Handles a batch of logs in order, skipping any already covered by the checkpoint."""
+    handled = None
+    for event in decode_logs(logs):
+        if checkpoint.is_processed(event['blockNumber'], event['logIndex']):
+            continue
+        await handle_event(event)
+        checkpoint.advance(event['blockNumber'], event['logIndex'])
+        handled = event
+    # The archive is committed before the checkpoint can move past its events.
+    pool_archive.commit()
+    checkpoint.maybe_store()
+    if handled is not None:
+        EVENT_LAG.set(time.time() - await get_block_timestamp(handled['blockNumber']))
 
-        while True:
-            created_events = pool_created_filter.get_new_entries()
-            finalized_events = pool_finalized_filter.get_new_entries()
+def is_rate_limit_error(error):
+    message = str(error).lower()
+    return any(hint in message for hint in RATE_LIMIT_ERRORS)
 
-            for event in created_events:
-                await handle_event(event)
+def is_result_size_error(error):
+    """Whether a provider rejected an eth_getLogs query as too large; rate limit errors never are."""
+    message = str(error).lower()
+    return not is_rate_limit_error(error) and any(hint in message for hint in RESULT_SIZE_ERRORS)
 
-            for event in finalized_events:
-                await handle_event(event)
+async def backfill(checkpoint):
+    """
+    Replays the logs emitted since the checkpoint with eth_getLogs.
+
+    Block ranges shrink when the provider rejects a query as too large and grow while
+    ranges come back empty. When the provider rate limits the queries, the same range
+    is retried after a backoff of EVENT_LISTENER_RETRY_MIN seconds, doubling up to
+    EVENT_LISTENER_RETRY_MAX.
+    """
+    to_block = await clients.web3.eth.block_number
+    if checkpoint.block_number is None and BACKFILL_START_BLOCK is not None:
+        checkpoint.advance(int(BACKFILL_START_BLOCK) - 1)
+    if checkpoint.block_number is None:
+        logger.info(f"Event listener: No checkpoint found, starting from block {to_block}")
+        checkpoint.advance(to_block)
+        checkpoint.store()
+        return
 
-            await asyncio.sleep(2)
+    from_block = checkpoint.block_number if checkpoint.log_index is not None else checkpoint.block_number + 1
+    chunk_size = BACKFILL_CHUNK_SIZE
+    retry_delay = EVENT_LISTENER_RETRY_MIN
+    started = time.monotonic()
+    logger.info(f"Event listener: Backfilling blocks {from_block} to {to_block}")
 
-    except Exception as e:
-        logger.error(f"Error in event listener: {e}")
+    while from_block <= to_block:
+        end_block = min(from_block + chunk_size - 1, to_block)
+        try:
+            logs = await clients.web3.eth.get_logs({
+                'address': clients.contract.address,
+                'topics': [event_topics()],
+                'fromBlock': from_block,
+                'toBlock': end_block,
+            })
+        except Exception as e:
+            if is_rate_limit_error(e):
+                logger.warning(f"Event listener: Provider rate limited the backfill, retrying in {retry_delay}s")
+                await asyncio.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, EVENT_LISTENER_RETRY_MAX)
+                continue
+            if chunk_size > 1 and is_result_size_error(e):
+                chunk_size = max(1, chunk_size // 2)
+                logger.info(f"Event listener: Provider rejected range, shrinking backfill chunk to {chunk_size} blocks")
+                continue
+            raise
+        retry_delay = EVENT_LISTENER_RETRY_MIN
+
+        await handle_logs(logs, checkpoint)
+        checkpoint.advance(end_block)
+        checkpoint.maybe_store()
+        BLOCK_LAG.set(to_block - end_block)
+        if not logs:
+            chunk_size = min(chunk_size * 2, BACKFILL_MAX_CHUNK_SIZE)
+        from_block = end_block + 1
+
+    checkpoint.store()
+    logger.info(f"Event listener: Backfill to block {to_block} finished in {time.monotonic() - started:.2f}s")
+
+async def _read_subscription(queue):
+    async for message in clients.stream_web3.socket.process_subscriptions():
+        await queue.put(message['result'])
+
+async def subscribe_events(queue):
+    """Subscribes to the contract's logs over eth_subscribe and queues them as they are pushed."""
+    await clients.connect_stream()
+    subscription_id = await clients.stream_web3.eth.subscribe('logs', {
+        'address': clients.contract.address,
+        'topics': [event_topics()],
+    })
+    logger.info(f"Event listener: Subscribed to contract logs ({subscription_id})")
+    return asyncio.create_task(_read_subscription(queue))
+
+async def _poll_filter(log_filter, queue):
+    while True:
+        for log in await log_filter.get_new_entries():
+            await queue.put(log)
+
+        await asyncio.sleep(2)
+
+async def poll_events(queue):
+    """Polls one combined log filter for both contract events and queues the results."""
+    log_filter = await clients.web3.eth.filter({
+        'address': clients.contract.address,
+        'topics': [event_topics()],
+    })
+    return asyncio.create_task(_poll_filter(log_filter, queue))
+
+async def next_logs(queue, source):
+    """
+    Waits for queued logs, together with the task that queues them.
+
+    :return: List of every log queued so far
+    :raises ConnectionError: If the source task stopped, so that no more logs would arrive
+    """
+    if queue.empty():
+        getter = asyncio.ensure_future(queue.get())
+        done, _ = await asyncio.wait({getter, source}, return_when=asyncio.FIRST_COMPLETED)
+        if getter not in done:
+            getter.cancel()
+            raise source.exception() or ConnectionError("Log source stopped")
+        logs = [getter.result()]
+    else:
+        logs = [queue.get_nowait()]
+    while not queue.empty():
+        logs.append(queue.get_nowait())
+    return logs
+
+async def listen(checkpoint):
+    """Backfills from the checkpoint, then handles live logs until the subscription or filter fails."""
+    await connect()
+
+    # Live logs are queued from before the backfill starts, so nothing is missed at
+    # the hand-off; the checkpoint drops the ones the backfill already handled.
+    queue = asyncio.Queue()
+    if EVENT_LISTENER_MODE == 'subscribe' and clients.stream_url is not None:
+        source = await subscribe_events(queue)
+    else:
+        source = await poll_events(queue)
+
+    try:
+        await backfill(checkpoint)
+        while True:
+            logs = await next_logs(queue, source)
+            # Live logs are pushed as blocks arrive, so the newest one queued marks the head.
+            BLOCK_LAG.set(max(log['blockNumber'] for log in logs) - logs[0]['blockNumber'])
+            await handle_logs(logs, checkpoint)
+            if queue.empty():
+                BLOCK_LAG.set(0)
+    finally:
+        source.cancel()
+
+async def event_listener():
+    """
+    Runs the event listener until it is cancelled.
+
+    When the websocket drops, the filter expires or a log fails to be handled, the
+    listener resubscribes after a backoff of EVENT_LISTENER_RETRY_MIN seconds,
+    doubling up to EVENT_LISTENER_RETRY_MAX, and backfills from its checkpoint.
+    """
+    checkpoint = Checkpoint()
+    checkpoint.load()
+    retry_delay = EVENT_LISTENER_RETRY_MIN
+    try:
+        while True:
+            started = time.monotonic()
+            try:
+                await listen(checkpoint)
+            except Exception as e:
+                logger.error(f"Error in event listener: {str(e) or type(e).__name__}")
+            pool_archive.commit()
+            checkpoint.store()
+            if time.monotonic() - started > EVENT_LISTENER_RETRY_MAX:
+                # The last subscription was healthy for a while, so this is a fresh failure.
+                retry_delay = EVENT_LISTENER_RETRY_MIN
+            logger.info(f"Event listener: Resubscribing in {retry_delay}s.")
+            await asyncio.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, EVENT_LISTENER_RETRY_MAX)
+    finally:
+        pool_archive.commit()
+        checkpoint.store()
 
 def start_event_listener():
     loop = asyncio.get_event_loop()
@@ -0,0 +1,119 @@
+from config import BLOCK_TIME, FEE_HISTORY_BLOCKS, PRIORITY_FEE_PERCENTILE, GAS_ESTIMATE_MARGIN, GAS_ESTIMATE_TTL, BALANCE_REFRESH_INTERVAL
+from rpc import batch_request
+from statistics import median
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Functions whose gas depends on contract state rather than on the calldata: resolvePool
+# scans the active pool array for the pool it removes.
+UNCACHED_GAS_FUNCTIONS = {"resolvePool"}
+
+
+class FeeOracle:
+    """
+    Cached fee, gas and balance data for transaction submitters.
+
+    EIP-1559 fee parameters are derived from eth_feeHistory at most once per block.
+    Gas estimates are memoized per function and calldata shape with a safety margin,
+    except for the functions in UNCACHED_GAS_FUNCTIONS, and the wallet balance is tracked locally from the fees reserved by sent
+    transactions, with a periodic resync from the node.
+    """
+
+    def __init__(self, web3, chunk_size=100):
+        self.web3 = web3
+        self.chunk_size = chunk_size
+        self._fees = None
+        self._fees_at = 0
+        self._fees_lock = asyncio.Lock()
+        self._gas = {}
+        self._balance = None
+        self._balance_at = 0
+
+    async def fees(self):
+        """Returns (max_fee_per_gas, max_priority_fee_per_gas), refreshed once per block."""
+        async with self._fees_lock:
+            if self._fees is None or time.monotonic() - self._fees_at >= BLOCK_TIME:
+                self._fees = await self._fetch_fees()
+                self._fees_at = time.monotonic()
+            return self._fees
+
+    async def _fetch_fees(self):
+        history = await self.web3.eth.fee_history(FEE_HISTORY_BLOCKS, 'latest', [PRIORITY_FEE_PERCENTILE])
+        # The last base fee in the history is the one projected for the next block.
+        base_fee = history['baseFeePerGas'][-1]
+        rewards = [reward[0] for reward in history.get('reward', []) if reward]
+        if rewards:
+            priority_fee = int(median(rewards))
+        else:
+            priority_fee = await self.web3.eth.max_priority_fee
+        # Leave room for the base fee to rise for a few full blocks before inclusion.
+        return 2 * base_fee + priority_fee, priority_fee
+
+    def _gas_key(self, name, data):
+        return name, len(data)
+
+    @staticmethod
+    def gas_limit(estimate):
+        """Turns an eth_estimateGas result into a gas limit with the safety margin."""
+        return int(int(estimate, 16) * GAS_ESTIMATE_MARGIN)
+
+    async def gas_limits(self, sender, to, calls):
+        """
+        Returns a gas limit for each call, estimating only the shapes not already cached.
+
+        Calls to UNCACHED_GAS_FUNCTIONS are estimated every time.
+
+        :param sender: Address the transactions are sent from
+        :param to: Address the transactions are sent to
+        :param calls: List of (function name, calldata) tuples
+        :return: List holding a gas limit or an error message for each call
+        """
+        now = time.monotonic()
+        limits = [None] * len(calls)
+        misses = []
+        for i, (name, data) in enumerate(calls):
+            cached = None if name in UNCACHED_GAS_FUNCTIONS else self._gas.get(self._gas_key(name, data))
+            if cached is not None and now - cached[1] < GAS_ESTIMATE_TTL:
+                limits[i] = cached[0]
+            else:
+                misses.append(i)
+
+        if misses:
+            estimates = await batch_request(self.web3, [
+                ('eth_estimateGas', [{'from': sender, 'to': to, 'data': calls[i][1]}])
+                for i in misses
+            ], self.chunk_size)
+            fresh = {}
+            for i, estimate in zip(misses, estimates):
+                if 'error' in estimate:
+                    limits[i] = f"Gas estimation failed: {estimate['error'].get('message')}"
+                    continue
+                gas = self.gas_limit(estimate['result'])
+                limits[i] = gas
+                if calls[i][0] in UNCACHED_GAS_FUNCTIONS:
+                    continue
+                key = self._gas_key(*calls[i])
+                fresh[key] = max(gas, fresh.get(key, 0))
+            for key, gas in fresh.items():
+                self._gas[key] = (gas, now)
+
+        return limits
+
+    def invalidate_gas(self, name=None):
+        """Drops memoized gas estimates, e.g. after a transaction ran out of gas."""
+        self._gas = {key: value for key, value in self._gas.items() if name is not None and key[0] != name}
+
+    async def balance(self, address):
+        """Returns the locally tracked balance, resyncing from the node periodically."""
+        if self._balance is None or time.monotonic() - self._balance_at >= BALANCE_REFRESH_INTERVAL:
+            self._balance = await self.web3.eth.get_balance(address)
+            self._balance_at = time.monotonic()
+        return self._balance
+
+    def spend(self, amount):
+        """Records the maximum fee reserved by a sent transaction."""
+        if self._balance is not None:
+            self._balance -= amount
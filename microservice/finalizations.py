@@ -0,0 +1,68 @@
+from receipt_tracker import PENDING
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class FinalizationRegistry:
+    """
+    In-flight resolvePool transactions by pool id.
+
+    A pool is claimed before its transaction is signed and stays claimed until the
+    receipt tracker reports the transaction mined, reverted or dropped. Anyone who
+    tries to finalize a claimed pool meanwhile, whether the scheduler, the bot or a
+    manual request, gets the existing submission back instead of sending a
+    duplicate that would only revert.
+    """
+
+    def __init__(self):
+        self._pools = {}
+
+    def __len__(self):
+        return len(self._pools)
+
+    def __contains__(self, pool_id):
+        return pool_id in self._pools
+
+    def claim(self, pool_ids):
+        """
+        Claims the pools that are not in flight.
+
+        :param pool_ids: Iterable of pool ids
+        :return: Tuple of (set of newly claimed pool ids, dictionary of pool id to the future of the
+                 submission already in flight for the others)
+        """
+        loop = asyncio.get_running_loop()
+        claimed, existing = set(), {}
+        for pool_id in pool_ids:
+            if pool_id in self._pools:
+                existing[pool_id] = self._pools[pool_id]
+            elif pool_id not in claimed:
+                self._pools[pool_id] = loop.create_future()
+                claimed.add(pool_id)
+        return claimed, existing
+
+    def publish(self, pool_id, result):
+        """
+        Publishes the submission result of a claimed pool to whoever waits on it.
+
+        A pool whose transaction was not sent is released at once; a sent one stays
+        claimed until finish() sees its transaction finish.
+        """
+        future = self._pools.get(pool_id)
+        if future is None or future.done():
+            return
+        future.set_result(result)
+        if result["status"] != "submitted":
+            del self._pools[pool_id]
+
+    def finish(self, transaction):
+        """Receipt tracker callback that releases a pool once its resolvePool transaction is mined or dropped."""
+        if transaction.get("kind") != "resolvePool" or transaction["status"] == PENDING:
+            return
+        future = self._pools.get(transaction.get("pool_id"))
+        if (future is not None and future.done()
+                and future.result().get("transaction_hash") == transaction["transaction_hash"]):
+            del self._pools[transaction["pool_id"]]
+            logger.debug(f"Pool {transaction['pool_id']} finalization {transaction['status']}, released.")
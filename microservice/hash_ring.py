@@ -0,0 +1,55 @@
+from bisect import bisect, insort
+import hashlib
+
+DEFAULT_REPLICAS = 64
+
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring assigning pool ids to worker nodes.
+
+    Each node is placed on the ring at several virtual points so shards stay even,
+    and adding or removing a node only moves the pools between it and its
+    neighbours, about 1/n of all pools.
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self._ring = []
+        self._nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, node):
+        return node in self._nodes
+
+    @property
+    def nodes(self):
+        return frozenset(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        for replica in range(self.replicas):
+            insort(self._ring, (ring_hash(f"{node}#{replica}"), node))
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.discard(node)
+        self._ring = [point for point in self._ring if point[1] != node]
+
+    def owner(self, pool_id):
+        """Returns the node owning a pool id, or None if the ring is empty."""
+        if not self._ring:
+            return None
+        i = bisect(self._ring, (ring_hash(pool_id), ""))
+        return self._ring[i % len(self._ring)][1]
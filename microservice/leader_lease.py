@@ -0,0 +1,42 @@
+from config import LEADER_LOCK_FILE
+import fcntl
+import os
+
+
+class LeaderLease:
+    """
+    Exclusive lock on a local file marking the one process allowed to check pools.
+
+    The lock is taken without blocking and the OS drops it when the holder exits,
+    so a standby process takes over on its next attempt.
+    """
+
+    def __init__(self, path=LEADER_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self):
+        return self._file is not None
+
+    def acquire(self):
+        """Takes the lease if it is free; returns whether this process holds it."""
+        if self._file is not None:
+            return True
+        file = open(self.path, "a+")
+        try:
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            file.close()
+            return False
+        file.truncate(0)
+        file.write(str(os.getpid()))
+        file.flush()
+        self._file = file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
@@ -0,0 +1,202 @@
+from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_BUFFER_SIZE
+from collections import deque
+from logging.handlers import RotatingFileHandler
+import asyncio
+import itertools
+import logging
+import os
+import re
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+LINE_PATTERN = re.compile(r'^(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - ([A-Z]+) - (?:([\w.]+) - )?(.*)$')
+POOL_PATTERN = re.compile(r'\bpool(?:\s+id)?[\s:#]*(\d+)', re.IGNORECASE)
+READ_BLOCK_SIZE = 64 * 1024
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def find_pool_id(message):
+    """Returns the first pool id mentioned in a log message, or None."""
+    match = POOL_PATTERN.search(message)
+    return int(match.group(1)) if match else None
+
+
+def level_number(level):
+    """Converts a level name such as 'warning' to its number; unknown names raise ValueError."""
+    number = logging.getLevelName(level.upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return number
+
+
+def matches(entry, min_level=None, module=None, pool_id=None):
+    """Checks a structured log entry against the /logs filters."""
+    if min_level is not None and logging.getLevelName(entry["level"]) < min_level:
+        return False
+    if module is not None and entry["module"] != module:
+        return False
+    if pool_id is not None and entry["pool_id"] != pool_id:
+        return False
+    return True
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the most recent log records in memory as structured entries.
+
+    Every entry gets an increasing sequence number, which live-tail clients use
+    to resume. Entries are also pushed to subscriber queues; a subscriber that
+    falls behind loses entries instead of slowing down logging.
+    """
+
+    def __init__(self, capacity=LOG_BUFFER_SIZE):
+        super().__init__()
+        self.entries = deque(maxlen=capacity)
+        self._seq = itertools.count(1)
+        self._subscribers = set()
+        self._formatter = logging.Formatter()
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            if record.exc_info:
+                message = f"{message}\n{self._formatter.formatException(record.exc_info)}"
+            entry = {
+                "seq": next(self._seq),
+                "time": self._formatter.formatTime(record),
+                "level": record.levelname,
+                "module": record.name,
+                "message": message,
+                "pool_id": getattr(record, "pool_id", find_pool_id(message)),
+            }
+            self.entries.append(entry)
+            for loop, queue in list(self._subscribers):
+                loop.call_soon_threadsafe(self._publish, queue, entry)
+        except Exception:
+            self.handleError(record)
+
+    @staticmethod
+    def _publish(queue, entry):
+        if not queue.full():
+            queue.put_nowait(entry)
+
+    def recent(self, after=0):
+        """Returns buffered entries with a sequence number greater than after."""
+        return [entry for entry in self.entries if entry["seq"] > after]
+
+    def subscribe(self):
+        """Returns a queue receiving every new entry, bound to the running event loop."""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(SUBSCRIBER_QUEUE_SIZE))
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
+
+
+ring_buffer = RingBufferHandler()
+
+
+def process_log_file(name):
+    """
+    Returns the log file of one process, e.g. microservice-api.log for "api".
+
+    RotatingFileHandler cannot share a file between processes: each rotates it on
+    its own and lines are lost, so every long-running process logs to its own file.
+    """
+    return f"{os.path.splitext(LOG_FILE)[0]}-{name}.log"
+
+
+def setup_logging(filename=LOG_FILE, level=logging.INFO):
+    """
+    Configures the root logger once per process: a size-rotated log file plus the in-memory ring buffer.
+
+    Entry points call it with their process_log_file() before importing the service
+    modules, whose own call then does nothing.
+    """
+    root = logging.getLogger()
+    if ring_buffer in root.handlers:
+        return
+    file_handler = RotatingFileHandler(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(file_handler)
+    root.addHandler(ring_buffer)
+    root.setLevel(level)
+
+
+def read_lines_backwards(path, end=None, block_size=READ_BLOCK_SIZE):
+    """
+    Yields (offset, line) pairs from the end of a file towards its start.
+
+    :param path: File to read
+    :param end: Byte offset to start reading backwards from; defaults to the end of the file
+    :param block_size: Number of bytes read per seek
+    """
+    with open(path, "rb") as file:
+        size = file.seek(0, os.SEEK_END)
+        position = size if end is None else min(end, size)
+        buffer = b""
+        while position > 0:
+            read = min(block_size, position)
+            position -= read
+            file.seek(position)
+            buffer = file.read(read) + buffer
+            lines = buffer.split(b"\n")
+            line_end = position + len(buffer)
+            # The first piece may continue in the previous block, so keep it for the next read.
+            for line in reversed(lines[1:]):
+                start = line_end - len(line)
+                if line:
+                    yield start, line.decode("utf-8", errors="replace")
+                line_end = start - 1
+            buffer = lines[0]
+        if buffer:
+            yield 0, buffer.decode("utf-8", errors="replace")
+
+
+def tail(path=LOG_FILE, n=50, cursor=None, min_level=None, module=None, pool_id=None):
+    """
+    Returns the newest matching records of the log file, reading only as far back as needed.
+
+    Lines that do not start with a timestamp, such as traceback lines, belong to
+    the record above them. A cursor names the file by inode as well as the offset in
+    it; once the file has been rotated the cursor no longer applies and paging
+    starts again from the newest records.
+
+    :param cursor: "inode:offset" cursor returned by a previous call; only older records are returned
+    :return: Tuple of (entries oldest first, cursor for the next older page or None)
+    :raises ValueError: If the cursor is malformed
+    """
+    stat = os.stat(path)
+    end = None
+    if cursor is not None:
+        inode, _, offset = cursor.partition(":")
+        if not inode.isdigit() or not offset.isdigit():
+            raise ValueError(f"Invalid cursor: {cursor}")
+        if int(inode) == stat.st_ino and int(offset) <= stat.st_size:
+            end = int(offset)
+
+    entries = []
+    continuation = []
+    for offset, line in read_lines_backwards(path, end):
+        match = LINE_PATTERN.match(line)
+        if match is None:
+            continuation.append(line)
+            continue
+        time, level, name, message = match.groups()
+        if continuation:
+            message = "\n".join([message, *reversed(continuation)])
+            continuation = []
+        entry = {
+            "offset": offset,
+            "time": time,
+            "level": level,
+            "module": name,
+            "message": message,
+            "pool_id": find_pool_id(message),
+        }
+        if matches(entry, min_level, module, pool_id):
+            entries.append(entry)
+            if len(entries) == n:
+                next_cursor = f"{stat.st_ino}:{offset}" if offset > 0 else None
+                return entries[::-1], next_cursor
+    return entries[::-1], None
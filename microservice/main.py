@@ -1,8 +1,28 @@
-from scheduler import start_scheduler
-from fastapi import FastAPI, HTTPException
-from contract_service import create_pool, get_pool_details, finalize_pool
+from log_service import setup_logging, process_log_file
+
+# Before the service modules are imported, so that this process logs to its own file.
+LOG_PATH = process_log_file("api")
+setup_logging(LOG_PATH)
+
+from scheduler import start_scheduler, stop_scheduler
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from contract_service import create_pool, create_pools, validate_pool, finalize_pool, connect
+from clients import clients
+from config import MAX_BULK_POOLS, ASSET_ID
+from fastapi.responses import StreamingResponse
+from log_service import ring_buffer, tail, matches, level_number
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from typing import List, Optional
+from web3 import Web3
+import hashlib
+import json
 from price_monitor import check_pool_conditions
-from pydantic import BaseModel
+from pool_cache import pool_cache
+from pool_archive import pool_archive
+from price_service import price_service
+from tick_history import tick_store, unscale_price
+from notifier import notifier
+from pydantic import BaseModel, Field
 import uvicorn
 from event_listener import event_listener
 from contextlib import asynccontextmanager
@@ -10,20 +30,31 @@ import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    await connect()
     print("Starting WebSocket event listener...")
     loop = asyncio.get_event_loop()
     listener_task = loop.create_task(event_listener())
+    clients.receipt_tracker.start()
+    notifier.start()
     start_scheduler()
     yield
     print("Shutting down WebSocket event listener...")
     listener_task.cancel()
+    stop_scheduler()
+    clients.receipt_tracker.stop()
+    await price_service.close()
+    await notifier.close()
+    await clients.close()
 
 app = FastAPI(lifespan=lifespan)
 
+ASSET_PATTERN = r"^[a-z0-9-]+$"
+
 class PoolData(BaseModel):
     target_price: int
     stop_loss: int
     duration: int
+    asset: str = Field(ASSET_ID, pattern=ASSET_PATTERN)
 
 class PoolRequest(BaseModel):
     target_price: float
@@ -34,30 +65,108 @@ class FinalizeRequest(BaseModel):
     pool_id: int
     current_price: float
 
+def pool_args(pool_data: PoolData):
+    """Converts request pool data to contract arguments: prices in wei, duration in seconds."""
+    return pool_data.target_price * 10**18, pool_data.stop_loss * 10**18, pool_data.duration
+
 @app.post("/create_pool")
 async def create_pool_route(pool_data: PoolData):
-    result = create_pool(
-        pool_data.target_price * 10**18,
-        pool_data.stop_loss * 10**18,
-        pool_data.duration * 10**18
-    )
+    result = await create_pool(*pool_args(pool_data), asset=pool_data.asset)
 
-    if result["status"] == "success":
+    if result["status"] == "submitted":
         return result
     elif result["status"] == "failed":
         raise HTTPException(status_code=400, detail=result["message"])
     else:
         raise HTTPException(status_code=500, detail=result["message"])
 
+@app.post("/create_pools")
+async def create_pools_route(pools: List[PoolData]):
+    """Endpoint to create many pools in one pipelined transaction batch."""
+    if not pools:
+        raise HTTPException(status_code=400, detail="No pools given")
+    if len(pools) > MAX_BULK_POOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_POOLS} pools per request")
+
+    args = [pool_args(pool_data) for pool_data in pools]
+    errors = [{"index": i, "message": error} for i, error in enumerate(validate_pool(*pool) for pool in args) if error]
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    results = await create_pools(args, [pool_data.asset for pool_data in pools])
+    return {
+        "submitted": sum(1 for result in results if result["status"] == "submitted"),
+        "results": results
+    }
+
+@app.get("/price")
+async def get_price(asset: str = Query(ASSET_ID, pattern=ASSET_PATTERN)):
+    """Endpoint to get the current price of an asset and the age of the cached value."""
+    price = await price_service.get_price(asset=asset)
+    if price is None:
+        raise HTTPException(status_code=503, detail="Price unavailable")
+    return {"asset": asset, "price": price, "age": price_service.age(asset)}
+
+@app.get("/price/ohlc")
+async def get_price_ohlc(asset: str = Query(ASSET_ID, pattern=ASSET_PATTERN), start: float = Query(...),
+                         end: Optional[float] = None, interval: float = Query(60, gt=0)):
+    """Endpoint to get candles of the recorded price ticks of an asset, prices in wei."""
+    history = tick_store.find(asset)
+    if history is None:
+        raise HTTPException(status_code=404, detail="No price ticks recorded for this asset")
+    candles = history.ohlc(start, end, interval)
+    return [
+        {"time": float(t), **{field: unscale_price(candles[field][i]) for field in ("open", "high", "low", "close")}}
+        for i, t in enumerate(candles["time"])
+    ]
+
 @app.get("/get-pool/{pool_id}")
 async def get_pool(pool_id: int):
     """Endpoint to get details of a specific pool."""
-    pool_details = get_pool_details(pool_id)
+    pool_details = await pool_cache.get(pool_id)
     if pool_details:
-        return pool_details
+        return pool_details.as_dict()
     else:
         raise HTTPException(status_code=404, detail="Pool not found")
 
+def cached_json(request: Request, body, cache_control="no-cache"):
+    """Returns body as JSON with an ETag, or an empty 304 if the client already has it."""
+    content = json.dumps(body, separators=(",", ":"))
+    etag = f'"{hashlib.sha1(content.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+@app.get("/pools")
+async def list_pools(request: Request, creator: Optional[str] = None, asset: Optional[str] = None,
+                     outcome: Optional[str] = None,
+                     finalized: Optional[bool] = None, ends_after: Optional[int] = None,
+                     ends_before: Optional[int] = None, finalized_after: Optional[int] = None,
+                     finalized_before: Optional[int] = None, cursor: Optional[int] = None, limit: int = 100):
+    """Endpoint to list archived pools with filters and keyset pagination, without RPC calls."""
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    if creator is not None:
+        if not Web3.is_address(creator):
+            raise HTTPException(status_code=400, detail="Invalid creator address")
+        creator = Web3.to_checksum_address(creator)
+
+    pools, next_cursor = pool_archive.query(creator=creator, asset=asset, outcome=outcome, finalized=finalized,
+                                            ends_after=ends_after, ends_before=ends_before,
+                                            finalized_after=finalized_after, finalized_before=finalized_before,
+                                            cursor=cursor, limit=limit)
+    return cached_json(request, {"pools": pools, "next_cursor": next_cursor})
+
+@app.get("/pools/{pool_id}")
+async def get_archived_pool(request: Request, pool_id: int):
+    """Endpoint to get an archived pool; finalized pools never change and are cached permanently."""
+    pool = pool_archive.get(pool_id)
+    if pool is None:
+        raise HTTPException(status_code=404, detail="Pool not found")
+    cache_control = "public, max-age=31536000, immutable" if pool["is_finalized"] else "no-cache"
+    return cached_json(request, pool, cache_control)
+
 @app.post("/check-conditions/{pool_id}")
 async def check_conditions_route(pool_id: int):
     """Endpoint to check and finalize pool conditions manually."""
@@ -71,22 +180,80 @@ async def check_conditions_route(pool_id: int):
 async def finalize_existing_pool(request: FinalizeRequest):
     """Endpoint to manually finalize a pool."""
     current_price = int(request.current_price * 10**18)
-    txn_hash = finalize_pool(request.pool_id, current_price)
+    txn_hash = await finalize_pool(request.pool_id, current_price)
     if txn_hash:
-        return {"message": "Pool finalized successfully", "transaction_hash": txn_hash}
+        return {"message": "Pool finalization submitted", "transaction_hash": txn_hash}
     else:
         raise HTTPException(status_code=500, detail="Failed to finalize pool")
 
+@app.get("/tx/{tx_hash}")
+async def get_transaction(tx_hash: str):
+    """Endpoint to get the status of a submitted transaction."""
+    transaction = clients.receipt_tracker.get(tx_hash)
+    if transaction:
+        return transaction
+    else:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+
+@app.get("/metrics")
+async def get_metrics():
+    """Endpoint to expose RPC, loop and pool metrics in the Prometheus text format."""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def log_filters(level, module, pool_id):
+    try:
+        min_level = level_number(level) if level else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"min_level": min_level, "module": module, "pool_id": pool_id}
+
 @app.get("/logs")
-async def get_logs():
-    """Endpoint to fetch the latest logs from the microservice."""
+async def get_logs(n: int = 50, level: Optional[str] = None, module: Optional[str] = None,
+                   pool_id: Optional[int] = None, cursor: Optional[str] = None):
+    """Endpoint to fetch the latest logs, reading the log file backwards from the end or from the cursor."""
+    if not 1 <= n <= 1000:
+        raise HTTPException(status_code=400, detail="n must be between 1 and 1000")
+    filters = log_filters(level, module, pool_id)
     try:
-        with open("microservice.log", "r") as log_file:
-            logs = log_file.readlines()[-50:]
-            return {"logs": logs}
+        logs, next_cursor = await asyncio.to_thread(tail, LOG_PATH, n, cursor, **filters)
+        return {"logs": logs, "next_cursor": next_cursor}
+    except FileNotFoundError:
+        return {"logs": [], "next_cursor": None}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error reading logs: {str(e)}")
 
+@app.get("/logs/stream")
+async def stream_logs(request: Request, level: Optional[str] = None, module: Optional[str] = None,
+                      pool_id: Optional[int] = None):
+    """Endpoint to follow the logs live as Server-Sent Events, resuming after Last-Event-ID."""
+    filters = log_filters(level, module, pool_id)
+    last_event_id = request.headers.get("last-event-id", "")
+    after = int(last_event_id) if last_event_id.isdigit() else 0
+
+    async def events():
+        subscriber = ring_buffer.subscribe()
+        try:
+            # Entries logged after subscribing may also be in the backlog, so skip those seen already.
+            after_seq = after
+            for entry in ring_buffer.recent(after):
+                after_seq = entry["seq"]
+                if matches(entry, **filters):
+                    yield f"id: {entry['seq']}\ndata: {json.dumps(entry)}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    entry = await asyncio.wait_for(subscriber[1].get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if entry["seq"] > after_seq and matches(entry, **filters):
+                    yield f"id: {entry['seq']}\ndata: {json.dumps(entry)}\n\n"
+        finally:
+            ring_buffer.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     # start_scheduler()
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,114 @@
+from config import TRACE_SLOW_TICK
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram
+from web3.middleware import Web3Middleware
+import functools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+RPC_LATENCY = Histogram("rpc_request_seconds", "Latency of JSON-RPC round trips", ["method"])
+RPC_REQUESTS = Counter("rpc_requests", "JSON-RPC requests sent, counting each request in a batch", ["method"])
+RPC_ERRORS = Counter("rpc_errors", "JSON-RPC requests that failed or returned an error", ["method"])
+EXTERNAL_LATENCY = Histogram("external_request_seconds", "Latency of requests to external HTTP APIs", ["service"])
+EXTERNAL_ERRORS = Counter("external_errors", "Failed or rate limited requests to external HTTP APIs", ["service", "reason"])
+LOOP_DURATION = Histogram("loop_duration_seconds", "Duration of one iteration of a background loop", ["loop"],
+                          buckets=(.01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60))
+LOOP_RPC_CALLS = Histogram("loop_rpc_calls", "JSON-RPC round trips made by one iteration of a background loop", ["loop"],
+                           buckets=(0, 1, 2, 5, 10, 25, 50, 100))
+ACTIVE_POOLS = Gauge("active_pools", "Pools not yet finalized in the pool cache")
+PENDING_TRANSACTIONS = Gauge("pending_transactions", "Submitted transactions waiting for a receipt")
+BLOCK_LAG = Gauge("event_listener_block_lag", "Blocks between the chain head and the last block handled by the event listener")
+EVENT_LAG = Gauge("event_listener_lag_seconds", "Seconds between the last handled event's block and its handling")
+PRICE_AGE = Gauge("price_age_seconds", "Age of the cached asset price")
+NOTIFICATIONS = Counter("notifications", "Notifications handled by the dispatcher", ["outcome"])
+NOTIFICATION_QUEUE = Gauge("notification_queue_size", "Notifications waiting to be dispatched")
+FINALIZATIONS = Counter("finalizations", "Pool finalization requests by what became of them", ["outcome"])
+IN_FLIGHT_FINALIZATIONS = Gauge("in_flight_finalizations", "Pools whose resolvePool transaction is not yet mined")
+RPC_ROUTING = Counter("rpc_routing", "Hedges, failovers and circuit breaker trips of the RPC router", ["endpoint", "event"])
+RPC_ENDPOINT_LATENCY = Gauge("rpc_endpoint_latency_seconds", "Rolling average latency of each RPC endpoint", ["endpoint"])
+
+_spans = ContextVar("spans", default=None)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Records how long a block takes as part of the current loop iteration, if any."""
+    spans = _spans.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if spans is not None:
+            spans.append((name, time.perf_counter() - started, attributes))
+
+
+@contextmanager
+def tick(loop):
+    """
+    Times one iteration of a background loop and collects the spans recorded during it.
+
+    Iterations slower than TRACE_SLOW_TICK seconds are logged with their slowest spans.
+
+    :param loop: Name of the loop, used as the metric label
+    """
+    spans = []
+    token = _spans.set(spans)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        _spans.reset(token)
+        LOOP_DURATION.labels(loop).observe(duration)
+        LOOP_RPC_CALLS.labels(loop).observe(sum(1 for name, _, _ in spans if name.startswith("rpc:")))
+        if duration >= TRACE_SLOW_TICK:
+            slowest = sorted(spans, key=lambda span: span[1], reverse=True)[:5]
+            breakdown = ", ".join(
+                f"{name} {seconds:.3f}s" + (f" {attributes}" if attributes else "")
+                for name, seconds, attributes in slowest
+            )
+            logger.warning(f"Slow {loop} iteration took {duration:.3f}s: {breakdown}")
+
+
+def timed(loop):
+    """Decorates an async function so that every call is measured as one iteration of loop."""
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with tick(loop):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def observe_rpc(method, count=1):
+    """Times one JSON-RPC round trip carrying count requests."""
+    attributes = {"requests": count} if count > 1 else {}
+    with span(f"rpc:{method}", **attributes):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            RPC_ERRORS.labels(method).inc()
+            raise
+        finally:
+            RPC_LATENCY.labels(method).observe(time.perf_counter() - started)
+
+
+class RpcMetricsMiddleware(Web3Middleware):
+    """Records latency and errors of every request made through an AsyncWeb3 instance."""
+
+    async def async_wrap_make_request(self, make_request):
+        async def middleware(method, params):
+            RPC_REQUESTS.labels(method).inc()
+            with observe_rpc(method):
+                response = await make_request(method, params)
+            if isinstance(response, dict) and "error" in response:
+                RPC_ERRORS.labels(method).inc()
+            return response
+
+        return middleware
@@ -0,0 +1,210 @@
+from config import (DISCORD_WEBHOOK_URL, NOTIFY_WEBHOOKS, NOTIFY_COALESCE_WINDOW, NOTIFY_QUEUE_SIZE,
+                    NOTIFY_RESOLVE_TTL)
+from metrics import EXTERNAL_LATENCY, EXTERNAL_ERRORS, NOTIFICATIONS, NOTIFICATION_QUEUE, span
+from collections import Counter
+import asyncio
+import httpx
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PRICE_CHANNEL = "price-updates"
+POOL_CHANNEL = "pool-updates"
+MAX_MESSAGE_LENGTH = 2000
+MAX_ATTEMPTS = 3
+GLOBAL_BUCKET = None
+
+
+def parse_webhooks(spec):
+    """Parses 'channel=url,channel=url' into a dictionary."""
+    webhooks = {}
+    for item in spec.split(","):
+        channel, _, url = item.strip().partition("=")
+        if channel and url:
+            webhooks[channel] = url
+    return webhooks
+
+
+def split_digest(lines, limit=MAX_MESSAGE_LENGTH):
+    """Joins lines into as few messages as fit Discord's length limit, truncating any single line that does not."""
+    messages, current = [], ""
+    for line in lines:
+        line = line if len(line) <= limit else line[:limit - 3] + "..."
+        if current and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Notifier:
+    """
+    Queued, coalescing Discord notification dispatcher.
+
+    notify() never waits: events go onto a bounded queue, and when it is full new
+    events are dropped and counted rather than slowing down the caller. One
+    background task collects the events of each NOTIFY_COALESCE_WINDOW into a
+    digest per channel, where events sharing a key keep only the latest, and sends
+    it through one pooled HTTP client. Webhook rate-limit headers are obeyed by
+    waiting, which lets the next digest absorb whatever arrives meanwhile.
+    """
+
+    def __init__(self, webhooks=None, default_webhook=DISCORD_WEBHOOK_URL, window=NOTIFY_COALESCE_WINDOW,
+                 queue_size=NOTIFY_QUEUE_SIZE, transport=None):
+        self.webhooks = parse_webhooks(NOTIFY_WEBHOOKS) if webhooks is None else webhooks
+        self.default_webhook = default_webhook
+        self.window = window
+        self._queue = asyncio.Queue(queue_size)
+        self._transport = transport
+        self._client = None
+        self._bot = None
+        self._destinations = {}
+        self._blocked_until = {}
+        self._dropped = Counter()
+        self._seq = itertools.count()
+        self._task = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10, transport=self._transport)
+        return self._client
+
+    def attach_bot(self, bot):
+        """Lets channels without a configured webhook be resolved by name through a logged in discord.py bot."""
+        self._bot = bot
+        self._destinations.clear()
+
+    def notify(self, channel, message, key=None):
+        """
+        Queues a message for a channel without waiting.
+
+        :param channel: Channel name, e.g. PRICE_CHANNEL
+        :param message: Message text
+        :param key: Optional key; a newer message with the same key replaces a pending one
+        :return: False if the queue was full and the message was dropped
+        """
+        try:
+            self._queue.put_nowait((channel, message, key))
+            return True
+        except asyncio.QueueFull:
+            self._dropped[channel] += 1
+            NOTIFICATIONS.labels("dropped").inc()
+            return False
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _run(self):
+        while True:
+            pending = {}
+            self._add(pending, *await self._queue.get())
+            await asyncio.sleep(self.window)
+            while not self._queue.empty():
+                self._add(pending, *self._queue.get_nowait())
+
+            for channel, messages in pending.items():
+                lines = list(messages.values())
+                dropped = self._dropped.pop(channel, 0)
+                if dropped:
+                    lines.append(f"({dropped} more updates were dropped while the queue was full)")
+                try:
+                    await self._send(channel, lines)
+                except Exception as e:
+                    NOTIFICATIONS.labels("failed").inc(len(messages))
+                    logger.error(f"Error sending notifications to {channel}: {str(e)}")
+
+    def _add(self, pending, channel, message, key):
+        messages = pending.setdefault(channel, {})
+        if key is None:
+            key = next(self._seq)
+        else:
+            # Move a replaced message to the end so the digest keeps arrival order.
+            messages.pop(key, None)
+        messages[key] = message
+
+    async def _send(self, channel, lines):
+        destination = self._resolve(channel)
+        if destination is None:
+            NOTIFICATIONS.labels("unrouted").inc(len(lines))
+            logger.debug(f"No webhook or bot channel for {channel}, dropping {len(lines)} notifications.")
+            return
+        for content in split_digest(lines):
+            if isinstance(destination, str):
+                await self._post_webhook(destination, content)
+            else:
+                # discord.py waits out its own rate limits.
+                await destination.send(content)
+        NOTIFICATIONS.labels("sent").inc(len(lines))
+
+    def _resolve(self, channel):
+        """Returns the webhook URL or bot channel for a channel name, caching the lookup."""
+        cached = self._destinations.get(channel)
+        if cached is not None and time.monotonic() - cached[1] < NOTIFY_RESOLVE_TTL:
+            return cached[0]
+
+        destination = self.webhooks.get(channel)
+        if destination is None and self._bot is not None:
+            destination = next((c for c in self._bot.get_all_channels() if c.name == channel), None)
+        if destination is None:
+            destination = self.default_webhook
+        self._destinations[channel] = (destination, time.monotonic())
+        return destination
+
+    async def _post_webhook(self, url, content):
+        for attempt in range(MAX_ATTEMPTS):
+            delay = max(self._blocked_until.get(url, 0), self._blocked_until.get(GLOBAL_BUCKET, 0)) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            with span("discord"), EXTERNAL_LATENCY.labels("discord").time():
+                response = await self.client.post(url, json={"content": content})
+            self._update_rate_limit(url, response)
+            if response.status_code == 429:
+                EXTERNAL_ERRORS.labels("discord", "rate_limited").inc()
+                logger.warning(f"Discord webhook rate limited (attempt {attempt + 1} of {MAX_ATTEMPTS}).")
+                continue
+            response.raise_for_status()
+            return
+        raise RuntimeError(f"Discord webhook still rate limited after {MAX_ATTEMPTS} attempts")
+
+    def _update_rate_limit(self, url, response):
+        headers = response.headers
+        retry_after = None
+        if response.status_code == 429:
+            retry_after = headers.get("Retry-After")
+            try:
+                retry_after = response.json().get("retry_after", retry_after)
+            except ValueError:
+                pass
+        elif headers.get("X-RateLimit-Remaining") == "0":
+            retry_after = headers.get("X-RateLimit-Reset-After")
+        if retry_after is None:
+            return
+        try:
+            retry_after = float(retry_after)
+        except ValueError:
+            return
+        bucket = GLOBAL_BUCKET if headers.get("X-RateLimit-Global") == "true" else url
+        self._blocked_until[bucket] = time.monotonic() + retry_after
+
+
+notifier = Notifier()
+NOTIFICATION_QUEUE.set_function(notifier.__len__)
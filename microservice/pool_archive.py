@@ -0,0 +1,213 @@
+from config import POOL_ARCHIVE_PATH, ASSET_ID
+from contract_service import PoolRecord
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pools (
+    pool_id INTEGER PRIMARY KEY,
+    creator TEXT NOT NULL,
+    target_price TEXT NOT NULL,
+    stop_loss TEXT NOT NULL,
+    end_time INTEGER NOT NULL,
+    created_block INTEGER,
+    created_at INTEGER,
+    is_finalized INTEGER NOT NULL DEFAULT 0,
+    final_price TEXT NOT NULL DEFAULT '0',
+    outcome TEXT NOT NULL DEFAULT '',
+    finalized_block INTEGER,
+    finalized_at INTEGER,
+    asset TEXT,
+    created_tx TEXT
+);
+CREATE TABLE IF NOT EXISTS transaction_assets (
+    transaction_hash TEXT PRIMARY KEY,
+    asset TEXT NOT NULL
+);
+"""
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS pools_creator ON pools (creator, pool_id);
+CREATE INDEX IF NOT EXISTS pools_outcome ON pools (outcome, finalized_at);
+CREATE INDEX IF NOT EXISTS pools_end_time ON pools (is_finalized, end_time);
+CREATE INDEX IF NOT EXISTS pools_finalized_at ON pools (finalized_at);
+CREATE INDEX IF NOT EXISTS pools_asset ON pools (asset, pool_id);
+CREATE INDEX IF NOT EXISTS pools_created_tx ON pools (created_tx);
+"""
+
+SQL_VARIABLE_LIMIT = 900
+
+# Columns added after the first release, with the statement that adds them to older archives.
+MIGRATIONS = (
+    ("asset", "ALTER TABLE pools ADD COLUMN asset TEXT"),
+    ("created_tx", "ALTER TABLE pools ADD COLUMN created_tx TEXT"),
+)
+
+COLUMNS = ("pool_id", "creator", "target_price", "stop_loss", "end_time", "created_block", "created_at",
+           "is_finalized", "final_price", "outcome", "finalized_block", "finalized_at", "asset", "created_tx")
+
+
+class PoolArchive:
+    """
+    Persistent SQLite archive of every pool seen in contract events.
+
+    Rows are written by the event listener and never read from the chain, so list
+    queries cost no RPC calls. Finalized rows never change once written.
+    Uint256 values are stored as decimal text to keep their full precision.
+
+    The contract does not know which asset a pool tracks, so the asset chosen at
+    creation is recorded here against the creating transaction and attached to
+    the pool when its PoolCreated event arrives, in whichever order the two come.
+    """
+
+    def __init__(self, path=POOL_ARCHIVE_PATH):
+        self.path = path
+        self._db = None
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(SCHEMA)
+            self._migrate()
+            self._db.executescript(INDEXES)
+        return self._db
+
+    def _migrate(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(pools)")}
+        for column, statement in MIGRATIONS:
+            if column not in columns:
+                self._db.execute(statement)
+        self._db.execute("UPDATE pools SET asset = ? WHERE asset IS NULL", (ASSET_ID,))
+        self._db.commit()
+
+    def record_created(self, pool_id, creator, target_price, stop_loss, end_time, block_number=None, timestamp=None,
+                       transaction_hash=None, asset=None):
+        """
+        Archives a created pool.
+
+        :param transaction_hash: Creating transaction, used to look up the asset tagged with tag_transaction
+        :param asset: Asset of the pool; defaults to the tagged asset, then to the archived one, then to ASSET_ID
+        :return: The asset of the pool
+        """
+        if asset is None and transaction_hash is not None:
+            asset = self.transaction_asset(transaction_hash)
+        self.db.execute(
+            "INSERT INTO pools (pool_id, creator, target_price, stop_loss, end_time, created_block, created_at, "
+            "created_tx, asset) VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(?, ?)) "
+            "ON CONFLICT (pool_id) DO UPDATE SET creator = excluded.creator, target_price = excluded.target_price, "
+            "stop_loss = excluded.stop_loss, end_time = excluded.end_time, "
+            "created_block = COALESCE(excluded.created_block, created_block), "
+            "created_at = COALESCE(excluded.created_at, created_at), "
+            "created_tx = COALESCE(excluded.created_tx, created_tx), asset = COALESCE(?, asset)",
+            (pool_id, creator, str(target_price), str(stop_loss), end_time, block_number, timestamp,
+             transaction_hash, asset, ASSET_ID, asset)
+        )
+        return self.asset(pool_id)
+
+    def tag_transaction(self, transaction_hash, asset):
+        """
+        Records the asset of the pool created by a transaction.
+
+        :return: Ids of already archived pools created by the transaction, whose asset was updated
+        """
+        self.db.execute("INSERT OR REPLACE INTO transaction_assets (transaction_hash, asset) VALUES (?, ?)",
+                        (transaction_hash, asset))
+        pool_ids = [row[0] for row in self.db.execute("SELECT pool_id FROM pools WHERE created_tx = ?",
+                                                      (transaction_hash,))]
+        if pool_ids:
+            self.db.execute("UPDATE pools SET asset = ? WHERE created_tx = ?", (asset, transaction_hash))
+        self.db.commit()
+        return pool_ids
+
+    def transaction_asset(self, transaction_hash):
+        row = self.db.execute("SELECT asset FROM transaction_assets WHERE transaction_hash = ?",
+                              (transaction_hash,)).fetchone()
+        return row[0] if row else None
+
+    def asset(self, pool_id):
+        """Returns the asset of a pool, ASSET_ID if it is not archived."""
+        return self.assets([pool_id])[pool_id]
+
+    def assets(self, pool_ids):
+        """Returns {pool id: asset} for the given pools, ASSET_ID for those not archived."""
+        pool_ids = list(pool_ids)
+        assets = dict.fromkeys(pool_ids, ASSET_ID)
+        for start in range(0, len(pool_ids), SQL_VARIABLE_LIMIT):
+            chunk = pool_ids[start:start + SQL_VARIABLE_LIMIT]
+            assets.update(self.db.execute(
+                f"SELECT pool_id, asset FROM pools WHERE pool_id IN ({', '.join('?' * len(chunk))})", chunk
+            ).fetchall())
+        return assets
+
+    def record_finalized(self, pool_id, final_price, outcome, block_number=None, timestamp=None):
+        """Marks an archived pool as finalized; returns False if the pool is not archived."""
+        cursor = self.db.execute(
+            "UPDATE pools SET is_finalized = 1, final_price = ?, outcome = ?, finalized_block = ?, finalized_at = ? "
+            "WHERE pool_id = ?",
+            (str(final_price), outcome, block_number, timestamp, pool_id)
+        )
+        return cursor.rowcount > 0
+
+    def record_pool(self, pool, block_number=None, timestamp=None):
+        """Archives a full PoolRecord, e.g. one finalized before the archive saw it created."""
+        self.record_created(pool.pool_id, pool.creator, pool.target_price, pool.stop_loss, pool.end_time)
+        if pool.is_finalized:
+            self.record_finalized(pool.pool_id, pool.final_price, pool.outcome, block_number, timestamp)
+
+    def commit(self):
+        self.db.commit()
+
+    def _row(self, row):
+        pool = dict(zip(COLUMNS, row))
+        for key in ("target_price", "stop_loss", "final_price"):
+            pool[key] = int(pool[key])
+        pool["is_finalized"] = bool(pool["is_finalized"])
+        return pool
+
+    def get(self, pool_id):
+        """Returns the archived pool as a dictionary, or None."""
+        row = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM pools WHERE pool_id = ?", (pool_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def get_record(self, pool_id):
+        """Returns the archived pool as a PoolRecord, or None."""
+        pool = self.get(pool_id)
+        if pool is None:
+            return None
+        return PoolRecord(*(pool[field] for field in PoolRecord._fields))
+
+    def query(self, creator=None, asset=None, outcome=None, finalized=None, ends_after=None, ends_before=None,
+              finalized_after=None, finalized_before=None, cursor=None, limit=100):
+        """
+        Lists archived pools ordered by pool id, using keyset pagination.
+
+        :param cursor: Return only pools with an id greater than this
+        :param limit: Maximum number of pools to return
+        :return: Tuple of (list of pool dictionaries, next cursor or None)
+        """
+        clauses, params = [], []
+        for clause, value in (("creator = ?", creator), ("asset = ?", asset), ("outcome = ?", outcome),
+                              ("is_finalized = ?", None if finalized is None else int(finalized)),
+                              ("end_time >= ?", ends_after), ("end_time < ?", ends_before),
+                              ("finalized_at >= ?", finalized_after), ("finalized_at < ?", finalized_before),
+                              ("pool_id > ?", cursor)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self.db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM pools {where} ORDER BY pool_id LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        pools = [self._row(row) for row in rows]
+        next_cursor = pools[-1]["pool_id"] if len(pools) == limit else None
+        return pools, next_cursor
+
+
+pool_archive = PoolArchive()
@@ -0,0 +1,347 @@
+from contract_service import get_pool_details_many, PoolRecord
+from clients import clients
+from trigger_index import TriggerIndex, evaluate, TARGET_REACHED, STOP_LOSS_HIT
+from tick_history import TARGET_CROSSED, STOP_CROSSED, unscale_price
+from pool_archive import pool_archive
+from metrics import ACTIVE_POOLS, timed
+from config import ASSET_ID
+from collections import defaultdict
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PoolCache:
+    """
+    Process-local mirror of on-chain pool state.
+
+    Seeded once from the contract, then kept current from PoolCreated/PoolFinalized
+    events. A periodic reconcile against the chain corrects any drift. Events that
+    arrive while a seed or reconcile is loading the chain are journaled and applied
+    again over the loaded snapshot, which may predate them.
+
+    Active pools are indexed per asset, with the asset taken from the pool archive,
+    so a price tick for one asset only touches that asset's pools. Given a tick
+    history, a pool is tested against every tick since it was last checked, or since
+    the mirror first saw it, rather than the spot price alone. A pool that triggered
+    keeps its window until its PoolFinalized event arrives, so a crossing whose
+    finalization failed or was dropped is found again by the next check.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._active = set()
+        self._assets = {}
+        self._indexes = defaultdict(TriggerIndex)
+        self._seen_at = {}
+        self._checked_at = {}
+        self._pending = {}
+        self._seed_lock = asyncio.Lock()
+        self._journals = []
+        self._callbacks = []
+        self._owns = None
+        self._pool_counter = 0
+        self.is_seeded = False
+
+    def add_callback(self, callback):
+        """Registers callback() to run whenever pools are added to the active set."""
+        self._callbacks.append(callback)
+
+    def _notify(self):
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in pool cache callback: {str(e)}")
+
+    def _owned(self, pool_id):
+        return self._owns is None or self._owns(pool_id)
+
+    def set_shard(self, owns):
+        """
+        Restricts the mirror to the pools for which owns(pool_id) is true; None mirrors every pool.
+
+        Pools leaving the shard are dropped at once; pools joining it are loaded by the next seed.
+        """
+        self._owns = owns
+        self._active = {pool_id for pool_id in self._active if self._owned(pool_id)}
+        self._rebuild_index()
+        self.is_seeded = False
+
+    async def _load_from_chain(self):
+        """Fetch the active pool ids in the shard and their details from the contract."""
+        pool_ids = [pool_id for pool_id in await clients.contract.functions.getActivePools().call() if self._owned(pool_id)]
+        pools = await get_pool_details_many(pool_ids)
+        self._assets.update(pool_archive.assets(pools))
+        return pools
+
+    async def _journaled(self, load):
+        """
+        Awaits a chain load while recording the events applied meanwhile.
+
+        :param load: Awaitable loading a snapshot of the chain
+        :return: Tuple of (the load's result, list of (handler name, args) events to replay over it)
+        """
+        journal = []
+        self._journals.append(journal)
+        try:
+            return await load, journal
+        finally:
+            self._journals.remove(journal)
+
+    def _record(self, event, *args):
+        for journal in self._journals:
+            journal.append((event, args))
+
+    def _replay(self, journal):
+        for event, args in journal:
+            getattr(self, event)(*args)
+
+    def _rebuild_index(self):
+        by_asset = defaultdict(list)
+        now = time.time()
+        for pool_id in self._active:
+            self._seen_at.setdefault(pool_id, now)
+            pool = self._pools[pool_id]
+            by_asset[self.asset_of(pool_id)].append((pool_id, pool.target_price, pool.stop_loss, pool.end_time))
+        self._pending = {pool_id: start for pool_id, start in self._pending.items() if pool_id in self._active}
+        self._indexes = defaultdict(TriggerIndex)
+        for asset, pools in by_asset.items():
+            self._indexes[asset].rebuild(pools)
+
+    def _index_add(self, pool_id):
+        pool = self._pools[pool_id]
+        self._seen_at.setdefault(pool_id, time.time())
+        self._indexes[self.asset_of(pool_id)].add(pool_id, pool.target_price, pool.stop_loss, pool.end_time)
+
+    def _index_remove(self, pool_id):
+        index = self._indexes.get(self.asset_of(pool_id))
+        if index is not None:
+            index.remove(pool_id)
+            if not index:
+                del self._indexes[self.asset_of(pool_id)]
+
+    def asset_of(self, pool_id):
+        return self._assets.get(pool_id, ASSET_ID)
+
+    def set_asset(self, pool_id, asset):
+        """Moves a pool to another asset's index, e.g. once its creating transaction is tagged."""
+        active = pool_id in self._active
+        if active:
+            self._index_remove(pool_id)
+        self._assets[pool_id] = asset
+        if active:
+            self._index_add(pool_id)
+            self._notify()
+
+    def tag_transaction(self, transaction_hash, asset):
+        """Records the asset of the pool created by a transaction, whether or not its event has arrived."""
+        for pool_id in pool_archive.tag_transaction(transaction_hash, asset):
+            self.set_asset(pool_id, asset)
+
+    async def seed(self):
+        """Replace the mirror with a full load of the active pools."""
+        async def load():
+            return await clients.contract.functions.poolCounter().call(), await self._load_from_chain()
+
+        (pool_counter, pools), journal = await self._journaled(load())
+        self._pool_counter = pool_counter
+        self._pools.update(pools)
+        self._active = {pool_id for pool_id, pool in pools.items() if not pool.is_finalized}
+        self._rebuild_index()
+        self._replay(journal)
+        self.is_seeded = True
+        logger.info(f"Pool cache seeded with {len(self._active)} active pools.")
+        self._notify()
+
+    async def ensure_seeded(self):
+        async with self._seed_lock:
+            if not self.is_seeded:
+                await self.seed()
+
+    def __len__(self):
+        return len(self._active)
+
+    @timed("reconcile_pools")
+    async def reconcile(self):
+        """Compare the mirror with the chain and correct any drift."""
+        try:
+            pools, journal = await self._journaled(self._load_from_chain())
+        except Exception as e:
+            logger.error(f"Error reconciling pool cache: {str(e)}")
+            return
+
+        before = self._active
+        chain_active = {pool_id for pool_id, pool in pools.items() if not pool.is_finalized}
+        changed = {pool_id for pool_id in chain_active & before if self._pools.get(pool_id) != pools[pool_id]}
+        self._pools.update(pools)
+        for pool_id in before - chain_active:
+            self._pools.pop(pool_id, None)
+        self._active = chain_active
+        self._rebuild_index()
+        self._replay(journal)
+        self.is_seeded = True
+
+        missing = self._active - before
+        stale = before - self._active
+
+        if missing or stale or changed:
+            logger.warning(f"Pool cache drift corrected: {len(missing)} missing, {len(stale)} stale, {len(changed)} changed.")
+            self._notify()
+        else:
+            logger.info(f"Pool cache reconciled: {len(chain_active)} active pools, no drift.")
+
+    async def refresh(self):
+        """Load the pools created since the last seed or refresh, reading only those in the shard."""
+        await self.ensure_seeded()
+        pool_counter = await clients.contract.functions.poolCounter().call()
+        pool_ids = [pool_id for pool_id in range(self._pool_counter, pool_counter) if self._owned(pool_id)]
+        if pool_ids:
+            pools = await get_pool_details_many(pool_ids)
+            self._assets.update(pool_archive.assets(pools))
+            for pool_id, pool in pools.items():
+                self._pools[pool_id] = pool
+                if not pool.is_finalized:
+                    self._active.add(pool_id)
+                    self._index_add(pool_id)
+            self._notify()
+        self._pool_counter = pool_counter
+
+    def discard(self, pool_id):
+        """Drop a pool from the active set without finalizing it, e.g. once its resolution is handed off."""
+        if pool_id in self._active:
+            self._active.discard(pool_id)
+            self._index_remove(pool_id)
+        self._seen_at.pop(pool_id, None)
+        self._pending.pop(pool_id, None)
+
+    def on_pool_created(self, pool_id, creator, target_price, stop_loss, end_time, asset=ASSET_ID):
+        self._record("on_pool_created", pool_id, creator, target_price, stop_loss, end_time, asset)
+        if not self._owned(pool_id):
+            return
+        if pool_id in self._active:
+            self._index_remove(pool_id)
+        self._pools[pool_id] = PoolRecord(pool_id, creator, target_price, stop_loss, end_time, False, 0, "")
+        self._assets[pool_id] = asset
+        self._active.add(pool_id)
+        self._index_add(pool_id)
+        self._notify()
+
+    def on_pool_finalized(self, pool_id, final_price, outcome):
+        self._record("on_pool_finalized", pool_id, final_price, outcome)
+        pool = self._pools.get(pool_id)
+        if pool is not None:
+            self._pools[pool_id] = pool._replace(is_finalized=True, final_price=final_price, outcome=outcome)
+        if pool_id in self._active:
+            self._active.discard(pool_id)
+            self._index_remove(pool_id)
+        self._seen_at.pop(pool_id, None)
+        self._pending.pop(pool_id, None)
+
+    async def get(self, pool_id):
+        """Return the details of a pool, falling back to the archive and then the chain for unknown pools."""
+        pool = self._pools.get(pool_id)
+        if pool is not None:
+            return pool
+
+        pool = pool_archive.get_record(pool_id)
+        if pool is not None and pool.is_finalized:
+            return pool
+
+        try:
+            pool = (await get_pool_details_many([pool_id])).get(pool_id)
+        except Exception as e:
+            logger.error(f"Error retrieving pool {pool_id}: {str(e)}")
+            return None
+        if pool is not None:
+            self._pools.setdefault(pool_id, pool)
+        return pool
+
+    async def active_pools(self):
+        """Return a snapshot of the active pools as (pool_id, details) pairs."""
+        await self.ensure_seeded()
+        return [(pool_id, self._pools[pool_id]) for pool_id in sorted(self._active)]
+
+    async def assets(self):
+        """Return the assets that have active pools."""
+        await self.ensure_seeded()
+        return set(self._indexes)
+
+    async def nearest_triggers(self, prices, now):
+        """
+        Return the thresholds that will fire next for each asset.
+
+        :param prices: Dictionary of asset to current price in wei
+        :return: Dictionary of asset to a (target price, stop loss, end time) tuple, for the assets with a price
+        """
+        await self.ensure_seeded()
+        return {asset: index.nearest(prices[asset], now) for asset, index in self._indexes.items()
+                if prices.get(asset) is not None}
+
+    async def triggered_pools(self, prices, now, ticks=None):
+        """
+        Return the active pools whose thresholds are crossed at the given prices and time.
+
+        Only the indexes of the assets in prices are consulted; assets whose price is
+        None are skipped.
+
+        :param prices: Dictionary of asset to current price in wei
+        :param ticks: Optional TickStore holding the current prices as its newest ticks; when
+                      given, each pool is also tested against the high and low of the ticks
+                      since it was last checked
+        :return: List of (pool_id, details, outcome, price) tuples, price being the one to resolve the pool with
+        """
+        await self.ensure_seeded()
+        triggered = []
+        for asset, price in prices.items():
+            index = self._indexes.get(asset)
+            if index is None or price is None:
+                continue
+            if ticks is None:
+                hits = [(pool_id, outcome, price) for pool_id, outcome in index.triggered(price, now).items()]
+            else:
+                hits = self._crossed_since_check(asset, index, ticks.history(asset), price, now)
+            triggered.extend((pool_id, self._pools[pool_id], outcome, resolve_price)
+                             for pool_id, outcome, resolve_price in hits)
+        return triggered
+
+    def _crossed_since_check(self, asset, index, history, price, now):
+        checked_at = self._checked_at.get(asset, -math.inf)
+        high, low = history.high_low(start=checked_at)
+        self._checked_at[asset] = history.last_time or checked_at
+        if high is None:
+            high, low = -1, math.inf
+
+        # The index narrows the pools down to those the extremes of the whole interval could
+        # resolve; each of them is then tested against its own window in one array operation.
+        # Pools that triggered before but are not finalized yet are tested over their old window again.
+        pool_ids = sorted(index.crossed(high, low, now) | {pool_id for pool_id in self._pending if pool_id in index})
+        if not pool_ids:
+            return []
+        thresholds = [index.thresholds(pool_id) for pool_id in pool_ids]
+        starts = [self._pending.get(pool_id, max(checked_at, self._seen_at.get(pool_id, checked_at)))
+                  for pool_id in pool_ids]
+        ends = [end_time if end_time <= now else math.inf for _, _, end_time in thresholds]
+        crossings, crossing_prices = history.crossings(starts, ends, [tp for tp, _, _ in thresholds],
+                                                       [sl for _, sl, _ in thresholds])
+
+        hits = []
+        for pool_id, start, (tp, sl, end_time), crossing, crossing_price in zip(pool_ids, starts, thresholds,
+                                                                               crossings, crossing_prices):
+            if crossing == TARGET_CROSSED:
+                hits.append((pool_id, TARGET_REACHED, unscale_price(crossing_price)))
+            elif crossing == STOP_CROSSED:
+                hits.append((pool_id, STOP_LOSS_HIT, unscale_price(crossing_price)))
+            else:
+                outcome = evaluate(price, now, tp, sl, end_time)
+                if outcome is None:
+                    continue
+                hits.append((pool_id, outcome, price))
+            self._pending[pool_id] = start
+        return hits
+
+pool_cache = PoolCache()
+ACTIVE_POOLS.set_function(pool_cache.__len__)
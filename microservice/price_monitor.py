@@ -1,91 +1,93 @@
-import httpx
-from contract_service import get_pool_details, finalize_pool, contract
-from config import COINGECKO_API_URL, ASSET_ID
+from contract_service import finalize_pools
+from pool_cache import pool_cache
+from trigger_index import evaluate
+from price_service import price_service
+from tick_history import tick_store
+from metrics import span, timed
 import logging
 import time
 from web3 import Web3
 
 logger = logging.getLogger(__name__)
 
-async def get_current_price():
-    """Fetch the current price of the asset from CoinGecko API."""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(f"{COINGECKO_API_URL}/simple/price", params={
-                'ids': ASSET_ID,
-                'vs_currencies': 'usd'
-            })
-            response.raise_for_status()
-            price = response.json()[ASSET_ID]['usd']
-            logger.info(f"Fetched current price: ${price}")
-            price_in_wei = Web3.to_wei(price, 'ether')
-            return price_in_wei
-    except Exception as e:
-        logger.error(f"Error fetching price: {str(e)}")
-        return None
+async def get_current_price(max_age=None, asset=None):
+    """Fetch the current price of an asset, ASSET_ID by default, through the shared price service."""
+    return await price_service.get_price(max_age, asset)
 
-def get_active_pools():
-    """Retrieve active pools from the smart contract using Web3.py."""
-    try:
-        pool_ids = contract.functions.getActivePools().call()
+async def get_current_prices(max_age=None):
+    """
+    Fetch the current prices of every asset with active pools in one request, recording them as ticks.
 
-        active_pools = []
-        for pool_id in pool_ids:
-            pool_details = get_pool_details(pool_id)
-            if pool_details:
-                active_pools.append({
-                    "pool_id": pool_id,
-                    "tp": pool_details['target_price'],
-                    "sl": pool_details['stop_loss'],
-                    "end_time": pool_details['end_time']
-                })
+    Ticks are stamped with the time each price was fetched, so a price served again from
+    the cache, or during a rate limit backoff, is not recorded as a new observation.
+    """
+    prices = await price_service.get_prices(await pool_cache.assets(), max_age)
+    tick_store.record({asset: (price, price_service.fetched_at(asset)) for asset, price in prices.items()
+                       if price is not None})
+    return prices
 
-        logger.info(f"Retrieved active pools: {active_pools}")
+async def get_active_pools():
+    """Retrieve active pools from the in-memory pool mirror."""
+    try:
+        active_pools = [{
+            "pool_id": pool_id,
+            "asset": pool_cache.asset_of(pool_id),
+            "tp": pool_details.target_price,
+            "sl": pool_details.stop_loss,
+            "end_time": pool_details.end_time
+        } for pool_id, pool_details in await pool_cache.active_pools()]
+
+        logger.info(f"Retrieved {len(active_pools)} active pools.")
         return active_pools
     except Exception as e:
         logger.error(f"Error retrieving active pools: {str(e)}")
         return []
 
+@timed("check_pool_conditions")
 async def check_pool_conditions(pool_id=None):
     """Checks the conditions of active pools and finalizes them if necessary."""
     try:
-        current_price_in_wei = await get_current_price()
-        if current_price_in_wei is None:
-            return {"status": "error", "message": "Failed to fetch current price."}
-
+        now = int(time.time())
         if pool_id is None:
-            active_pools = get_active_pools()
+            prices = await get_current_prices()
+            missing = [asset for asset, price in prices.items() if price is None]
+            if missing and len(missing) == len(prices):
+                return {"status": "error", "message": "Failed to fetch current price."}
+            if missing:
+                logger.warning(f"No current price for {', '.join(sorted(missing))}, skipping their pools.")
+            with span("triggered_pools", active=len(pool_cache), assets=len(prices)):
+                triggered_pools = await pool_cache.triggered_pools(prices, now, tick_store)
         else:
-            active_pools = [{"pool_id": pool_id, \
-                             "tp": get_pool_details(pool_id)['target_price'], \
-                                "sl": get_pool_details(pool_id)['stop_loss'], \
-                                    "end_time": get_pool_details(pool_id)['end_time']}]
-
-        for pool in active_pools:
-            pool_details = get_pool_details(pool['pool_id'])
-            if pool_details['is_finalized']:
-                logger.info(f"Pool {pool['pool_id']} is already finalized. Skipping...")
-                continue
+            pool_details = await pool_cache.get(pool_id)
+            if pool_details is None:
+                return {"status": "error", "message": f"Pool {pool_id} does not exist."}
+            if pool_details.is_finalized:
+                logger.info(f"Pool {pool_id} is already finalized. Skipping...")
+                return {"message": f"Pool {pool_id} is already finalized."}
+            asset = pool_cache.asset_of(pool_id)
+            prices = {asset: await get_current_price(asset=asset)}
+            if prices[asset] is None:
+                return {"status": "error", "message": "Failed to fetch current price."}
+            outcome = evaluate(prices[asset], now, pool_details.target_price,
+                               pool_details.stop_loss, pool_details.end_time)
+            triggered_pools = [(pool_id, pool_details, outcome, prices[asset])] if outcome else []
 
-            target_price = pool_details['target_price']
-            stop_loss = pool_details['stop_loss']
+        if not triggered_pools:
+            quoted = ", ".join(f"{asset} {Web3.from_wei(price, 'ether')} $" for asset, price in prices.items() if price is not None)
+            logger.debug(f"Conditions not met for any active pool. Current prices: {quoted}")
+            return {"message": "All active pools checked. No conditions met."}
 
-            if current_price_in_wei >= target_price:
-                txn_hash = finalize_pool(pool['pool_id'], current_price_in_wei)
-                logger.info(f"Pool {pool['pool_id']} finalized: Target price reached. Txn Hash: {txn_hash}")
-                return {"message": "Pool finalized with target price reached", "transaction_hash": txn_hash}
-            elif current_price_in_wei <= stop_loss:
-                txn_hash = finalize_pool(pool['pool_id'], current_price_in_wei)
-                logger.info(f"Pool {pool['pool_id']} finalized: Stop loss reached. Txn Hash: {txn_hash}")
-                return {"message": "Pool finalized with stop loss hit", "transaction_hash": txn_hash}
-            elif pool_details['end_time'] <= int(time.time()):
-                txn_hash = finalize_pool(pool['pool_id'], current_price_in_wei)
-                logger.info(f"Pool {pool['pool_id']} finalized: End time reached. Txn Hash: {txn_hash}")
-                return {"message": "Pool finalized due to end time", "transaction_hash": txn_hash}
-            else:
-                logger.info(f"Conditions not met yet for pool {pool['pool_id']}. Current price: {Web3.from_wei(current_price_in_wei, 'ether')} $")
+        resolutions = [(pool_id, price) for pool_id, _, _, price in triggered_pools]
+        with span("finalize_pools", pool_ids=[pool_id for pool_id, _ in resolutions]):
+            results = await finalize_pools(resolutions)
+        for (_, _, outcome, _), result in zip(triggered_pools, results):
+            result["outcome"] = outcome
 
-        return {"message": "All active pools checked. No conditions met."}
+        submitted = sum(1 for result in results if result["status"] == "submitted")
+        return {
+            "message": f"Finalization submitted for {submitted} of {len(results)} triggered pools.",
+            "results": results
+        }
     except Exception as e:
         logger.error(f"Error checking and finalizing pools: {str(e)}")
         return {"status": "error", "message": str(e)}
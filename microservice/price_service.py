@@ -0,0 +1,163 @@
+from config import COINGECKO_API_URL, ASSET_ID, PRICE_TTL, PRICE_MAX_AGE
+from web3 import Web3
+from metrics import EXTERNAL_LATENCY, EXTERNAL_ERRORS, PRICE_AGE, span
+import asyncio
+import httpx
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF = 300
+
+
+class PriceService:
+    """
+    Shared CoinGecko price source for any number of assets.
+
+    One pooled HTTP client serves every caller, and all the stale assets a caller
+    needs are fetched in a single simple/price request. Prices younger than the TTL
+    are served from memory, and concurrent callers share an in-flight request that
+    covers their assets. After a 429 the service backs off and keeps serving the
+    last known prices, but never one older than max_stale: pools are resolved
+    on-chain with these prices, so an unknown price is better than an old one.
+    """
+
+    def __init__(self, ttl=PRICE_TTL, base_url=COINGECKO_API_URL, asset_id=ASSET_ID, transport=None,
+                 max_stale=PRICE_MAX_AGE):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.base_url = base_url
+        self.asset_id = asset_id
+        self._transport = transport
+        self._client = None
+        self._prices = {}
+        self._inflight = None
+        self._backoff = 0
+        self._backoff_until = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=10, transport=self._transport)
+        return self._client
+
+    def age(self, asset=None):
+        """Seconds since the cached price of an asset was fetched, or None if there is none."""
+        cached = self._prices.get(asset or self.asset_id)
+        if cached is None:
+            return None
+        return time.monotonic() - cached[1]
+
+    def fetched_at(self, asset=None):
+        """Unix timestamp at which the cached price of an asset was fetched, or None if there is none."""
+        cached = self._prices.get(asset or self.asset_id)
+        return None if cached is None else cached[2]
+
+    def fresh_for(self, asset=None):
+        """Seconds until the cached price of an asset is older than the TTL, 0 if it already is or there is none."""
+        age = self.age(asset)
+        return 0 if age is None else max(0, self.ttl - age)
+
+    def _servable(self, assets):
+        """Returns the assets whose cached price is recent enough to serve while it cannot be refreshed."""
+        return {asset for asset in assets if self.age(asset) is not None and self.age(asset) <= self.max_stale}
+
+    @property
+    def oldest_age(self):
+        """Age of the stalest cached price, or None if nothing is cached."""
+        return max((self.age(asset) for asset in self._prices), default=None)
+
+    async def get_price(self, max_age=None, asset=None):
+        """
+        Returns the price of one asset in wei.
+
+        :param max_age: Maximum acceptable age of a cached price in seconds; defaults to, and is never below, the TTL
+        :param asset: CoinGecko asset id; defaults to ASSET_ID
+        :return: Price in wei, or None if no price could be fetched
+        """
+        asset = asset or self.asset_id
+        return (await self.get_prices([asset], max_age))[asset]
+
+    async def get_prices(self, assets, max_age=None):
+        """
+        Returns the prices of several assets in wei, fetching all the stale ones in one request.
+
+        :param assets: Iterable of CoinGecko asset ids
+        :param max_age: Maximum acceptable age of a cached price in seconds; defaults to, and is never below, the TTL
+        :return: Dictionary of asset id to price in wei, or to None if its price could not be fetched
+        """
+        assets = set(assets)
+        # Callers near a threshold ask for sub-second prices; refetching faster than the TTL only
+        # runs into CoinGecko's rate limit and its backoff.
+        max_age = self.ttl if max_age is None else max(max_age, self.ttl)
+        stale = {asset for asset in assets if self.age(asset) is None or self.age(asset) > max_age}
+        failed = set()
+        if stale:
+            if time.monotonic() < self._backoff_until:
+                failed = stale - self._servable(stale)
+                logger.warning(f"CoinGecko rate limited, serving cached prices for {len(stale) - len(failed)} "
+                               f"assets, none for {len(failed)}.")
+            else:
+                failed = stale - await self._refresh(frozenset(stale))
+        return {asset: None if asset in failed or asset not in self._prices else self._prices[asset][0]
+                for asset in assets}
+
+    async def _refresh(self, assets):
+        if self._inflight is None or not assets <= self._inflight[0]:
+            future = asyncio.ensure_future(self._fetch(sorted(assets)))
+            future.add_done_callback(self._clear_inflight)
+            self._inflight = (assets, future)
+        return await asyncio.shield(self._inflight[1])
+
+    def _clear_inflight(self, future):
+        if self._inflight is not None and self._inflight[1] is future:
+            self._inflight = None
+
+    async def _fetch(self, assets):
+        """Fetches the given assets in one request and returns those whose cached price may be served."""
+        try:
+            with span("coingecko", assets=len(assets)), EXTERNAL_LATENCY.labels("coingecko").time():
+                response = await self.client.get("/simple/price", params={
+                    'ids': ",".join(assets),
+                    'vs_currencies': 'usd'
+                })
+            if response.status_code == 429:
+                EXTERNAL_ERRORS.labels("coingecko", "rate_limited").inc()
+                self._backoff = min(MAX_BACKOFF, max(self._backoff * 2, 5))
+                retry_after = response.headers.get('Retry-After')
+                delay = int(retry_after) if retry_after and retry_after.isdigit() else self._backoff
+                self._backoff_until = time.monotonic() + delay
+                logger.warning(f"CoinGecko returned 429, backing off for {delay} seconds.")
+                return self._servable(assets)
+
+            response.raise_for_status()
+            quotes = response.json()
+            fetched_at, fetched_time = time.monotonic(), time.time()
+            fetched = set()
+            for asset in assets:
+                quote = quotes.get(asset, {}).get('usd')
+                if quote is None:
+                    logger.warning(f"CoinGecko returned no price for {asset}.")
+                    continue
+                self._prices[asset] = (Web3.to_wei(quote, 'ether'), fetched_at, fetched_time)
+                fetched.add(asset)
+            if len(assets) == 1 and assets[0] in quotes:
+                logger.info(f"Fetched current price: ${quotes[assets[0]]['usd']}")
+            else:
+                logger.info(f"Fetched current prices of {len(quotes)} assets.")
+            self._backoff = 0
+            return fetched
+        except Exception as e:
+            EXTERNAL_ERRORS.labels("coingecko", "error").inc()
+            logger.error(f"Error fetching price: {str(e)}")
+            return set()
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+price_service = PriceService()
+PRICE_AGE.set_function(lambda: price_service.oldest_age if price_service.oldest_age is not None else float("nan"))
@@ -0,0 +1,142 @@
+from config import BLOCK_TIME, RPC_BATCH_SIZE, TX_DROP_TIMEOUT, TX_HISTORY_SIZE
+from collections import OrderedDict
+from rpc import batch_request
+from metrics import tick
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SUCCESS = "success"
+REVERTED = "reverted"
+DROPPED = "dropped"
+
+
+class ReceiptTracker:
+    """
+    Background tracker for submitted transactions.
+
+    Pending transactions are kept in one table. Once per new block all of their
+    receipts are fetched in a single batch request and the outcomes are published
+    through futures and callbacks. Finished transactions stay queryable until
+    TX_HISTORY_SIZE newer ones have finished.
+    """
+
+    def __init__(self, web3, chunk_size=RPC_BATCH_SIZE):
+        self.web3 = web3
+        self.chunk_size = chunk_size
+        self._pending = {}
+        self._finished = OrderedDict()
+        self._callbacks = []
+        self._last_block = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add_callback(self, callback):
+        """Registers callback(transaction) to run whenever any transaction finishes."""
+        self._callbacks.append(callback)
+
+    def track(self, tx_hash, **details):
+        """
+        Starts tracking a submitted transaction.
+
+        :param tx_hash: Transaction hash
+        :param details: Extra fields stored with the transaction, e.g. kind, pool_id, nonce, gas
+        :return: Future resolved with the transaction dictionary once it is mined or dropped
+        """
+        transaction = {
+            "transaction_hash": tx_hash,
+            "status": PENDING,
+            "submitted_at": time.time(),
+            **details,
+        }
+        future = asyncio.get_running_loop().create_future()
+        self._pending[tx_hash] = (transaction, future)
+        return future
+
+    def get(self, tx_hash):
+        """Returns the tracked transaction dictionary, or None if it is unknown."""
+        if tx_hash in self._pending:
+            return self._pending[tx_hash][0]
+        return self._finished.get(tx_hash)
+
+    async def wait(self, tx_hash):
+        """Waits until a tracked transaction finishes and returns its dictionary."""
+        if tx_hash in self._pending:
+            return await asyncio.shield(self._pending[tx_hash][1])
+        return self._finished.get(tx_hash)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return self._task
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if self._pending:
+                    block_number = await self.web3.eth.block_number
+                    if block_number != self._last_block:
+                        self._last_block = block_number
+                        with tick("receipt_tracker"):
+                            await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error polling transaction receipts: {str(e)}")
+            await asyncio.sleep(BLOCK_TIME)
+
+    async def poll(self):
+        """Fetches the receipts of every pending transaction in one batch."""
+        tx_hashes = list(self._pending)
+        receipts = await batch_request(self.web3, [
+            ('eth_getTransactionReceipt', [tx_hash]) for tx_hash in tx_hashes
+        ], self.chunk_size)
+
+        now = time.time()
+        missing = []
+        for tx_hash, response in zip(tx_hashes, receipts):
+            receipt = response.get('result')
+            if receipt:
+                self._finish(tx_hash, SUCCESS if int(receipt['status'], 16) == 1 else REVERTED,
+                             block_number=int(receipt['blockNumber'], 16),
+                             gas_used=int(receipt['gasUsed'], 16))
+            elif now - self._pending[tx_hash][0]["submitted_at"] > TX_DROP_TIMEOUT:
+                missing.append(tx_hash)
+
+        if missing:
+            lookups = await batch_request(self.web3, [
+                ('eth_getTransactionByHash', [tx_hash]) for tx_hash in missing
+            ], self.chunk_size)
+            for tx_hash, response in zip(missing, lookups):
+                if 'error' not in response and response.get('result') is None:
+                    self._finish(tx_hash, DROPPED)
+
+    def _finish(self, tx_hash, status, **details):
+        transaction, future = self._pending.pop(tx_hash)
+        transaction.update(status=status, finished_at=time.time(), **details)
+        self._finished[tx_hash] = transaction
+        while len(self._finished) > TX_HISTORY_SIZE:
+            self._finished.popitem(last=False)
+
+        if status == SUCCESS:
+            logger.info(f"Transaction {tx_hash} mined in block {transaction['block_number']}")
+        else:
+            logger.warning(f"Transaction {tx_hash} {status}")
+
+        if not future.done():
+            future.set_result(transaction)
+        for callback in self._callbacks:
+            try:
+                callback(transaction)
+            except Exception as e:
+                logger.error(f"Error in receipt callback for {tx_hash}: {str(e)}")
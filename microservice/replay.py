@@ -0,0 +1,268 @@
+from config import PRICE_SCALE, ASSET_ID
+from tick_history import SparseTable, scale_thresholds, unscale_price
+from trigger_index import TARGET_REACHED, STOP_LOSS_HIT, END_TIME_REACHED
+from typing import NamedTuple
+import argparse
+import csv
+import numpy as np
+import os
+import time
+
+OPEN = 0
+TARGET = 1
+STOP = 2
+ENDED = 3
+OUTCOMES = {OPEN: "", TARGET: TARGET_REACHED, STOP: STOP_LOSS_HIT, ENDED: END_TIME_REACHED}
+
+
+class PoolArrays(NamedTuple):
+    """Pools as columns: thresholds are int64 in units of PRICE_SCALE wei, rounded inwards."""
+    pool_id: np.ndarray
+    created_at: np.ndarray
+    target_price: np.ndarray
+    stop_loss: np.ndarray
+    end_time: np.ndarray
+
+    @classmethod
+    def from_wei(cls, pool_ids, created_at, target_prices, stop_losses, end_times):
+        targets, stops = scale_thresholds(target_prices, stop_losses)
+        return cls(np.asarray(pool_ids, np.int64), np.asarray(created_at, np.float64), targets, stops,
+                   np.asarray(end_times, np.float64))
+
+    def __len__(self):
+        return len(self.pool_id)
+
+
+class PriceSeries(NamedTuple):
+    """Candles sorted by time, prices int64 in units of PRICE_SCALE wei."""
+    time: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+
+    @classmethod
+    def from_usd(cls, times, close, high=None, low=None):
+        """Builds a series from USD prices, as CoinGecko quotes them; without highs and lows the closes are used."""
+        def scale(prices):
+            return np.rint(np.asarray(prices, np.float64) * (10 ** 18 / PRICE_SCALE)).astype(np.int64)
+
+        order = np.argsort(np.asarray(times, np.float64), kind="stable")
+        close = scale(close)[order]
+        return cls(np.asarray(times, np.float64)[order],
+                   close if high is None else scale(high)[order],
+                   close if low is None else scale(low)[order],
+                   close)
+
+    def __len__(self):
+        return len(self.time)
+
+
+class ReplayResult(NamedTuple):
+    """Per pool outcome code (OPEN if unresolved at the end of the series), resolution time and price in scaled units."""
+    pool_id: np.ndarray
+    outcome: np.ndarray
+    resolved_at: np.ndarray
+    price: np.ndarray
+
+
+def read_columns(path):
+    """Reads a CSV file with a header row, or a Parquet file, into a dictionary of column name to list or array."""
+    if os.path.splitext(path)[1].lower() in (".parquet", ".pq"):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Reading Parquet files needs pyarrow (pip install -r requirements-bench.txt)")
+        table = pyarrow.parquet.read_table(path)
+        return {name: table.column(name).to_pylist() for name in table.column_names}
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        header = [name.strip() for name in next(reader)]
+        columns = {name: [] for name in header}
+        for row in reader:
+            for name, value in zip(header, row):
+                columns[name].append(value)
+        return columns
+
+
+def load_prices(path):
+    """
+    Loads a price series from CSV or Parquet.
+
+    Columns: time (unix seconds) and price or close in USD, plus optional high and low.
+    A candle counts for the pools created before its time.
+    """
+    columns = read_columns(path)
+    close = columns.get("close", columns.get("price"))
+    if "time" not in columns or close is None:
+        raise ValueError(f"{path} needs a time column and a price or close column")
+    return PriceSeries.from_usd(np.asarray(columns["time"], np.float64), np.asarray(close, np.float64),
+                                columns.get("high"), columns.get("low"))
+
+
+def load_pools(path):
+    """
+    Loads pools from CSV or Parquet.
+
+    Columns: target_price, stop_loss and end_time, with prices in wei as integers, plus
+    optional pool_id and created_at; pools without created_at are active from the start
+    of the series.
+    """
+    columns = read_columns(path)
+    count = len(columns["end_time"])
+    return PoolArrays.from_wei(
+        columns.get("pool_id", range(count)),
+        [float(value) if value not in (None, "") else -np.inf for value in columns.get("created_at", [None] * count)],
+        columns["target_price"], columns["stop_loss"], np.asarray(columns["end_time"], np.float64))
+
+
+def load_archived_pools(asset=ASSET_ID):
+    """Loads every pool of an asset from the pool archive."""
+    from pool_archive import pool_archive
+    rows = pool_archive.db.execute(
+        "SELECT pool_id, created_at, target_price, stop_loss, end_time FROM pools "
+        "WHERE COALESCE(asset, ?) = ? ORDER BY pool_id", (ASSET_ID, asset)
+    ).fetchall()
+    pool_ids, created_at, target_prices, stop_losses, end_times = zip(*rows) if rows else ([],) * 5
+    created_at = [-np.inf if value is None else value for value in created_at]
+    return PoolArrays.from_wei(pool_ids, created_at, target_prices, stop_losses, end_times)
+
+
+def synthetic_pools(count, series, seed=0):
+    """Generates pools created across the series with thresholds around the price they were created at."""
+    rng = np.random.default_rng(seed)
+    created = rng.integers(0, len(series), count)
+    price = series.close[created]
+    return PoolArrays(
+        np.arange(count, dtype=np.int64),
+        series.time[created],
+        (price * rng.uniform(1.01, 1.5, count)).astype(np.int64),
+        (price * rng.uniform(0.5, 0.99, count)).astype(np.int64),
+        series.time[created] + rng.integers(60, 30 * 86400, count),
+    )
+
+
+def random_walk(minutes, price=60000, volatility=0.0005, start=0, seed=0):
+    """Generates a series of minute candles as a geometric random walk from a USD price."""
+    rng = np.random.default_rng(seed)
+    steps = rng.normal(0, volatility, (minutes, 4))
+    path = price * np.exp(np.cumsum(steps[:, 0]))
+    wicks = np.abs(steps[:, 1:3]) * path[:, None]
+    return PriceSeries.from_usd(start + 60 * np.arange(1, minutes + 1), path, path + wicks[:, 0], path - wicks[:, 1])
+
+
+def replay(pools, series):
+    """
+    Works out how and when each pool would have resolved over a price series.
+
+    The rules are those of check_pool_conditions and resolvePool: a pool resolves at
+    the first candle after its creation whose high reaches the target or whose low
+    reaches the stop loss, the target winning within one candle, and otherwise at its
+    end time. Both searches run for all pools at once over a sparse table of the
+    series, O(log n) per pool, so no Python code runs per pool or per candle.
+
+    :param pools: PoolArrays
+    :param series: PriceSeries
+    :return: ReplayResult
+    """
+    count = len(pools)
+    outcome = np.full(count, OPEN, np.int8)
+    resolved_at = np.full(count, np.nan)
+    price = np.zeros(count, np.int64)
+    if not len(series) or not count:
+        return ReplayResult(pools.pool_id, outcome, resolved_at, price)
+
+    lo = np.searchsorted(series.time, pools.created_at, side="right")
+    hi = np.searchsorted(series.time, pools.end_time, side="right")
+    table = SparseTable(series.high, series.low)
+    target_at = table.first_at_least(lo, hi, pools.target_price)
+    stop_at = table.first_at_most(lo, hi, pools.stop_loss)
+
+    target = (target_at < hi) & (target_at <= stop_at)
+    stop = ~target & (stop_at < hi)
+    ended = ~target & ~stop & (pools.end_time <= series.time[-1])
+
+    outcome[target] = TARGET
+    resolved_at[target] = series.time[target_at[target]]
+    price[target] = series.high[target_at[target]]
+    outcome[stop] = STOP
+    resolved_at[stop] = series.time[stop_at[stop]]
+    price[stop] = series.low[stop_at[stop]]
+    outcome[ended] = ENDED
+    resolved_at[ended] = pools.end_time[ended]
+    # An ended pool resolves at the last price before its end time.
+    price[ended] = series.close[np.maximum(hi[ended] - 1, 0)]
+    return ReplayResult(pools.pool_id, outcome, resolved_at, price)
+
+
+def summarize(result):
+    """Returns the number of pools per outcome."""
+    counts = np.bincount(result.outcome, minlength=len(OUTCOMES))
+    return {OUTCOMES[code] or "Unresolved": int(counts[code]) for code in OUTCOMES}
+
+
+def finalization_load(result, interval=3600):
+    """
+    Sizes the finalization pipeline from a replay.
+
+    :param interval: Bucket length in seconds
+    :return: Dictionary with the mean, 99th percentile and peak finalizations per bucket,
+             and the start of the busiest bucket
+    """
+    resolved_at = result.resolved_at[result.outcome != OPEN]
+    if not len(resolved_at):
+        return {"interval": interval, "mean": 0.0, "p99": 0.0, "peak": 0, "peak_at": None}
+    start = resolved_at.min() // interval * interval
+    buckets = np.bincount(((resolved_at - start) // interval).astype(np.int64))
+    peak = int(buckets.argmax())
+    return {
+        "interval": interval,
+        "mean": float(buckets.mean()),
+        "p99": float(np.percentile(buckets, 99)),
+        "peak": int(buckets[peak]),
+        "peak_at": float(start + peak * interval),
+    }
+
+
+def write_results(path, result):
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("pool_id", "outcome", "resolved_at", "final_price"))
+        for pool_id, outcome, resolved_at, price in zip(*result):
+            if outcome == OPEN:
+                writer.writerow((pool_id, "", "", ""))
+            else:
+                writer.writerow((pool_id, OUTCOMES[outcome], int(resolved_at), unscale_price(price)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay pools over a historical price series.")
+    parser.add_argument("--prices", help="CSV or Parquet price series; a random walk if omitted")
+    parser.add_argument("--minutes", type=int, default=525_600, help="Length of the random walk in minutes")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--pools", help="CSV or Parquet file of pools")
+    source.add_argument("--archive", action="store_true", help="Replay the pools in the pool archive")
+    source.add_argument("--synthetic", type=int, default=1_000_000, help="Number of random pools to replay")
+    parser.add_argument("--asset", default=ASSET_ID, help="Asset of the archived pools to replay")
+    parser.add_argument("--output", help="Write each pool's outcome to this CSV file")
+    args = parser.parse_args()
+
+    series = load_prices(args.prices) if args.prices else random_walk(args.minutes, start=int(time.time()))
+    if args.pools:
+        pools = load_pools(args.pools)
+    elif args.archive:
+        pools = load_archived_pools(args.asset)
+    else:
+        pools = synthetic_pools(args.synthetic, series)
+
+    started = time.perf_counter()
+    result = replay(pools, series)
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {len(pools)} pools over {len(series)} candles in {elapsed:.2f}s")
+    for outcome, count in summarize(result).items():
+        print(f"  {outcome}: {count}")
+    for interval, label in ((60, "minute"), (3600, "hour")):
+        load = finalization_load(result, interval)
+        print(f"  finalizations per {label}: mean {load['mean']:.1f}, p99 {load['p99']:.0f}, peak {load['peak']}")
+
+    if args.output:
+        write_results(args.output, result)
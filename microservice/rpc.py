@@ -0,0 +1,58 @@
+from metrics import RPC_REQUESTS, RPC_ERRORS, observe_rpc
+import asyncio
+import contextlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Persistent providers answer every batch under the same response id, so only one
+# batch may be in flight per provider at a time.
+_batch_locks = {}
+
+
+def _batch_lock(provider):
+    if getattr(provider, "routes_batches", False):
+        return contextlib.nullcontext()
+    lock = _batch_locks.get(id(provider))
+    if lock is None:
+        lock = _batch_locks[id(provider)] = asyncio.Lock()
+    return lock
+
+
+async def batch_request(web3, requests, chunk_size):
+    """
+    Sends raw JSON-RPC requests as batches and returns the raw responses in order.
+
+    :param web3: Connected AsyncWeb3 instance
+    :param requests: List of (method, params) tuples
+    :param chunk_size: Maximum number of requests per batch
+    :return: List of response dictionaries, each holding either 'result' or 'error'
+    """
+    provider = web3.provider
+    responses = []
+    for start in range(0, len(requests), chunk_size):
+        chunk = requests[start:start + chunk_size]
+        methods = {method for method, _ in chunk}
+        label = f"batch:{methods.pop()}" if len(methods) == 1 else "batch"
+        try:
+            async with _batch_lock(provider):
+                with observe_rpc(label, len(chunk)):
+                    batch = await provider.make_batch_request(chunk)
+            if isinstance(batch, dict):
+                raise ValueError(batch.get('error', batch))
+            batch = sorted(batch, key=lambda response: response['id'])
+        except Exception as e:
+            logger.warning(f"Batch request failed, falling back to single requests: {str(e)}")
+            batch = await asyncio.gather(*(_single_request(provider, method, params) for method, params in chunk))
+
+        for (method, _), response in zip(chunk, batch):
+            RPC_REQUESTS.labels(method).inc()
+            if 'error' in response:
+                RPC_ERRORS.labels(method).inc()
+        responses.extend(batch)
+    return responses
+
+
+async def _single_request(provider, method, params):
+    with observe_rpc(method):
+        return await provider.make_request(method, params)
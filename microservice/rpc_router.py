@@ -0,0 +1,345 @@
+from config import (WEB3_PROVIDERS, WEB3_SOCK_PROVIDER, WEB3_PROVIDER, RPC_REQUEST_TIMEOUT, RPC_HEDGE_DELAY,
+                    RPC_BROADCAST_COUNT, RPC_BREAKER_THRESHOLD, RPC_BREAKER_COOLDOWN)
+from metrics import RPC_ROUTING, RPC_ENDPOINT_LATENCY
+from web3 import AsyncHTTPProvider, WebSocketProvider, Web3
+from web3.providers.async_base import AsyncBaseProvider
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_METHODS = {"eth_sendRawTransaction"}
+NEW_FILTER_METHODS = {"eth_newFilter", "eth_newBlockFilter", "eth_newPendingTransactionFilter"}
+FILTER_METHODS = {"eth_getFilterChanges", "eth_getFilterLogs", "eth_uninstallFilter"}
+# Too heavy to run twice on a hunch.
+UNHEDGED_METHODS = {"eth_getLogs"}
+ALREADY_KNOWN = ("already known", "known transaction", "already imported")
+LATENCY_DECAY = 0.2
+ERROR_PENALTY = 10
+HEDGE_LATENCY_MULTIPLIER = 3
+
+
+def parse_endpoints(spec):
+    """Parses a comma separated list of node URLs."""
+    return [url.strip() for url in spec.split(",") if url.strip()]
+
+
+def configured_endpoints():
+    """Returns WEB3_PROVIDERS, or the single websocket and HTTP URLs when it is not set."""
+    return parse_endpoints(WEB3_PROVIDERS) or [url for url in (WEB3_SOCK_PROVIDER, WEB3_PROVIDER) if url]
+
+
+def provider_for(url):
+    if url.startswith(("ws://", "wss://")):
+        # The router retries through its circuit breaker instead of blocking in connect().
+        return WebSocketProvider(url, max_connection_retries=1, request_timeout=RPC_REQUEST_TIMEOUT)
+    return AsyncHTTPProvider(url)
+
+
+class Endpoint:
+    """One upstream provider with its rolling latency, error rate and circuit breaker."""
+
+    def __init__(self, name, provider):
+        self.name = name
+        self.provider = provider
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0
+        self.probing = False
+        self.needs_connect = provider.has_persistent_connection
+        # Persistent connections answer every batch under the same response id.
+        self.batch_lock = asyncio.Lock()
+
+    @property
+    def is_open(self):
+        return self.failures >= RPC_BREAKER_THRESHOLD
+
+    def available(self, now):
+        """Closed circuits take any request; an open one takes a single probe once its cooldown is over."""
+        return not self.is_open or (now >= self.open_until and not self.probing)
+
+    def score(self):
+        # Endpoints not measured yet rank first so that they get measured.
+        return (self.latency or 0) * (1 + ERROR_PENALTY * self.error_rate)
+
+    def succeeded(self, seconds):
+        self.latency = seconds if self.latency is None else self.latency + LATENCY_DECAY * (seconds - self.latency)
+        self.error_rate *= 1 - LATENCY_DECAY
+        if self.is_open:
+            logger.info(f"RPC endpoint {self.name} recovered, closing its circuit.")
+        self.failures = 0
+        RPC_ENDPOINT_LATENCY.labels(self.name).set(self.latency)
+
+    def failed(self, error, trip=False):
+        """Records a failed request; trip opens the circuit at once, e.g. when the endpoint cannot be reached."""
+        was_open = self.is_open
+        self.error_rate += LATENCY_DECAY * (1 - self.error_rate)
+        self.failures = max(self.failures + 1, RPC_BREAKER_THRESHOLD if trip else 0)
+        if self.is_open:
+            self.open_until = time.monotonic() + RPC_BREAKER_COOLDOWN
+            self.needs_connect = self.provider.has_persistent_connection
+            if not was_open:
+                RPC_ROUTING.labels(self.name, "circuit_opened").inc()
+                logger.warning(f"RPC endpoint {self.name} failing ({str(error) or type(error).__name__}), "
+                               f"circuit open for {RPC_BREAKER_COOLDOWN}s.")
+
+
+class RpcRouter(AsyncBaseProvider):
+    """
+    Web3 provider that spreads JSON-RPC traffic over several nodes.
+
+    Each endpoint keeps a rolling average of its latency and error rate. Reads go
+    to the fastest endpoint whose circuit is closed and fail over to the next one
+    on a transport error or timeout; a read still running after a few times the
+    endpoint's usual latency is hedged to the runner-up and the first answer wins.
+    Signed transactions are broadcast to the RPC_BROADCAST_COUNT best endpoints,
+    and pending nonces are read from every endpoint a broadcast went to, taking
+    the highest, since the others may not have seen our transactions yet.
+    After RPC_BREAKER_THRESHOLD failures in a row an endpoint's circuit opens for
+    RPC_BREAKER_COOLDOWN seconds, after which one probe decides whether it closes.
+    Error responses such as reverts are answers, not failures.
+    """
+
+    # rpc.batch_request leaves batch locking to the router, which locks per endpoint.
+    routes_batches = True
+
+    def __init__(self, providers, hedge_delay=RPC_HEDGE_DELAY, broadcast_count=RPC_BROADCAST_COUNT,
+                 timeout=RPC_REQUEST_TIMEOUT):
+        """
+        :param providers: Dictionary of endpoint name to web3 provider
+        :param hedge_delay: Minimum seconds before a read is hedged; 0 disables hedging
+        :param broadcast_count: Number of endpoints each signed transaction is sent to
+        :param timeout: Seconds before a request to one endpoint counts as failed
+        """
+        super().__init__()
+        self.endpoints = [Endpoint(name, provider) for name, provider in providers.items()]
+        self.hedge_delay = hedge_delay
+        self.broadcast_count = broadcast_count
+        self.timeout = timeout
+        self._filters = {}
+        self._background = set()
+        self._broadcast_to = set()
+
+    @classmethod
+    def from_urls(cls, urls, **kwargs):
+        if not urls:
+            raise ValueError("No RPC endpoints configured; set WEB3_PROVIDERS or WEB3_SOCKET_URL.")
+        return cls({url: provider_for(url) for url in urls}, **kwargs)
+
+    async def connect(self):
+        """Connects every endpoint that keeps a connection; fails only if none of the endpoints is reachable."""
+        connected = await asyncio.gather(*(self._connect(endpoint) for endpoint in self.endpoints))
+        if not any(connected):
+            raise ConnectionError(f"None of the {len(self.endpoints)} RPC endpoints is reachable.")
+
+    async def _connect(self, endpoint):
+        if not endpoint.needs_connect:
+            return True
+        try:
+            await self._reconnect(endpoint)
+            return True
+        except Exception as e:
+            endpoint.failed(e, trip=True)
+            return False
+
+    async def _reconnect(self, endpoint):
+        try:
+            await endpoint.provider.disconnect()
+        except Exception:
+            # Never connected, or the connection is already gone.
+            pass
+        await asyncio.wait_for(endpoint.provider.connect(), self.timeout)
+        endpoint.needs_connect = False
+
+    async def disconnect(self):
+        for task in list(self._background):
+            task.cancel()
+        for endpoint in self.endpoints:
+            if endpoint.provider.has_persistent_connection and not endpoint.needs_connect:
+                endpoint.needs_connect = True
+                try:
+                    await endpoint.provider.disconnect()
+                except Exception as e:
+                    logger.warning(f"Error disconnecting from RPC endpoint {endpoint.name}: {str(e)}")
+
+    async def is_connected(self, show_traceback=False):
+        try:
+            return "result" in await self.make_request("web3_clientVersion", [])
+        except Exception:
+            if show_traceback:
+                raise
+            return False
+
+    async def make_request(self, method, params):
+        if method in BROADCAST_METHODS:
+            return await self._broadcast(lambda endpoint: endpoint.provider.make_request(method, params),
+                                         lambda responses: _merge_response(responses, params[0]))
+        if method == "eth_getTransactionCount" and len(params) > 1 and params[1] == "pending":
+            return await self._pending_nonce(lambda endpoint: endpoint.provider.make_request(method, params))
+        if method in NEW_FILTER_METHODS:
+            # Filters live on the node that created them, so they are neither hedged nor failed over.
+            endpoint = self._ranked()[0]
+            response = await self._send(endpoint, lambda endpoint: endpoint.provider.make_request(method, params))
+            if "result" in response:
+                self._filters[response["result"]] = endpoint
+            return response
+        if method in FILTER_METHODS and params and params[0] in self._filters:
+            endpoint = self._filters[params[0]]
+            if method == "eth_uninstallFilter":
+                del self._filters[params[0]]
+            return await self._send(endpoint, lambda endpoint: endpoint.provider.make_request(method, params))
+        return await self._read(lambda endpoint: endpoint.provider.make_request(method, params),
+                                hedge=method not in UNHEDGED_METHODS)
+
+    async def make_batch_request(self, requests):
+        raw_transactions = [params[0] if method in BROADCAST_METHODS else None for method, params in requests]
+        if any(raw_transactions):
+            return await self._broadcast(lambda endpoint: self._batch(endpoint, requests),
+                                         lambda responses: _merge_batch(responses, raw_transactions))
+        return await self._read(lambda endpoint: self._batch(endpoint, requests),
+                                hedge=not any(method in UNHEDGED_METHODS for method, _ in requests))
+
+    async def _batch(self, endpoint, requests):
+        async with endpoint.batch_lock:
+            response = await endpoint.provider.make_batch_request(requests)
+        return sorted(response, key=lambda item: item["id"]) if isinstance(response, list) else response
+
+    def _ranked(self):
+        """Returns the endpoints able to take a request, fastest first; all of them if every circuit is open."""
+        now = time.monotonic()
+        endpoints = [endpoint for endpoint in self.endpoints if endpoint.available(now)] or self.endpoints
+        return sorted(endpoints, key=Endpoint.score)
+
+    async def _send(self, endpoint, request):
+        """Runs request(endpoint) against one endpoint with a timeout and records how it went."""
+        if endpoint.is_open:
+            endpoint.probing = True
+        started = time.monotonic()
+        try:
+            if endpoint.needs_connect:
+                await self._reconnect(endpoint)
+            response = await asyncio.wait_for(request(endpoint), self.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            endpoint.failed(e)
+            raise
+        finally:
+            endpoint.probing = False
+        endpoint.succeeded(time.monotonic() - started)
+        return response
+
+    async def _read(self, request, hedge=True):
+        candidates = self._ranked()
+        launched = []
+        pending = set()
+
+        def launch():
+            endpoint = candidates[len(launched)]
+            launched.append(endpoint)
+            task = asyncio.ensure_future(self._send(endpoint, request))
+            task.endpoint = endpoint
+            pending.add(task)
+
+        launch()
+        hedged = not hedge or self.hedge_delay <= 0
+        error = None
+        try:
+            while pending:
+                wait = None
+                if not hedged and len(launched) < len(candidates):
+                    wait = max(self.hedge_delay, HEDGE_LATENCY_MULTIPLIER * (launched[-1].latency or 0))
+                done, _ = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    RPC_ROUTING.labels(launched[-1].name, "hedged").inc()
+                    hedged = True
+                    launch()
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                    logger.warning(f"RPC endpoint {task.endpoint.name} failed: {str(error) or type(error).__name__}")
+                    if not pending and len(launched) < len(candidates):
+                        RPC_ROUTING.labels(task.endpoint.name, "failover").inc()
+                        launch()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _pending_nonce(self, request):
+        """Reads a pending transaction count from every endpoint that received a broadcast and returns the highest."""
+        targets = [endpoint for endpoint in self._ranked() if endpoint in self._broadcast_to]
+        if not targets:
+            targets = self._ranked()[:max(1, self.broadcast_count)]
+        responses = await asyncio.gather(*(self._send(endpoint, request) for endpoint in targets),
+                                         return_exceptions=True)
+        answers = [response for response in responses if isinstance(response, dict) and "result" in response]
+        if answers:
+            return max(answers, key=lambda response: int(response["result"], 16))
+        errors = [response for response in responses if isinstance(response, BaseException)]
+        if len(errors) == len(responses):
+            raise errors[0]
+        return next(response for response in responses if not isinstance(response, BaseException))
+
+    async def _broadcast(self, request, merge):
+        targets = self._ranked()[:max(1, self.broadcast_count)]
+        self._broadcast_to.update(targets)
+        pending = {asyncio.ensure_future(self._send(endpoint, request)) for endpoint in targets}
+        responses = []
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                else:
+                    responses.append(task.result())
+            if responses and _accepted(merge(responses)):
+                break
+
+        # The slower endpoints keep propagating the transactions in the background.
+        for task in pending:
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+            task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        if not responses:
+            raise error
+        return merge(responses)
+
+
+def _transaction_hash(raw_transaction):
+    return Web3.to_hex(Web3.keccak(hexstr=raw_transaction))
+
+
+def _merge_response(responses, raw_transaction):
+    """Picks the response that accepted the transaction; a node that already knows it counts as accepting it."""
+    for response in responses:
+        if "result" in response:
+            return response
+    for response in responses:
+        if any(text in str(response.get("error", {}).get("message", "")).lower() for text in ALREADY_KNOWN):
+            return {"jsonrpc": "2.0", "id": response.get("id"), "result": _transaction_hash(raw_transaction)}
+    return responses[0]
+
+
+def _merge_batch(responses, raw_transactions):
+    """Merges broadcast batches item by item, the way _merge_response merges single responses."""
+    batches = [response for response in responses if isinstance(response, list)]
+    if not batches:
+        return responses[0]
+    merged = []
+    for i, raw_transaction in enumerate(raw_transactions):
+        items = [batch[i] for batch in batches if i < len(batch)]
+        merged.append(_merge_response(items, raw_transaction) if raw_transaction else items[0])
+    return merged
+
+
+def _accepted(response):
+    if isinstance(response, list):
+        return all("result" in item for item in response)
+    return "result" in response
@@ -1,14 +1,173 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from price_monitor import check_pool_conditions
-import logging
+from price_monitor import check_pool_conditions, get_current_prices
+from price_service import price_service
+from pool_cache import pool_cache
+from leader_lease import LeaderLease
+from tick_history import tick_store
+from config import (POOL_RECONCILE_INTERVAL, CHECK_MIN_INTERVAL, CHECK_MAX_INTERVAL, CHECK_PRICE_RANGE,
+                    LEADER_RETRY_INTERVAL, TICK_INTERVAL)
 import asyncio
+import logging
+import os
+import time
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def next_check_delay(price, now, nearest, fresh_for=0):
+    """
+    Returns how long to wait before the next pool check.
+
+    The delay shrinks linearly from CHECK_MAX_INTERVAL as the price comes within
+    CHECK_PRICE_RANGE of the nearest threshold, down to CHECK_MIN_INTERVAL, but
+    not below the time the cached price stays fresh, since a check before then
+    would see the same price again. It never runs past the next end time.
+
+    :param price: Current price in wei, or None if unknown
+    :param now: Current unix timestamp
+    :param nearest: Tuple of (next target price, next stop loss, next end time), each possibly None
+    :param fresh_for: Seconds until a new price can be fetched
+    :return: Delay in seconds, or None if no pool can resolve until the pools change
+    """
+    next_target, next_stop, next_end = nearest
+    if next_target is None and next_stop is None and next_end is None:
+        return None
+
+    delay = CHECK_MAX_INTERVAL
+    if price:
+        for threshold in (next_target, next_stop):
+            if threshold is not None:
+                distance = abs(threshold - price) / price
+                delay = min(delay, CHECK_MAX_INTERVAL * distance / CHECK_PRICE_RANGE)
+        delay = max(delay, fresh_for)
+    if next_end is not None:
+        delay = min(delay, next_end - now)
+    return max(CHECK_MIN_INTERVAL, delay)
+
+
+def earliest_check_delay(prices, now, nearest, fresh_for=None):
+    """
+    Returns the shortest next_check_delay across assets.
+
+    :param prices: Dictionary of asset to current price in wei, or to None if it is unknown
+    :param nearest: Dictionary of asset to its nearest thresholds, as returned by PoolCache.nearest_triggers
+    :param fresh_for: Callable(asset) returning the seconds until a new price can be fetched;
+                      the price service's cache by default
+    :return: Delay in seconds, or None if no pool can resolve until the pools change
+    """
+    fresh_for = fresh_for or price_service.fresh_for
+    delays = [next_check_delay(prices[asset], now, thresholds, fresh_for(asset))
+              for asset, thresholds in nearest.items()]
+    delay = min((delay for delay in delays if delay is not None), default=None)
+    if any(price is None for price in prices.values()):
+        # Pools of assets without a price cannot be scheduled, so retry them at the longest interval.
+        delay = min(delay or CHECK_MAX_INTERVAL, CHECK_MAX_INTERVAL)
+    return delay
+
+
+class PoolScheduler:
+    """
+    Asyncio scheduler for pool checks and cache reconciles.
+
+    Only the holder of the leader lease checks pools. After each check the next one
+    is scheduled from how close the price is to the nearest threshold and how soon
+    the next pool ends; with no active pools it idles until the pool cache reports
+    new ones. Between checks the leader records a price tick every TICK_INTERVAL
+    seconds, so a check also sees the prices it did not run at.
+    """
+
+    def __init__(self, lease):
+        self.lease = lease
+        self.delay = None
+        self._wake = asyncio.Event()
+        self._callbacks = []
+        self._tasks = []
+
+    def add_callback(self, callback):
+        """Registers async callback(result) to run after every check that submitted finalizations."""
+        self._callbacks.append(callback)
+
+    def wake(self):
+        """Runs the next check now instead of at its scheduled time."""
+        self._wake.set()
+
+    def start(self):
+        if not self._tasks:
+            pool_cache.add_callback(self.wake)
+            self._tasks = [asyncio.create_task(self._check_loop()), asyncio.create_task(self._reconcile_loop())]
+            if TICK_INTERVAL > 0:
+                self._tasks.append(asyncio.create_task(self._tick_loop()))
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        tick_store.flush()
+        self.lease.release()
+
+    async def _check_loop(self):
+        while True:
+            was_leader = self.lease.held
+            if not self.lease.acquire():
+                await asyncio.sleep(LEADER_RETRY_INTERVAL)
+                continue
+            if not was_leader:
+                logger.info(f"Scheduler: Leader lease acquired by process {os.getpid()}.")
+
+            self._wake.clear()
+            try:
+                self.delay = await self.check()
+            except Exception as e:
+                logger.error(f"Scheduler: Error checking pools: {str(e)}")
+                self.delay = CHECK_MAX_INTERVAL
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def check(self):
+        """Checks the pools once and returns the delay until the next check."""
+        # Prices may be no older than the interval the check was scheduled with, or PRICE_TTL if that is longer.
+        prices = await get_current_prices(self.delay)
+        if prices and all(price is None for price in prices.values()):
+            return CHECK_MAX_INTERVAL
+        result = await check_pool_conditions()
+
+        # Submitted pools stay claimed in the finalization registry until their transactions are
+        # mined, so later checks report them in flight instead of sending them again.
+        if any(r["status"] == "submitted" for r in result.get("results", [])):
+            for callback in self._callbacks:
+                asyncio.create_task(callback(result))
+
+        now = time.time()
+        delay = earliest_check_delay(prices, now, await pool_cache.nearest_triggers(prices, now))
+        logger.debug(f"Scheduler: Next pool check in {delay}s.")
+        return delay
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            if not self.lease.held:
+                continue
+            try:
+                await get_current_prices(TICK_INTERVAL)
+            except Exception as e:
+                logger.error(f"Scheduler: Error recording price ticks: {str(e)}")
+
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(POOL_RECONCILE_INTERVAL)
+            await pool_cache.reconcile()
+
+
+scheduler = PoolScheduler(LeaderLease())
+
+
 def start_scheduler():
-    """Starts the background scheduler to periodically check pool conditions."""
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(lambda: asyncio.run(check_pool_conditions()), 'interval', minutes=1, id='check_pools')
+    """Starts the pool scheduler on the running event loop."""
     scheduler.start()
-    logger.info("Scheduler started and pool checks are running every 1 minute.")
+    logger.info("Scheduler started; pool checks run on the process holding the leader lease.")
+    return scheduler
+
+
+def stop_scheduler():
+    scheduler.stop()
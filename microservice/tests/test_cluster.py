@@ -0,0 +1,32 @@
+from cluster import expired_prices, fresh_resolutions, live_members, drain
+from config import PRICE_MAX_AGE, WORKER_TIMEOUT
+import queue
+import time
+
+
+def test_only_recent_heartbeats_are_live():
+    now = time.time()
+    members = {"a": (now, 1.0, {"bitcoin"}), "b": (now - WORKER_TIMEOUT - 1, 2.0, set())}
+    assert live_members(members) == {"a": (1.0, {"bitcoin"})}
+
+
+def test_prices_older_than_the_max_age_are_expired():
+    now = 1000
+    prices = {"bitcoin": 1, "ethereum": 2, "solana": None}
+    fetched_at = {"bitcoin": now - PRICE_MAX_AGE, "ethereum": now - PRICE_MAX_AGE - 1, "solana": None}
+    assert expired_prices(prices, fetched_at, now) == {"ethereum"}
+
+
+def test_resolutions_priced_too_long_ago_are_dropped():
+    now = 1000
+    batch = [(1, 10, now), (2, 20, now - PRICE_MAX_AGE - 1), (3, 30, now - PRICE_MAX_AGE)]
+    assert fresh_resolutions(batch, now) == {1: 10, 3: 30}
+
+
+def test_drain_takes_what_is_queued_up_to_the_limit():
+    resolutions = queue.Queue()
+    assert drain(resolutions, 10, timeout=0) == []
+    for i in range(5):
+        resolutions.put(i)
+    assert drain(resolutions, 3) == [0, 1, 2]
+    assert drain(resolutions, 3) == [3, 4]
@@ -0,0 +1,146 @@
+from types import SimpleNamespace
+import asyncio
+import event_listener
+import pytest
+
+
+class FakeEth:
+    """eth namespace serving eth_getLogs from a handler(from_block, to_block)."""
+
+    def __init__(self, head, handler=None):
+        self.head = head
+        self.handler = handler or (lambda from_block, to_block: [])
+        self.queries = []
+
+    @property
+    def block_number(self):
+        async def head():
+            return self.head
+        return head()
+
+    async def get_logs(self, params):
+        self.queries.append((params['fromBlock'], params['toBlock']))
+        return self.handler(params['fromBlock'], params['toBlock'])
+
+
+@pytest.fixture
+def listener(tmp_path, monkeypatch):
+    """Runs the listener against a FakeEth, with its checkpoint file under tmp_path."""
+    def install(eth):
+        fake = SimpleNamespace(web3=SimpleNamespace(eth=eth), contract=SimpleNamespace(address="0xcontract"), abi=[])
+        monkeypatch.setattr(event_listener, "clients", fake)
+        return eth
+
+    handled = []
+
+    async def handle_logs(logs, checkpoint):
+        handled.extend(logs)
+
+    monkeypatch.setattr(event_listener, "BLOCK_TRACK_FILE", str(tmp_path / "checkpoint.json"))
+    monkeypatch.setattr(event_listener, "handle_logs", handle_logs)
+    monkeypatch.setattr(event_listener, "EVENT_LISTENER_RETRY_MIN", 0.01)
+    monkeypatch.setattr(event_listener, "BACKFILL_CHUNK_SIZE", 100)
+    event_listener.contract_events.cache_clear()
+    yield SimpleNamespace(install=install, handled=handled)
+    event_listener.contract_events.cache_clear()
+
+
+@pytest.mark.parametrize("message", [
+    "query returned more than 10000 results",
+    "Log response size exceeded. You can make eth_getLogs requests with up to a 2K block range",
+    "exceed maximum block range: 5000",
+    "block range is too wide",
+    "eth_getLogs and eth_newFilter are limited to a 10,000 blocks range",
+])
+def test_result_size_errors(message):
+    assert event_listener.is_result_size_error(ValueError({"code": -32005, "message": message}))
+    assert not event_listener.is_rate_limit_error(ValueError(message))
+
+
+@pytest.mark.parametrize("message", [
+    "rate limit exceeded",
+    "429 Client Error: Too Many Requests for url: https://rpc.example",
+    "daily request limit reached",
+    "Your app has exceeded its compute units per second capacity",
+])
+def test_rate_limit_errors_are_not_result_size_errors(message):
+    assert event_listener.is_rate_limit_error(ValueError(message))
+    assert not event_listener.is_result_size_error(ValueError(message))
+
+
+def test_backfill_shrinks_ranges_the_provider_rejects(listener):
+    def handler(from_block, to_block):
+        if to_block - from_block + 1 > 25:
+            raise ValueError("query returned more than 10000 results")
+        return [(from_block, to_block)]
+
+    eth = listener.install(FakeEth(199, handler))
+    checkpoint = event_listener.Checkpoint()
+    checkpoint.advance(99)
+    asyncio.run(event_listener.backfill(checkpoint))
+    assert [query for query in eth.queries if query[1] - query[0] + 1 <= 25][0] == (100, 124)
+    assert listener.handled[-1][1] == 199
+    assert checkpoint.block_number == 199
+
+
+def test_backfill_backs_off_on_rate_limits_without_shrinking(listener):
+    failures = iter([True, True, False])
+
+    def handler(from_block, to_block):
+        if from_block == 100 and next(failures):
+            raise ValueError("rate limit exceeded")
+        return []
+
+    eth = listener.install(FakeEth(199, handler))
+    checkpoint = event_listener.Checkpoint()
+    checkpoint.advance(99)
+    asyncio.run(event_listener.backfill(checkpoint))
+    assert eth.queries == [(100, 199)] * 3
+    assert checkpoint.block_number == 199
+
+
+def test_checkpoint_covers_logs_up_to_its_position():
+    checkpoint = event_listener.Checkpoint()
+    assert not checkpoint.is_processed(1, 0)
+    checkpoint.advance(10, 3)
+    assert checkpoint.is_processed(9, 50) and checkpoint.is_processed(10, 3)
+    assert not checkpoint.is_processed(10, 4) and not checkpoint.is_processed(11, 0)
+    checkpoint.advance(10)
+    assert checkpoint.is_processed(10, 99)
+
+
+def test_backfill_resumes_from_the_stored_checkpoint(listener):
+    def failing(from_block, to_block):
+        if from_block >= 200:
+            raise RuntimeError("connection lost")
+        return []
+
+    listener.install(FakeEth(299, failing))
+    checkpoint = event_listener.Checkpoint(interval=0)
+    checkpoint.advance(99)
+    with pytest.raises(RuntimeError):
+        asyncio.run(event_listener.backfill(checkpoint))
+
+    eth = listener.install(FakeEth(299))
+    resumed = event_listener.Checkpoint()
+    assert resumed.load() == (199, None)
+    asyncio.run(event_listener.backfill(resumed))
+    assert eth.queries[0][0] == 200
+    assert event_listener.Checkpoint().load() == (299, None)
+
+
+def test_backfill_rereads_a_partly_handled_block(listener):
+    event_listener.store_last_processed_block(150, 3)
+    eth = listener.install(FakeEth(160))
+    checkpoint = event_listener.Checkpoint()
+    checkpoint.load()
+    asyncio.run(event_listener.backfill(checkpoint))
+    assert eth.queries[0] == (150, 160)
+
+
+def test_backfill_without_a_checkpoint_starts_at_the_head(listener, monkeypatch):
+    monkeypatch.setattr(event_listener, "BACKFILL_START_BLOCK", None)
+    eth = listener.install(FakeEth(500))
+    asyncio.run(event_listener.backfill(event_listener.Checkpoint()))
+    assert eth.queries == []
+    assert event_listener.Checkpoint().load() == (500, None)
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+from fee_oracle import FeeOracle
+import asyncio
+import fee_oracle
+import pytest
+
+SENDER = "0x" + "11" * 20
+CONTRACT = "0x" + "22" * 20
+
+
+class FakeNode:
+    """Provider and web3 stand-in estimating 1000 gas per calldata byte, failing calldata ending in ff."""
+
+    routes_batches = True
+
+    def __init__(self):
+        self.provider = self
+        self.eth = self
+        self.base_fee = 100
+        self.chain_balance = 10 ** 18
+        self.estimates = []
+        self.fee_reads = 0
+        self.balance_reads = 0
+
+    async def fee_history(self, blocks, newest, percentiles):
+        self.fee_reads += 1
+        return {"baseFeePerGas": [self.base_fee - 10, self.base_fee], "reward": [[1], [3], [2]]}
+
+    async def get_balance(self, address):
+        self.balance_reads += 1
+        return self.chain_balance
+
+    async def make_batch_request(self, requests):
+        responses = []
+        for i, (method, params) in enumerate(requests):
+            data = params[0]["data"]
+            self.estimates.append(data)
+            if data.endswith("ff"):
+                responses.append({"id": i, "error": {"code": 3, "message": "execution reverted"}})
+            else:
+                responses.append({"id": i, "result": hex(1000 * (len(data) - 2) // 2)})
+        return responses
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(fee_oracle, "time", SimpleNamespace(monotonic=lambda: now.value))
+    monkeypatch.setattr(fee_oracle, "GAS_ESTIMATE_MARGIN", 1.5)
+    return now
+
+
+def test_fees_follow_the_fee_history_once_per_block(clock):
+    node = FakeNode()
+    oracle = FeeOracle(node)
+
+    async def run():
+        assert await oracle.fees() == (2 * 100 + 2, 2)
+        node.base_fee = 200
+        assert await oracle.fees() == (202, 2)
+        clock.value += fee_oracle.BLOCK_TIME
+        assert await oracle.fees() == (402, 2)
+
+    asyncio.run(run())
+    assert node.fee_reads == 2
+
+
+def test_gas_limits_are_memoized_per_calldata_shape(clock):
+    node = FakeNode()
+    oracle = FeeOracle(node)
+    calls = [("createPool", "0x0102"), ("createPool", "0x0304"), ("createPool", "0x01020304")]
+
+    async def run():
+        assert await oracle.gas_limits(SENDER, CONTRACT, calls) == [3000, 3000, 6000]
+        assert await oracle.gas_limits(SENDER, CONTRACT, [("createPool", "0x0506")]) == [3000]
+        clock.value += fee_oracle.GAS_ESTIMATE_TTL
+        await oracle.gas_limits(SENDER, CONTRACT, [("createPool", "0x0506")])
+
+    asyncio.run(run())
+    assert node.estimates == ["0x0102", "0x0304", "0x01020304", "0x0506"]
+
+
+def test_state_dependent_and_failed_estimates_are_not_cached(clock):
+    node = FakeNode()
+    oracle = FeeOracle(node)
+    calls = [("resolvePool", "0x01"), ("createPool", "0x01ff")]
+
+    async def run():
+        for _ in range(2):
+            limits = await oracle.gas_limits(SENDER, CONTRACT, calls)
+            assert limits == [1500, "Gas estimation failed: execution reverted"]
+
+    asyncio.run(run())
+    assert node.estimates == ["0x01", "0x01ff"] * 2
+
+
+def test_balance_is_tracked_locally_between_resyncs(clock):
+    node = FakeNode()
+    oracle = FeeOracle(node)
+
+    async def run():
+        assert await oracle.balance(SENDER) == 10 ** 18
+        oracle.spend(10 ** 17)
+        assert await oracle.balance(SENDER) == 9 * 10 ** 17
+        clock.value += fee_oracle.BALANCE_REFRESH_INTERVAL
+        assert await oracle.balance(SENDER) == 10 ** 18
+
+    asyncio.run(run())
+    assert node.balance_reads == 2
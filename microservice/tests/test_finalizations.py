@@ -0,0 +1,56 @@
+from finalizations import FinalizationRegistry
+from receipt_tracker import PENDING, SUCCESS, DROPPED
+import asyncio
+
+
+def submitted(tx_hash):
+    return {"status": "submitted", "transaction_hash": tx_hash}
+
+
+def finished(pool_id, tx_hash, status):
+    return {"kind": "resolvePool", "pool_id": pool_id, "transaction_hash": tx_hash, "status": status}
+
+
+def test_claimed_pools_are_not_claimed_again():
+    async def run():
+        registry = FinalizationRegistry()
+        claimed, existing = registry.claim([1, 2])
+        assert claimed == {1, 2} and existing == {}
+
+        claimed, existing = registry.claim([2, 3])
+        assert claimed == {3}
+        assert set(existing) == {2}
+        registry.publish(2, submitted("0xa"))
+        assert (await existing[2])["transaction_hash"] == "0xa"
+
+    asyncio.run(run())
+
+
+def test_unsent_finalizations_are_released_at_once():
+    async def run():
+        registry = FinalizationRegistry()
+        registry.claim([1])
+        registry.publish(1, {"status": "error", "message": "Simulation failed"})
+        assert 1 not in registry
+        assert registry.claim([1])[0] == {1}
+
+    asyncio.run(run())
+
+
+def test_sent_finalizations_are_released_once_their_transaction_finishes():
+    async def run():
+        registry = FinalizationRegistry()
+        registry.claim([1, 2])
+        registry.publish(1, submitted("0xa"))
+        registry.publish(2, submitted("0xb"))
+
+        registry.finish(finished(1, "0xa", PENDING))
+        registry.finish({**finished(1, "0xa", SUCCESS), "kind": "createPool"})
+        registry.finish(finished(1, "0xother", SUCCESS))
+        assert 1 in registry
+
+        registry.finish(finished(1, "0xa", SUCCESS))
+        registry.finish(finished(2, "0xb", DROPPED))
+        assert len(registry) == 0
+
+    asyncio.run(run())
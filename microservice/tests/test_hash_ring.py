@@ -0,0 +1,41 @@
+from hash_ring import HashRing
+from collections import Counter
+
+POOLS = range(20000)
+
+
+def owners(ring):
+    return {pool_id: ring.owner(pool_id) for pool_id in POOLS}
+
+
+def test_empty_ring_has_no_owner():
+    assert HashRing().owner(1) is None
+
+
+def test_owner_is_deterministic_and_independent_of_insertion_order():
+    assert owners(HashRing(["a", "b", "c"])) == owners(HashRing(["c", "a", "b"]))
+
+
+def test_shards_are_roughly_even():
+    counts = Counter(owners(HashRing([f"worker-{i}" for i in range(4)])).values())
+    assert len(counts) == 4
+    assert max(counts.values()) < 1.5 * len(POOLS) / 4
+
+
+def test_adding_a_node_only_moves_pools_to_it():
+    ring = HashRing(["a", "b", "c"])
+    before = owners(ring)
+    ring.add("d")
+    after = owners(ring)
+    moved = [pool_id for pool_id in POOLS if before[pool_id] != after[pool_id]]
+    assert all(after[pool_id] == "d" for pool_id in moved)
+    assert len(moved) < 1.5 * len(POOLS) / 4
+
+
+def test_removing_a_node_restores_the_previous_assignment():
+    ring = HashRing(["a", "b", "c"])
+    before = owners(ring)
+    ring.add("d")
+    ring.remove("d")
+    assert owners(ring) == before
+    assert ring.nodes == {"a", "b", "c"}
@@ -0,0 +1,78 @@
+from log_service import read_lines_backwards, tail, RingBufferHandler
+import logging
+import os
+import pytest
+
+
+def line(second, level, message, name="pool_monitor"):
+    return f"2026-01-01 00:00:{second:02d},000 - {level} - {name} - {message}\n"
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = tmp_path / "service.log"
+    path.write_text(
+        line(1, "INFO", "Pool 1 created") +
+        line(2, "ERROR", "Error checking pool 2") +
+        "Traceback (most recent call last):\n" +
+        "ValueError: boom\n" +
+        line(3, "INFO", "Pool 3 created") +
+        line(4, "WARNING", "Pool 1 near its target", name="scheduler")
+    )
+    return str(path)
+
+
+def test_lines_are_read_backwards_across_blocks(log_file):
+    with open(log_file) as file:
+        lines = file.read().splitlines()
+    assert [text for _, text in read_lines_backwards(log_file, block_size=7)] == lines[::-1]
+    offset, text = list(read_lines_backwards(log_file))[1]
+    with open(log_file, "rb") as file:
+        file.seek(offset)
+        assert file.readline().decode().rstrip("\n") == text
+
+
+def test_tail_pages_backwards_with_the_cursor(log_file):
+    entries, cursor = tail(log_file, n=2)
+    assert [entry["message"] for entry in entries] == ["Pool 3 created", "Pool 1 near its target"]
+
+    entries, cursor = tail(log_file, n=2, cursor=cursor)
+    assert entries[1]["message"] == "Error checking pool 2\nTraceback (most recent call last):\nValueError: boom"
+    assert entries[0]["message"] == "Pool 1 created" and cursor is None
+
+
+def test_tail_filters_entries(log_file):
+    entries, _ = tail(log_file, min_level=logging.WARNING)
+    assert [entry["level"] for entry in entries] == ["ERROR", "WARNING"]
+    entries, _ = tail(log_file, pool_id=1, module="pool_monitor")
+    assert [entry["message"] for entry in entries] == ["Pool 1 created"]
+
+
+def test_cursors_into_a_rotated_file_restart_from_the_newest_entries(log_file):
+    _, cursor = tail(log_file, n=1)
+    os.rename(log_file, f"{log_file}.1")
+    with open(log_file, "w") as file:
+        file.write(line(5, "INFO", "Pool 5 created"))
+
+    entries, next_cursor = tail(log_file, n=1, cursor=cursor)
+    assert [entry["message"] for entry in entries] == ["Pool 5 created"] and next_cursor is None
+
+
+@pytest.mark.parametrize("cursor", ["12", "abc:10", "12:-1", ""])
+def test_malformed_cursors_are_rejected(log_file, cursor):
+    with pytest.raises(ValueError):
+        tail(log_file, cursor=cursor)
+
+
+def test_ring_buffer_resumes_after_a_sequence_number():
+    buffer = RingBufferHandler(capacity=2)
+    logger = logging.getLogger("tests.ring_buffer")
+    logger.addHandler(buffer)
+    try:
+        for pool_id in range(3):
+            logger.warning(f"Pool {pool_id} triggered")
+    finally:
+        logger.removeHandler(buffer)
+
+    assert [entry["pool_id"] for entry in buffer.recent()] == [1, 2]
+    assert [entry["seq"] for entry in buffer.recent(after=2)] == [3]
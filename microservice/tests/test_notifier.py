@@ -0,0 +1,65 @@
+from notifier import Notifier, POOL_CHANNEL, PRICE_CHANNEL, parse_webhooks, split_digest
+import asyncio
+import httpx
+import json
+
+WEBHOOK = "https://discord.test/webhook/pools"
+
+
+class FakeDiscord:
+    """Webhook endpoint recording posted contents, answering with queued responses first."""
+
+    def __init__(self):
+        self.posts = []
+        self.responses = []
+
+    def __call__(self, request):
+        self.posts.append((str(request.url), json.loads(request.content)["content"]))
+        return self.responses.pop(0) if self.responses else httpx.Response(204)
+
+
+def dispatch(discord, events, queue_size=10):
+    """Queues events, then runs the dispatcher until it has sent them."""
+    async def run():
+        notifier = Notifier(webhooks={POOL_CHANNEL: WEBHOOK}, default_webhook=None, window=0.01,
+                            queue_size=queue_size, transport=httpx.MockTransport(discord))
+        results = [notifier.notify(*event) for event in events]
+        notifier.start()
+        await asyncio.sleep(0.2)
+        await notifier.close()
+        return results
+
+    return asyncio.run(run())
+
+
+def test_events_are_coalesced_into_one_digest_per_window():
+    discord = FakeDiscord()
+    dispatch(discord, [
+        (POOL_CHANNEL, "Pool 1 created"),
+        (POOL_CHANNEL, "Pool 2 at 10%", 2),
+        (POOL_CHANNEL, "Pool 3 created"),
+        (POOL_CHANNEL, "Pool 2 at 20%", 2),
+        (PRICE_CHANNEL, "BTC at $60000"),
+    ])
+    assert discord.posts == [(WEBHOOK, "Pool 1 created\nPool 3 created\nPool 2 at 20%")]
+
+
+def test_a_full_queue_drops_events_and_reports_them():
+    discord = FakeDiscord()
+    results = dispatch(discord, [(POOL_CHANNEL, f"Pool {pool_id} created") for pool_id in range(4)], queue_size=2)
+    assert results == [True, True, False, False]
+    assert discord.posts[0][1].splitlines() == [
+        "Pool 0 created", "Pool 1 created", "(2 more updates were dropped while the queue was full)"]
+
+
+def test_rate_limited_posts_are_retried_after_the_limit():
+    discord = FakeDiscord()
+    discord.responses.append(httpx.Response(429, json={"retry_after": 0.05}))
+    dispatch(discord, [(POOL_CHANNEL, "Pool 1 created")])
+    assert [content for _, content in discord.posts] == ["Pool 1 created"] * 2
+
+
+def test_digests_fit_the_message_limit():
+    assert split_digest(["a" * 6, "b" * 3, "c" * 12], limit=10) == ["aaaaaa\nbbb", "ccccccc..."]
+    assert parse_webhooks(" pool-updates=https://a, price-updates=https://b,broken") == {
+        POOL_CHANNEL: "https://a", PRICE_CHANNEL: "https://b"}
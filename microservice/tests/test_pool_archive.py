@@ -0,0 +1,54 @@
+from config import ASSET_ID
+from pool_archive import PoolArchive
+import sqlite3
+
+
+def archive(tmp_path):
+    return PoolArchive(str(tmp_path / "pools.db"))
+
+
+def test_pools_without_a_tag_track_the_default_asset(tmp_path):
+    pools = archive(tmp_path)
+    assert pools.record_created(1, "0xcreator", 100, 50, 1000, transaction_hash="0xuntagged") == ASSET_ID
+    assert pools.asset(1) == ASSET_ID
+
+
+def test_tags_apply_in_either_order(tmp_path):
+    pools = archive(tmp_path)
+    pools.tag_transaction("0xa", "ethereum")
+    assert pools.record_created(1, "0xcreator", 100, 50, 1000, transaction_hash="0xa") == "ethereum"
+
+    pools.record_created(2, "0xcreator", 100, 50, 1000, transaction_hash="0xb")
+    assert pools.tag_transaction("0xb", "solana") == [2]
+    assert pools.assets([1, 2, 3]) == {1: "ethereum", 2: "solana", 3: ASSET_ID}
+
+
+def test_migration_fills_missing_assets(tmp_path):
+    path = str(tmp_path / "pools.db")
+    pools = archive(tmp_path)
+    pools.record_created(1, "0xcreator", 100, 50, 1000, transaction_hash="0xa")
+    pools.commit()
+    db = sqlite3.connect(path)
+    db.execute("UPDATE pools SET asset = NULL")
+    db.commit()
+    db.close()
+    assert PoolArchive(path).asset(1) == ASSET_ID
+
+
+def test_query_pages_with_an_id_cursor(tmp_path):
+    pools = archive(tmp_path)
+    for pool_id in range(5):
+        pools.record_created(pool_id, "0xcreator" if pool_id % 2 else "0xother", 100, 50, 1000 + pool_id)
+    pools.record_finalized(3, 120, "TARGET_REACHED", timestamp=2000)
+
+    page, cursor = pools.query(limit=2)
+    assert [pool["pool_id"] for pool in page] == [0, 1] and cursor == 1
+    page, cursor = pools.query(cursor=cursor, limit=2)
+    assert [pool["pool_id"] for pool in page] == [2, 3] and cursor == 3
+    page, cursor = pools.query(cursor=cursor, limit=2)
+    assert [pool["pool_id"] for pool in page] == [4] and cursor is None
+
+    page, _ = pools.query(creator="0xcreator", finalized=False)
+    assert [pool["pool_id"] for pool in page] == [1]
+    page, _ = pools.query(ends_after=1002, finalized_after=1500)
+    assert [(pool["pool_id"], pool["final_price"]) for pool in page] == [(3, 120)]
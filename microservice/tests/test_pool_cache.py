@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+from config import ASSET_ID, PRICE_SCALE
+from contract_service import PoolRecord
+from pool_archive import PoolArchive
+from tick_history import TickHistory
+from trigger_index import TARGET_REACHED
+import asyncio
+import pool_cache
+import pytest
+import time
+
+
+def wei(price):
+    return price * PRICE_SCALE
+
+
+def record(pool_id, target_price=110, stop_loss=90, end_time=None, is_finalized=False):
+    return PoolRecord(pool_id, "0xcreator", wei(target_price), wei(stop_loss), end_time or time.time() + 86400,
+                      is_finalized, 0, "")
+
+
+class FakeChain:
+    """Contract serving getActivePools/poolCounter, and pool details whose snapshot is taken before on_load runs."""
+
+    def __init__(self, pools):
+        self.pools = {pool.pool_id: pool for pool in pools}
+        self.on_load = None
+        self.functions = SimpleNamespace(getActivePools=self._call(self._active), poolCounter=self._call(self._counter))
+
+    @staticmethod
+    def _call(result):
+        async def call():
+            return result()
+        return lambda: SimpleNamespace(call=call)
+
+    def _active(self):
+        return [pool_id for pool_id, pool in self.pools.items() if not pool.is_finalized]
+
+    def _counter(self):
+        return max(self.pools, default=-1) + 1
+
+    async def get_pool_details_many(self, pool_ids):
+        snapshot = {pool_id: self.pools[pool_id] for pool_id in pool_ids}
+        if self.on_load is not None:
+            self.on_load()
+        await asyncio.sleep(0)
+        return snapshot
+
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch):
+    def install(*pools):
+        fake = FakeChain(pools)
+        monkeypatch.setattr(pool_cache, "clients", SimpleNamespace(contract=fake))
+        monkeypatch.setattr(pool_cache, "get_pool_details_many", fake.get_pool_details_many)
+        return fake
+
+    monkeypatch.setattr(pool_cache, "pool_archive", PoolArchive(str(tmp_path / "pools.db")))
+    return install
+
+
+def test_events_applied_during_a_seed_are_replayed_over_the_snapshot(chain):
+    fake = chain(record(1), record(2))
+    cache = pool_cache.PoolCache()
+
+    def events():
+        fake.on_load = None
+        cache.on_pool_finalized(1, wei(100), "TARGET_REACHED")
+        cache.on_pool_created(3, "0xcreator", wei(120), wei(80), time.time() + 60)
+
+    fake.on_load = events
+    pools = asyncio.run(cache.active_pools())
+    assert [pool_id for pool_id, _ in pools] == [2, 3]
+
+
+def test_reconcile_corrects_missed_events(chain):
+    fake = chain(record(1), record(2))
+    cache = pool_cache.PoolCache()
+    asyncio.run(cache.ensure_seeded())
+
+    fake.pools[2] = fake.pools[2]._replace(is_finalized=True)
+    fake.pools[4] = record(4, target_price=105)
+    asyncio.run(cache.reconcile())
+    assert [pool_id for pool_id, _ in asyncio.run(cache.active_pools())] == [1, 4]
+    assert [hit[0] for hit in asyncio.run(cache.triggered_pools({ASSET_ID: wei(106)}, time.time()))] == [4]
+
+
+def test_triggered_pools_are_found_again_until_finalized(chain):
+    chain(record(1))
+    cache = pool_cache.PoolCache()
+    asyncio.run(cache.ensure_seeded())
+    start = time.time()
+    history = TickHistory(16)
+    ticks = SimpleNamespace(history=lambda asset: history)
+
+    for offset, price in enumerate([100, 115, 100], start=1):
+        history.append(start + offset, wei(price))
+    hits = asyncio.run(cache.triggered_pools({ASSET_ID: wei(100)}, start + 3, ticks))
+    assert [(pool_id, outcome, price) for pool_id, _, outcome, price in hits] == [(1, TARGET_REACHED, wei(115))]
+
+    history.append(start + 4, wei(100))
+    hits = asyncio.run(cache.triggered_pools({ASSET_ID: wei(100)}, start + 4, ticks))
+    assert [(pool_id, price) for pool_id, _, _, price in hits] == [(1, wei(115))]
+
+    cache.on_pool_finalized(1, wei(115), "TARGET_REACHED")
+    history.append(start + 5, wei(100))
+    assert asyncio.run(cache.triggered_pools({ASSET_ID: wei(100)}, start + 5, ticks)) == []
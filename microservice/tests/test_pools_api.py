@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+from pool_archive import PoolArchive
+import main
+import pytest
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """Serves the API, without its startup tasks, from an archive under tmp_path."""
+    pools = PoolArchive(str(tmp_path / "pools.db"))
+    monkeypatch.setattr(main, "pool_archive", pools)
+    return TestClient(main.app), pools
+
+
+def test_unchanged_pool_lists_answer_304(api):
+    client, pools = api
+    pools.record_created(1, "0xcreator", 100, 50, 1000)
+    response = client.get("/pools")
+    assert response.status_code == 200 and response.json()["next_cursor"] is None
+    etag = response.headers["etag"]
+
+    assert client.get("/pools", headers={"If-None-Match": etag}).status_code == 304
+    pools.record_finalized(1, 120, "TARGET_REACHED")
+    response = client.get("/pools", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+
+
+def test_finalized_pools_are_immutable(api):
+    client, pools = api
+    pools.record_created(1, "0xcreator", 100, 50, 1000)
+    assert client.get("/pools/1").headers["cache-control"] == "no-cache"
+    pools.record_finalized(1, 120, "TARGET_REACHED")
+    assert "immutable" in client.get("/pools/1").headers["cache-control"]
+    assert client.get("/pools/2").status_code == 404
+
+
+def test_pool_lists_follow_the_cursor(api):
+    client, pools = api
+    for pool_id in range(3):
+        pools.record_created(pool_id, "0xcreator", 100, 50, 1000)
+    first = client.get("/pools", params={"limit": 2}).json()
+    second = client.get("/pools", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [pool["pool_id"] for pool in first["pools"] + second["pools"]] == [0, 1, 2]
+    assert second["next_cursor"] is None
+    assert client.get("/pools", params={"limit": 0}).status_code == 400
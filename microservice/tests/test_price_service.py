@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+from web3 import Web3
+import asyncio
+import httpx
+import price_service
+import pytest
+
+
+class FakeCoinGecko:
+    """simple/price endpoint quoting every asset at a fixed USD price, or answering with a queued status."""
+
+    def __init__(self, usd=100):
+        self.usd = usd
+        self.requests = []
+        self.statuses = []
+
+    async def __call__(self, request):
+        self.requests.append(request.url.params["ids"].split(","))
+        await asyncio.sleep(0)
+        if self.statuses:
+            return httpx.Response(self.statuses.pop(0), headers={"Retry-After": "10"})
+        return httpx.Response(200, json={asset: {"usd": self.usd} for asset in self.requests[-1]})
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(price_service, "time", SimpleNamespace(monotonic=lambda: now.value, time=lambda: now.value))
+    return now
+
+
+def service(api, **kwargs):
+    return price_service.PriceService(ttl=30, max_stale=120, asset_id="bitcoin",
+                                      transport=httpx.MockTransport(api), **kwargs)
+
+
+def test_prices_are_cached_for_the_ttl(clock):
+    api = FakeCoinGecko()
+    prices = service(api)
+
+    async def run():
+        assert await prices.get_price() == Web3.to_wei(100, "ether")
+        clock.value += 29
+        await prices.get_price(max_age=1)
+        assert prices.fresh_for() == 1
+        clock.value += 2
+        await prices.get_price()
+
+    asyncio.run(run())
+    assert api.requests == [["bitcoin"], ["bitcoin"]]
+
+
+def test_stale_assets_share_one_request(clock):
+    api = FakeCoinGecko()
+    prices = service(api)
+
+    async def run():
+        return await asyncio.gather(prices.get_prices(["bitcoin", "ethereum"]), prices.get_price(asset="ethereum"))
+
+    both, ethereum = asyncio.run(run())
+    assert set(both) == {"bitcoin", "ethereum"} and ethereum == both["ethereum"]
+    assert api.requests == [["bitcoin", "ethereum"]]
+
+
+def test_rate_limits_serve_cached_prices_until_they_are_too_old(clock):
+    api = FakeCoinGecko()
+    prices = service(api)
+
+    async def run():
+        await prices.get_price()
+        clock.value += 31
+        api.statuses.append(429)
+        assert await prices.get_price() == Web3.to_wei(100, "ether")
+        clock.value += 5
+        assert await prices.get_price() == Web3.to_wei(100, "ether")
+        assert len(api.requests) == 2
+        clock.value += 90
+        api.statuses.append(429)
+        assert await prices.get_price() is None
+        assert await prices.get_price(asset="ethereum") is None
+
+    asyncio.run(run())
+    assert len(api.requests) == 3
@@ -0,0 +1,98 @@
+from receipt_tracker import ReceiptTracker, PENDING, SUCCESS, REVERTED, DROPPED
+import asyncio
+import receipt_tracker
+
+
+class FakeNode:
+    """Provider and web3 stand-in answering receipt and transaction lookups from dictionaries."""
+
+    routes_batches = True
+
+    def __init__(self):
+        self.provider = self
+        self.receipts = {}
+        self.mempool = set()
+        self.failing = set()
+        self.requests = []
+
+    async def make_batch_request(self, requests):
+        responses = []
+        for i, (method, (tx_hash,)) in enumerate(requests):
+            self.requests.append((method, tx_hash))
+            if tx_hash in self.failing:
+                responses.append({"id": i, "error": {"code": -32000, "message": "header not found"}})
+            elif method == "eth_getTransactionReceipt":
+                responses.append({"id": i, "result": self.receipts.get(tx_hash)})
+            else:
+                responses.append({"id": i, "result": {"hash": tx_hash} if tx_hash in self.mempool else None})
+        return responses
+
+
+def receipt(status, block_number=7):
+    return {"status": hex(status), "blockNumber": hex(block_number), "gasUsed": hex(21000)}
+
+
+def test_mined_transactions_resolve_their_futures():
+    async def run():
+        node = FakeNode()
+        tracker = ReceiptTracker(node)
+        finished = []
+        tracker.add_callback(finished.append)
+        mined = tracker.track("0xa", kind="resolvePool", pool_id=1)
+        reverted = tracker.track("0xb")
+        tracker.track("0xc")
+
+        node.receipts = {"0xa": receipt(1), "0xb": receipt(0)}
+        await tracker.poll()
+        assert (await mined)["status"] == SUCCESS and (await reverted)["status"] == REVERTED
+        assert tracker.get("0xa")["block_number"] == 7 and tracker.get("0xa")["pool_id"] == 1
+        assert tracker.get("0xc")["status"] == PENDING and len(tracker) == 1
+        assert [transaction["transaction_hash"] for transaction in finished] == ["0xa", "0xb"]
+
+    asyncio.run(run())
+
+
+def test_only_transactions_the_node_forgot_are_dropped(monkeypatch):
+    monkeypatch.setattr(receipt_tracker, "TX_DROP_TIMEOUT", -1)
+
+    async def run():
+        node = FakeNode()
+        tracker = ReceiptTracker(node)
+        dropped = tracker.track("0xa")
+        tracker.track("0xb")
+        tracker.track("0xc")
+        node.mempool = {"0xb"}
+        node.failing = {"0xc"}
+
+        await tracker.poll()
+        assert (await dropped)["status"] == DROPPED
+        assert tracker.get("0xb")["status"] == PENDING and tracker.get("0xc")["status"] == PENDING
+
+    asyncio.run(run())
+
+
+def test_recent_transactions_are_not_looked_up():
+    async def run():
+        node = FakeNode()
+        tracker = ReceiptTracker(node)
+        tracker.track("0xa")
+        await tracker.poll()
+        assert node.requests == [("eth_getTransactionReceipt", "0xa")]
+
+    asyncio.run(run())
+
+
+def test_finished_history_is_bounded(monkeypatch):
+    monkeypatch.setattr(receipt_tracker, "TX_HISTORY_SIZE", 2)
+
+    async def run():
+        node = FakeNode()
+        tracker = ReceiptTracker(node)
+        for tx_hash in ["0xa", "0xb", "0xc"]:
+            tracker.track(tx_hash)
+            node.receipts[tx_hash] = receipt(1)
+        await tracker.poll()
+        assert tracker.get("0xa") is None
+        assert await tracker.wait("0xc") == tracker.get("0xc")
+
+    asyncio.run(run())
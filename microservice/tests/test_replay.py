@@ -0,0 +1,66 @@
+from config import PRICE_SCALE
+from replay import PoolArrays, PriceSeries, replay, synthetic_pools, random_walk, OPEN, TARGET, STOP, ENDED
+import numpy as np
+
+
+def series(highs, lows, closes=None):
+    times = 60 * np.arange(1, len(highs) + 1)
+    return PriceSeries(times.astype(np.float64), np.array(highs, np.int64), np.array(lows, np.int64),
+                       np.array(closes if closes is not None else lows, np.int64))
+
+
+def pools(*rows):
+    pool_ids, created_at, targets, stops, end_times = zip(*rows)
+    return PoolArrays.from_wei(pool_ids, created_at, [t * PRICE_SCALE for t in targets],
+                               [s * PRICE_SCALE for s in stops], end_times)
+
+
+def test_target_wins_within_a_candle_and_earlier_crossings_win():
+    prices = series([100, 120, 130, 100], [100, 80, 70, 100])
+    result = replay(pools((1, 0, 120, 80, 1000), (2, 0, 130, 90, 1000), (3, 60, 125, 70, 1000)), prices)
+    assert list(result.outcome) == [TARGET, STOP, TARGET]
+    assert list(result.resolved_at) == [120, 120, 180]
+    assert list(result.price) == [120, 80, 130]
+
+
+def test_candles_before_creation_are_ignored():
+    prices = series([200, 100, 100], [50, 100, 100])
+    result = replay(pools((1, 60, 150, 60, 1000)), prices)
+    assert result.outcome[0] == OPEN and np.isnan(result.resolved_at[0])
+
+
+def test_pools_end_at_the_last_close_before_their_end_time():
+    prices = series([100, 101, 102, 103], [100, 101, 102, 103], [100, 101, 102, 103])
+    result = replay(pools((1, 0, 200, 50, 150), (2, 0, 200, 50, 1000)), prices)
+    assert list(result.outcome) == [ENDED, OPEN]
+    assert result.resolved_at[0] == 150 and result.price[0] == 101
+
+
+def brute_force(pools, series):
+    outcomes = []
+    for i in range(len(pools)):
+        outcome = (OPEN, None, 0)
+        for t, high, low in zip(series.time, series.high, series.low):
+            if not pools.created_at[i] < t <= pools.end_time[i]:
+                continue
+            if high >= pools.target_price[i]:
+                outcome = (TARGET, t, high)
+                break
+            if low <= pools.stop_loss[i]:
+                outcome = (STOP, t, low)
+                break
+        if outcome[0] == OPEN and pools.end_time[i] <= series.time[-1]:
+            before = [close for t, close in zip(series.time, series.close) if t <= pools.end_time[i]]
+            outcome = (ENDED, pools.end_time[i], before[-1] if before else series.close[0])
+        outcomes.append(outcome)
+    return outcomes
+
+
+def test_replay_matches_brute_force():
+    prices = random_walk(2000, seed=1)
+    sample = synthetic_pools(500, prices, seed=1)
+    result = replay(sample, prices)
+    for i, (outcome, resolved_at, price) in enumerate(brute_force(sample, prices)):
+        assert result.outcome[i] == outcome
+        if outcome != OPEN:
+            assert (result.resolved_at[i], result.price[i]) == (resolved_at, price)
@@ -0,0 +1,146 @@
+from rpc_router import RpcRouter
+from web3 import Web3
+import asyncio
+import rpc_router
+
+
+class FakeProvider:
+    """Provider answering from a handler(method, params), optionally after a delay."""
+
+    has_persistent_connection = False
+
+    def __init__(self, handler, delay=0):
+        self.handler = handler
+        self.delay = delay
+        self.calls = []
+
+    async def make_request(self, method, params):
+        self.calls.append(method)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self.handler(method, params)
+
+
+def answer(result):
+    return lambda method, params: {"jsonrpc": "2.0", "id": 1, "result": result}
+
+
+def fail(method, params):
+    raise ConnectionError("unreachable")
+
+
+def router(providers, **kwargs):
+    kwargs.setdefault("hedge_delay", 0)
+    kwargs.setdefault("timeout", 5)
+    return RpcRouter(providers, **kwargs)
+
+
+def test_reads_fail_over_to_the_next_endpoint():
+    async def run():
+        rpc = router({"a": FakeProvider(fail), "b": FakeProvider(answer("0x1"))})
+        assert (await rpc.make_request("eth_blockNumber", []))["result"] == "0x1"
+        assert rpc.endpoints[0].failures == 1
+        assert not rpc.endpoints[0].is_open
+
+    asyncio.run(run())
+
+
+def test_circuit_opens_after_consecutive_failures():
+    async def run():
+        broken = FakeProvider(fail)
+        rpc = router({"a": broken, "b": FakeProvider(answer("0x1"))})
+        for _ in range(rpc_router.RPC_BREAKER_THRESHOLD):
+            await rpc.make_request("eth_blockNumber", [])
+        assert rpc.endpoints[0].is_open
+
+        calls = len(broken.calls)
+        await rpc.make_request("eth_blockNumber", [])
+        assert len(broken.calls) == calls
+
+    asyncio.run(run())
+
+
+def test_one_probe_closes_the_circuit_after_the_cooldown(monkeypatch):
+    monkeypatch.setattr(rpc_router, "RPC_BREAKER_COOLDOWN", 0)
+
+    async def run():
+        flaky = FakeProvider(fail)
+        rpc = router({"a": flaky, "b": FakeProvider(answer("0x1"))})
+        for _ in range(rpc_router.RPC_BREAKER_THRESHOLD):
+            await rpc.make_request("eth_blockNumber", [])
+        assert rpc.endpoints[0].is_open
+
+        flaky.handler = answer("0x2")
+        assert (await rpc.make_request("eth_blockNumber", []))["result"] == "0x2"
+        assert not rpc.endpoints[0].is_open
+
+    asyncio.run(run())
+
+
+def test_error_responses_are_answers_not_failures():
+    async def run():
+        reverted = {"jsonrpc": "2.0", "id": 1, "error": {"code": 3, "message": "execution reverted"}}
+        other = FakeProvider(answer("0x1"))
+        rpc = router({"a": FakeProvider(lambda method, params: reverted), "b": other})
+        assert await rpc.make_request("eth_call", [{}, "latest"]) == reverted
+        assert rpc.endpoints[0].failures == 0
+        assert other.calls == []
+
+    asyncio.run(run())
+
+
+def test_slow_reads_are_hedged_but_log_queries_are_not():
+    async def run():
+        slow = FakeProvider(answer("0xslow"), delay=0.5)
+        fast = FakeProvider(answer("0xfast"))
+        rpc = router({"slow": slow, "fast": fast}, hedge_delay=0.05)
+        assert (await rpc.make_request("eth_blockNumber", []))["result"] == "0xfast"
+        assert (await rpc.make_request("eth_getLogs", [{}]))["result"] == "0xslow"
+        assert fast.calls == ["eth_blockNumber"]
+
+    asyncio.run(run())
+
+
+def test_broadcast_already_known_counts_as_accepted():
+    async def run():
+        known = {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "already known"}}
+        nonce = {"jsonrpc": "2.0", "id": 1, "error": {"code": -32000, "message": "nonce too low"}}
+        rpc = router({"a": FakeProvider(lambda method, params: nonce),
+                      "b": FakeProvider(lambda method, params: known)}, broadcast_count=2)
+        response = await rpc.make_request("eth_sendRawTransaction", ["0x1234"])
+        assert response["result"] == Web3.to_hex(Web3.keccak(hexstr="0x1234"))
+
+    asyncio.run(run())
+
+
+def test_filters_stay_on_the_endpoint_that_created_them():
+    async def run():
+        creator = FakeProvider(answer("0xf1"))
+        other = FakeProvider(answer([]))
+        rpc = router({"a": creator, "b": other})
+        filter_id = (await rpc.make_request("eth_newFilter", [{}]))["result"]
+
+        rpc.endpoints[0].latency, rpc.endpoints[1].latency = 10, 0.001
+        await rpc.make_request("eth_getFilterChanges", [filter_id])
+        assert creator.calls == ["eth_newFilter", "eth_getFilterChanges"]
+        assert other.calls == []
+
+    asyncio.run(run())
+
+
+def test_pending_nonce_is_the_highest_among_broadcast_endpoints():
+    def node(nonce):
+        def handler(method, params):
+            if method == "eth_sendRawTransaction":
+                return {"jsonrpc": "2.0", "id": 1, "result": "0xhash"}
+            return {"jsonrpc": "2.0", "id": 1, "result": hex(nonce)}
+        return FakeProvider(handler)
+
+    async def run():
+        rpc = router({"a": node(5), "b": node(7), "c": node(9)}, broadcast_count=2)
+        await rpc.make_request("eth_sendRawTransaction", ["0x1234"])
+        await asyncio.sleep(0)
+        response = await rpc.make_request("eth_getTransactionCount", ["0xabc", "pending"])
+        assert response["result"] == hex(7)
+
+    asyncio.run(run())
@@ -0,0 +1,29 @@
+from config import CHECK_MIN_INTERVAL, CHECK_MAX_INTERVAL, CHECK_PRICE_RANGE
+from scheduler import next_check_delay, earliest_check_delay
+
+PRICE = 1000
+
+
+def test_checks_come_sooner_as_the_price_nears_a_threshold():
+    far = next_check_delay(PRICE, 0, (PRICE * (1 + CHECK_PRICE_RANGE), None, None))
+    near = next_check_delay(PRICE, 0, (PRICE * (1 + CHECK_PRICE_RANGE / 10), None, None))
+    assert far == CHECK_MAX_INTERVAL
+    assert near == CHECK_MAX_INTERVAL / 10
+    assert next_check_delay(PRICE, 0, (PRICE + 0.001, None, None)) == CHECK_MIN_INTERVAL
+    assert next_check_delay(PRICE, 0, (None, None, None)) is None
+
+
+def test_checks_wait_for_a_new_price():
+    assert next_check_delay(PRICE, 0, (PRICE + 0.001, None, None), fresh_for=20) == 20
+    # A pool ending sooner needs no new price.
+    assert next_check_delay(PRICE, 0, (PRICE + 0.001, None, 5), fresh_for=20) == 5
+    assert next_check_delay(PRICE, 0, (None, None, 100), fresh_for=20) == CHECK_MAX_INTERVAL
+
+
+def test_earliest_delay_across_assets():
+    nearest = {"a": (PRICE + 0.001, None, None), "b": (None, None, 10)}
+    fresh_for = {"a": 30, "b": 0}.get
+    assert earliest_check_delay({"a": PRICE, "b": PRICE}, 0, nearest, fresh_for) == 10
+    # Pools of an asset without a price are retried at the longest interval.
+    assert earliest_check_delay({"a": PRICE, "b": None, "c": None}, 0, {"a": (None, None, None)},
+                                fresh_for) == CHECK_MAX_INTERVAL
@@ -0,0 +1,116 @@
+from config import PRICE_SCALE
+from tick_history import (TickHistory, SparseTable, EMPTY_HIGH, EMPTY_LOW, NO_CROSSING, TARGET_CROSSED,
+                          STOP_CROSSED)
+import numpy as np
+import random
+
+
+def wei(price):
+    return price * PRICE_SCALE
+
+
+def filled(prices, capacity=None, path=None):
+    history = TickHistory(capacity or len(prices), path)
+    for i, price in enumerate(prices, start=1):
+        history.append(i, wei(price))
+    return history
+
+
+def test_ring_keeps_the_newest_ticks_in_order():
+    history = filled(range(1, 11), capacity=4)
+    times, prices = history.arrays()
+    assert list(times) == [7, 8, 9, 10]
+    assert list(prices) == [7, 8, 9, 10]
+    assert len(history) == 4 and history.last_time == 10
+
+
+def test_older_ticks_are_ignored():
+    history = filled([5, 6])
+    assert not history.append(2, wei(1))
+    assert not history.append(1.5, wei(1))
+    assert list(history.arrays()[1]) == [5, 6]
+
+
+def test_memory_mapped_history_survives_reopening(tmp_path):
+    path = str(tmp_path / "asset.ticks")
+    history = filled(range(1, 8), capacity=5, path=path)
+    history.flush()
+    del history
+
+    reopened = TickHistory(5, path)
+    assert list(reopened.arrays()[0]) == [3, 4, 5, 6, 7]
+    reopened.append(8, wei(8))
+    assert list(reopened.arrays()[1]) == [4, 5, 6, 7, 8]
+
+    resized = TickHistory(3, path)
+    assert list(resized.arrays()[0]) == [6, 7, 8]
+
+
+def test_windows_and_candles():
+    history = filled([10, 12, 9, 11, 15, 14, 13])
+    times, prices = history.window(2, 5)
+    assert list(times) == [3, 4, 5] and list(prices) == [9, 11, 15]
+    assert history.high_low(2, 5) == (wei(15), wei(9))
+    assert history.high_low(7, 10) == (None, None)
+
+    candles = history.ohlc(0, 7, 3)
+    assert list(candles["time"]) == [0, 3, 6]
+    assert list(candles["open"]) == [10, 9, 14]
+    assert list(candles["high"]) == [12, 15, 14]
+    assert list(candles["low"]) == [10, 9, 13]
+    assert list(candles["close"]) == [12, 15, 13]
+
+
+def test_sparse_table_matches_brute_force():
+    rng = np.random.default_rng(0)
+    values = rng.integers(-1000, 1000, 257)
+    table = SparseTable(values)
+    lo = rng.integers(0, 258, 2000)
+    hi = rng.integers(0, 258, 2000)
+    high, low = table.query(lo, hi)
+    for i in range(len(lo)):
+        window = values[lo[i]:hi[i]]
+        assert high[i] == (window.max() if len(window) else EMPTY_HIGH)
+        assert low[i] == (window.min() if len(window) else EMPTY_LOW)
+
+    thresholds = rng.integers(-1000, 1000, 2000)
+    first = table.first_at_least(lo, hi, thresholds)
+    for i in range(len(lo)):
+        hits = [j for j in range(lo[i], hi[i]) if values[j] >= thresholds[i]]
+        assert (first[i] == hits[0]) if hits else (first[i] >= hi[i])
+
+
+def test_same_tick_crossing_goes_to_the_target():
+    history = filled([100, 100, 200, 100])
+    # The stop loss is hit on the first tick, before the target.
+    crossing, price = history.crossings([0], [4], [wei(200)], [wei(100)])
+    assert crossing[0] == STOP_CROSSED and price[0] == 100
+    # The third tick hits both.
+    crossing, price = history.crossings([2], [4], [wei(200)], [wei(200)])
+    assert crossing[0] == TARGET_CROSSED and price[0] == 200
+
+
+def test_crossings_match_brute_force():
+    rng = random.Random(0)
+    prices = [rng.randint(50, 150) for _ in range(500)]
+    history = filled(prices, capacity=400)
+    times, scaled = history.arrays()
+
+    count = 1000
+    starts = [rng.uniform(0, 520) for _ in range(count)]
+    ends = [start + rng.uniform(0, 80) for start in starts]
+    targets = [rng.randint(100, 160) * PRICE_SCALE - rng.randint(0, 1) for _ in range(count)]
+    stops = [rng.randint(40, 100) * PRICE_SCALE + rng.randint(0, 1) for _ in range(count)]
+    crossing, price = history.crossings(starts, ends, targets, stops)
+
+    for i in range(count):
+        window = [int(p) for t, p in zip(times, scaled) if starts[i] < t <= ends[i]]
+        expected, expected_price = NO_CROSSING, 0
+        for p in window:
+            if p * PRICE_SCALE >= targets[i]:
+                expected, expected_price = TARGET_CROSSED, max(window)
+                break
+            if p * PRICE_SCALE <= stops[i]:
+                expected, expected_price = STOP_CROSSED, min(window)
+                break
+        assert (crossing[i], price[i]) == (expected, expected_price)
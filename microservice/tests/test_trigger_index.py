@@ -0,0 +1,77 @@
+from trigger_index import TriggerIndex, evaluate, TARGET_REACHED, STOP_LOSS_HIT, END_TIME_REACHED
+import random
+
+
+def random_pools(rng, count, start=0):
+    pools = []
+    for pool_id in range(start, start + count):
+        target_price = rng.randint(101, 200)
+        stop_loss = rng.randint(0, 99)
+        pools.append((pool_id, target_price, stop_loss, rng.randint(1000, 2000)))
+    return pools
+
+
+def brute_force(pools, price, now):
+    outcomes = {pool_id: evaluate(price, now, tp, sl, end_time) for pool_id, tp, sl, end_time in pools}
+    return {pool_id: outcome for pool_id, outcome in outcomes.items() if outcome is not None}
+
+
+def test_evaluate_follows_resolve_pool_precedence():
+    assert evaluate(150, 0, 150, 50, 100) == TARGET_REACHED
+    assert evaluate(50, 0, 150, 50, 100) == STOP_LOSS_HIT
+    assert evaluate(100, 100, 150, 50, 100) == END_TIME_REACHED
+    assert evaluate(100, 99, 150, 50, 100) is None
+    # A target at or below the stop loss hits both; the target wins as in the contract.
+    assert evaluate(100, 200, 100, 100, 100) == TARGET_REACHED
+
+
+def test_triggered_matches_brute_force():
+    rng = random.Random(0)
+    pools = random_pools(rng, 500)
+    index = TriggerIndex()
+    index.rebuild(pools)
+    for _ in range(200):
+        price, now = rng.randint(-10, 210), rng.randint(900, 2100)
+        assert index.triggered(price, now) == brute_force(pools, price, now)
+
+
+def test_add_and_remove_keep_the_index_consistent():
+    rng = random.Random(1)
+    index = TriggerIndex()
+    live = {}
+    for pool_id, tp, sl, end_time in random_pools(rng, 300):
+        index.add(pool_id, tp, sl, end_time)
+        live[pool_id] = (pool_id, tp, sl, end_time)
+    for pool_id in rng.sample(sorted(live), 200):
+        index.remove(pool_id)
+        del live[pool_id]
+    # Re-adding an indexed pool replaces its thresholds.
+    for pool_id in rng.sample(sorted(live), 20):
+        live[pool_id] = (pool_id, rng.randint(101, 200), rng.randint(0, 99), rng.randint(1000, 2000))
+        index.add(*live[pool_id])
+
+    assert len(index) == len(live)
+    for _ in range(100):
+        price, now = rng.randint(-10, 210), rng.randint(900, 2100)
+        assert index.triggered(price, now) == brute_force(live.values(), price, now)
+
+
+def test_crossed_covers_every_price_in_the_range():
+    rng = random.Random(2)
+    pools = random_pools(rng, 300)
+    index = TriggerIndex()
+    index.rebuild(pools)
+    for _ in range(100):
+        low = rng.randint(0, 200)
+        high = rng.randint(low, 210)
+        now = rng.randint(900, 2100)
+        expected = {pool_id for pool_id, tp, sl, end_time in pools if tp <= high or sl >= low or end_time <= now}
+        assert index.crossed(high, low, now) == expected
+
+
+def test_nearest_ignores_triggered_pools():
+    index = TriggerIndex()
+    index.rebuild([(1, 110, 90, 1000), (2, 120, 80, 500), (3, 95, 70, 2000)])
+    assert index.nearest(100, 0) == (110, 90, 500)
+    assert index.nearest(100, 600) == (110, 90, 1000)
+    assert index.nearest(130, 2000) == (None, 90, None)
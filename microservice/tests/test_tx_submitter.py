@@ -0,0 +1,256 @@
+from eth_account import Account
+from eth_account.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
+from tx_submitter import TransactionSubmitter
+from web3 import Web3
+import asyncio
+import pytest
+
+PRIVATE_KEY = "0x" + "11" * 32
+
+
+class FakeNode:
+    """
+    Provider and web3 stand-in with a mempool: transactions are kept by nonce, the pending
+    count is the first free nonce, and replacements need both fees 10% higher.
+    """
+
+    routes_batches = True
+    to_hex = staticmethod(Web3.to_hex)
+    from_wei = staticmethod(Web3.from_wei)
+
+    def __init__(self, pending_nonce=0):
+        self.provider = self
+        self.eth = self
+        self.base = pending_nonce
+        self.pool = {}
+        self.reject = set()
+        self.down = False
+        self.nonce_reads = 0
+        self.sent = []
+        self.events = []
+
+    @property
+    def pending_nonce(self):
+        nonce = self.base
+        while nonce in self.pool:
+            nonce += 1
+        return nonce
+
+    @pending_nonce.setter
+    def pending_nonce(self, nonce):
+        self.base = nonce
+
+    async def get_transaction_count(self, address, block_identifier):
+        self.nonce_reads += 1
+        await asyncio.sleep(0)
+        return self.pending_nonce
+
+    def _accept(self, raw_transaction):
+        transaction = TypedTransaction.from_bytes(HexBytes(raw_transaction)).as_dict()
+        nonce = transaction["nonce"]
+        if len(self.sent) in self.reject:
+            return "internal error"
+        if nonce < self.base:
+            return "nonce too low"
+        queued = self.pool.get(nonce)
+        if queued == transaction:
+            return "already known"
+        if queued is not None and (transaction["maxFeePerGas"] < 1.1 * queued["maxFeePerGas"] or
+                                   transaction["maxPriorityFeePerGas"] < 1.1 * queued["maxPriorityFeePerGas"]):
+            return "replacement transaction underpriced"
+        self.pool[nonce] = transaction
+        return None
+
+    async def make_batch_request(self, requests):
+        await asyncio.sleep(0)
+        if self.down:
+            raise ConnectionError("node down")
+        responses = []
+        for i, (method, params) in enumerate(requests):
+            error = self._accept(params[0])
+            if error:
+                responses.append({"id": i, "error": {"code": -32000, "message": error}})
+            else:
+                responses.append({"id": i, "result": Web3.to_hex(Web3.keccak(hexstr=params[0]))})
+            self.sent.append(params[0])
+            self.events.append("broadcast")
+        return responses
+
+    async def make_request(self, method, params):
+        raise ConnectionError("node down")
+
+    def cancelled(self, nonce):
+        return self.pool[nonce]["to"] == HexBytes(Account.from_key(PRIVATE_KEY).address)
+
+
+class FakeContract:
+    address = "0x" + "22" * 20
+
+    def encode_abi(self, name, args):
+        return "0x" + bytes(args).hex()
+
+
+class FakeFeeOracle:
+    def __init__(self, balance=10 ** 18):
+        self._balance = balance
+        self.spent = 0
+
+    async def fees(self):
+        return 10, 1
+
+    async def balance(self, address):
+        return self._balance
+
+    async def gas_limits(self, sender, to, calls):
+        return [100_000 for _ in calls]
+
+    def spend(self, amount):
+        self.spent += amount
+
+
+def submitter(node, fee_oracle=None, lock_path=None):
+    return TransactionSubmitter(node, FakeContract(), PRIVATE_KEY, 1, fee_oracle or FakeFeeOracle(),
+                                lock_path=lock_path)
+
+
+def test_nonces_are_assigned_locally_and_in_order():
+    async def run():
+        node = FakeNode(pending_nonce=4)
+        sender = submitter(node)
+        first = await sender.submit_many([("resolvePool", [1]), ("resolvePool", [2])])
+        second = await sender.submit_many([("resolvePool", [3])])
+        assert [result["nonce"] for result in first + second] == [4, 5, 6]
+        assert all(result["status"] == "submitted" for result in first + second)
+
+    asyncio.run(run())
+
+
+def test_every_batch_starts_from_the_pending_count():
+    async def run():
+        node = FakeNode()
+        sender = submitter(node)
+        await sender.submit_many([("resolvePool", [1])])
+        # Another process using the same key sent two transactions.
+        node.pending_nonce += 2
+        results = await sender.submit_many([("resolvePool", [2])])
+        assert results[0]["nonce"] == 3
+        assert node.nonce_reads == 2
+
+    asyncio.run(run())
+
+
+def test_submitters_sharing_a_key_take_turns(tmp_path):
+    async def run():
+        node = FakeNode()
+        lock_path = str(tmp_path / "signer.lock")
+        senders = [submitter(node, lock_path=lock_path) for _ in range(4)]
+        batches = await asyncio.gather(*(sender.submit_many([("resolvePool", [i]), ("resolvePool", [i])])
+                                         for i, sender in enumerate(senders)))
+        nonces = sorted(result["nonce"] for results in batches for result in results)
+        assert nonces == list(range(8))
+
+    asyncio.run(run())
+
+
+def test_signed_hashes_are_reported_before_the_broadcast():
+    async def run():
+        node = FakeNode()
+        signed = {}
+
+        def on_signed(i, tx_hash):
+            signed[i] = tx_hash
+            node.events.append("signed")
+
+        results = await submitter(node).submit_many([("resolvePool", [1]), ("resolvePool", [2])], on_signed)
+        assert node.events == ["signed", "signed", "broadcast", "broadcast"]
+        assert signed == {i: result["transaction_hash"] for i, result in enumerate(results)}
+
+    asyncio.run(run())
+
+
+def test_a_failed_last_broadcast_leaves_its_nonce_to_the_next_batch():
+    async def run():
+        node = FakeNode()
+        node.reject = {1}
+        sender = submitter(node)
+        results = await sender.submit_many([("resolvePool", [1]), ("resolvePool", [2])])
+        assert [result["status"] for result in results] == ["submitted", "error"]
+
+        results = await sender.submit_many([("resolvePool", [2])])
+        assert results[0]["nonce"] == 1
+
+    asyncio.run(run())
+
+
+def test_transactions_queued_behind_a_failed_nonce_are_cancelled():
+    async def run():
+        node = FakeNode()
+        node.reject = {1}
+        fee_oracle = FakeFeeOracle()
+        sender = submitter(node, fee_oracle)
+        results = await sender.submit_many([("resolvePool", [1]), ("resolvePool", [2]), ("resolvePool", [3])])
+        assert [result["status"] for result in results] == ["submitted", "error", "error"]
+        assert results[2]["message"] == "Cancelled: nonce 1 before it failed to broadcast"
+        assert not node.cancelled(0) and node.cancelled(1) and node.cancelled(2)
+        assert fee_oracle.spent == 10 * 100_000 + 2 * 21_000 * 12
+
+        results = await sender.submit_many([("resolvePool", [2])])
+        assert results[0]["nonce"] == 3
+
+    asyncio.run(run())
+
+
+def test_cancellations_that_fail_are_finished_before_the_next_batch(tmp_path):
+    async def run():
+        node = FakeNode()
+        lock_path = str(tmp_path / "signer.lock")
+        # The second call and the cancellation of its nonce fail.
+        node.reject = {1, 3}
+        results = await submitter(node, lock_path=lock_path).submit_many(
+            [("resolvePool", [1]), ("resolvePool", [2]), ("resolvePool", [3])])
+        assert [result["status"] for result in results] == ["submitted", "error", "error"]
+        assert 1 not in node.pool and node.cancelled(2)
+
+        # Another process sharing the key cancels them again before signing, over the first cancellation.
+        node.reject = {5}
+        results = await submitter(node, lock_path=lock_path).submit_many([("resolvePool", [4])])
+        assert results[0]["status"] == "error"
+        assert all(transaction["data"] != HexBytes("0x04") for transaction in node.pool.values())
+
+        results = await submitter(node, lock_path=lock_path).submit_many([("resolvePool", [4])])
+        assert results[0] == {**results[0], "status": "submitted", "nonce": 3}
+        assert node.cancelled(1) and node.cancelled(2)
+
+    asyncio.run(run())
+
+
+def test_failed_batches_raise():
+    async def run():
+        node = FakeNode()
+        sender = submitter(node)
+        node.down = True
+        with pytest.raises(ConnectionError):
+            await sender.submit_many([("resolvePool", [1])])
+
+        node.down = False
+        results = await sender.submit_many([("resolvePool", [1])])
+        assert results[0] == {**results[0], "status": "submitted", "nonce": 0}
+
+    asyncio.run(run())
+
+
+def test_unaffordable_and_unestimated_calls_are_not_signed():
+    async def run():
+        node = FakeNode()
+        fee_oracle = FakeFeeOracle(balance=10 * 100_000)
+        results = await submitter(node, fee_oracle).submit_many(
+            [("resolvePool", [1]), ("resolvePool", [2]), ("resolvePool", [3])],
+            gas_limits=["Pool already resolved", 100_000, 100_000])
+        assert results[0] == {"status": "error", "message": "Pool already resolved"}
+        assert results[1]["status"] == "submitted" and results[1]["nonce"] == 0
+        assert results[2]["message"].startswith("Insufficient funds for gas")
+        assert len(node.sent) == 1
+        assert fee_oracle.spent == 10 * 100_000
+
+    asyncio.run(run())
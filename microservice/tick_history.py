@@ -0,0 +1,320 @@
+from config import PRICE_SCALE, TICK_HISTORY_SIZE, TICK_HISTORY_DIR
+import logging
+import numpy as np
+import os
+
+logger = logging.getLogger(__name__)
+
+TICK_DTYPE = np.dtype([("time", "<f8"), ("price", "<i8")])
+EMPTY_HIGH = np.iinfo(np.int64).min
+EMPTY_LOW = np.iinfo(np.int64).max
+NO_CROSSING = 0
+TARGET_CROSSED = 1
+STOP_CROSSED = 2
+
+
+def scale_price(price):
+    """Converts a price in wei to the int64 units of PRICE_SCALE wei used by the history, rounding down."""
+    return price // PRICE_SCALE
+
+
+def unscale_price(price):
+    """Converts a scaled price back to wei."""
+    return int(price) * PRICE_SCALE
+
+
+def scale_thresholds(target_prices, stop_losses):
+    """
+    Scales pool thresholds given in wei, rounding them inwards so that a scaled price
+    only counts as crossing one if the price in wei did.
+
+    :return: Tuple of (targets, stop losses) int64 arrays
+    """
+    targets = np.array([-(-int(target) // PRICE_SCALE) for target in target_prices], np.int64)
+    stops = np.array([int(stop_loss) // PRICE_SCALE for stop_loss in stop_losses], np.int64)
+    return targets, stops
+
+
+class SparseTable:
+    """
+    Range maximum and minimum table over a fixed array.
+
+    Level k holds the extremes of every run of 2**k values, so the extremes of
+    any range are the combination of two overlapping runs: O(n log n) to build,
+    then any number of ranges are answered together in O(1) each, and the first
+    crossing of a threshold in O(log n).
+    """
+
+    def __init__(self, values, low_values=None):
+        """
+        :param values: Array the maxima are taken over, e.g. candle highs
+        :param low_values: Array the minima are taken over, e.g. candle lows; values if None
+        """
+        values = np.asarray(values)
+        low_values = values if low_values is None else np.asarray(low_values)
+        levels = max(1, len(values).bit_length())
+        self._max = np.empty((levels, len(values)), values.dtype)
+        self._min = np.empty((levels, len(values)), low_values.dtype)
+        self._max[0] = values
+        self._min[0] = low_values
+        for level in range(1, levels):
+            span = 1 << (level - 1)
+            self._max[level, :-span] = np.maximum(self._max[level - 1, :-span], self._max[level - 1, span:])
+            self._min[level, :-span] = np.minimum(self._min[level - 1, :-span], self._min[level - 1, span:])
+            self._max[level, -span:] = self._max[level - 1, -span:]
+            self._min[level, -span:] = self._min[level - 1, -span:]
+
+    def query(self, lo, hi):
+        """
+        Returns the extremes of values[lo:hi] for arrays of bounds.
+
+        :param lo: Array of first indexes
+        :param hi: Array of end indexes, exclusive
+        :return: Tuple of (maxima, minima) arrays; empty ranges give EMPTY_HIGH and EMPTY_LOW
+        """
+        lo = np.asarray(lo, np.int64)
+        hi = np.asarray(hi, np.int64)
+        empty = hi <= lo
+        length = np.where(empty, 1, hi - lo)
+        # frexp gives length = m * 2**e with 0.5 <= m < 1, so e - 1 is floor(log2(length)).
+        level = np.frexp(length)[1] - 1
+        first = np.where(empty, 0, lo)
+        second = np.where(empty, 0, hi - (1 << level))
+        high = np.maximum(self._max[level, first], self._max[level, second])
+        low = np.minimum(self._min[level, first], self._min[level, second])
+        high[empty] = EMPTY_HIGH
+        low[empty] = EMPTY_LOW
+        return high, low
+
+    def first_at_least(self, lo, hi, thresholds):
+        """Returns, per range [lo, hi), the first index whose value is >= its threshold, or one >= hi if there is none."""
+        return self._first(self._max, lo, hi, np.less, thresholds)
+
+    def first_at_most(self, lo, hi, thresholds):
+        """Returns, per range [lo, hi), the first index whose low value is <= its threshold, or one >= hi if there is none."""
+        return self._first(self._min, lo, hi, np.greater, thresholds)
+
+    @staticmethod
+    def _first(table, lo, hi, misses, thresholds):
+        # Skip ahead by runs of halving length while every value in the run misses the threshold.
+        position = np.array(lo, np.int64)
+        hi = np.asarray(hi, np.int64)
+        for level in range(len(table) - 1, -1, -1):
+            span = 1 << level
+            fits = position + span <= hi
+            run = table[level, np.where(fits, position, 0)]
+            position += span * (fits & misses(run, thresholds))
+        return position
+
+
+class TickHistory:
+    """
+    Fixed-size ring buffer of the price ticks of one asset.
+
+    Each tick is a float64 unix timestamp and an int64 price in units of
+    PRICE_SCALE wei, 16 bytes in all. With a path the buffer is a memory-mapped
+    file that survives restarts; the write position is recovered from the newest
+    timestamp. Queries work on a chronological copy with NumPy, so every window,
+    extreme and candle is computed without a Python loop over ticks.
+    """
+
+    def __init__(self, capacity=TICK_HISTORY_SIZE, path=None):
+        self.capacity = capacity
+        self.path = path
+        self._ticks = self._open(path, capacity) if path else np.zeros(capacity, TICK_DTYPE)
+        times = self._ticks["time"]
+        self._count = int(np.count_nonzero(times))
+        self._head = (int(np.argmax(times)) + 1) % capacity if self._count else 0
+
+    @staticmethod
+    def _open(path, capacity):
+        if os.path.exists(path) and os.path.getsize(path) != capacity * TICK_DTYPE.itemsize:
+            # Keep the newest ticks of a buffer written with another capacity.
+            old = np.fromfile(path, TICK_DTYPE)
+            old = old[old["time"] > 0]
+            old = old[np.argsort(old["time"], kind="stable")][-capacity:]
+            os.remove(path)
+            ticks = np.memmap(path, TICK_DTYPE, mode="w+", shape=(capacity,))
+            ticks[:len(old)] = old
+            logger.warning(f"Tick history {path} resized to {capacity} ticks, kept {len(old)}.")
+            return ticks
+        mode = "r+" if os.path.exists(path) else "w+"
+        return np.memmap(path, TICK_DTYPE, mode=mode, shape=(capacity,))
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def last_time(self):
+        """Timestamp of the newest tick, or None if there is none."""
+        return float(self._ticks["time"][self._head - 1]) if self._count else None
+
+    def append(self, timestamp, price):
+        """
+        Adds a tick, overwriting the oldest one once the buffer is full.
+
+        :param timestamp: Unix timestamp of the tick
+        :param price: Price in wei
+        :return: False if the tick is not newer than the last one and was ignored
+        """
+        if self._count and timestamp <= self.last_time:
+            return False
+        self._ticks[self._head] = (timestamp, scale_price(price))
+        self._head = (self._head + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def flush(self):
+        if isinstance(self._ticks, np.memmap):
+            self._ticks.flush()
+
+    def arrays(self):
+        """Returns chronological copies of the (timestamps, scaled prices) arrays."""
+        if self._count < self.capacity:
+            ticks = self._ticks[self._head - self._count:self._head]
+        else:
+            ticks = np.concatenate((self._ticks[self._head:], self._ticks[:self._head]))
+        return np.array(ticks["time"]), np.array(ticks["price"])
+
+    def window(self, start=None, end=None):
+        """
+        Returns the ticks with start < time <= end.
+
+        :param start: Exclusive lower bound, None for the oldest tick
+        :param end: Inclusive upper bound, None for the newest tick
+        :return: Tuple of (timestamps, scaled prices) arrays
+        """
+        times, prices = self.arrays()
+        lo = 0 if start is None else np.searchsorted(times, start, side="right")
+        hi = len(times) if end is None else np.searchsorted(times, end, side="right")
+        return times[lo:hi], prices[lo:hi]
+
+    def high_low(self, start=None, end=None):
+        """
+        Returns the highest and lowest price of the ticks with start < time <= end.
+
+        :return: Tuple of (high, low) in wei, or (None, None) if the window has no ticks
+        """
+        _, prices = self.window(start, end)
+        if not len(prices):
+            return None, None
+        return unscale_price(prices.max()), unscale_price(prices.min())
+
+    def ohlc(self, start, end, interval):
+        """
+        Aggregates the ticks with start < time <= end into candles.
+
+        :param interval: Candle length in seconds; candles start at start + i * interval
+        :return: Dictionary of "time", "open", "high", "low" and "close" arrays with one
+                 entry per candle that has ticks, prices scaled
+        """
+        times, prices = self.window(start, end)
+        if not len(times):
+            empty = np.empty(0, np.int64)
+            return {"time": np.empty(0), "open": empty, "high": empty, "low": empty, "close": empty}
+        buckets = ((times - start) // interval).astype(np.int64)
+        first = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+        last = np.r_[first[1:], len(prices)] - 1
+        return {
+            "time": start + buckets[first] * interval,
+            "open": prices[first],
+            "high": np.maximum.reduceat(prices, first),
+            "low": np.minimum.reduceat(prices, first),
+            "close": prices[last],
+        }
+
+    def crossings(self, starts, ends, targets, stop_losses):
+        """
+        Tests many pools against the ticks of their own windows at once.
+
+        Each pool is given a window start < time <= end; its target counts as hit
+        if any tick in it is at or above the target, and its stop loss if any is at
+        or below the stop. When both are hit the earlier crossing wins, and on the
+        same tick the target wins, as in resolvePool.
+
+        :param starts: Array of exclusive window starts
+        :param ends: Array of inclusive window ends
+        :param targets: Target prices in wei
+        :param stop_losses: Stop losses in wei
+        :return: Tuple of (crossing, price) arrays: NO_CROSSING, TARGET_CROSSED or
+                 STOP_CROSSED per pool, and the scaled price to resolve it with
+        """
+        times, prices = self.arrays()
+        lo = np.searchsorted(times, np.asarray(starts, np.float64), side="right")
+        hi = np.searchsorted(times, np.asarray(ends, np.float64), side="right")
+        targets, stop_losses = scale_thresholds(targets, stop_losses)
+
+        crossing = np.full(len(lo), NO_CROSSING, np.int8)
+        price = np.zeros(len(lo), np.int64)
+        if not len(lo) or lo.min() >= len(prices):
+            return crossing, price
+
+        # Only the ticks some window covers are needed for the table.
+        base = int(lo.min())
+        high, low = SparseTable(prices[base:max(int(hi.max()), base + 1)]).query(lo - base, hi - base)
+        target_hit = high >= targets
+        stop_hit = low <= stop_losses
+        crossing[target_hit] = TARGET_CROSSED
+        price[target_hit] = high[target_hit]
+        crossing[stop_hit & ~target_hit] = STOP_CROSSED
+        price[stop_hit & ~target_hit] = low[stop_hit & ~target_hit]
+
+        # Pools that crossed both ways within one window are rare; find which came first.
+        for i in np.flatnonzero(target_hit & stop_hit):
+            window = prices[lo[i]:hi[i]]
+            first_target = int(np.argmax(window >= targets[i]))
+            first_stop = int(np.argmax(window <= stop_losses[i]))
+            if first_stop < first_target:
+                crossing[i] = STOP_CROSSED
+                price[i] = low[i]
+        return crossing, price
+
+
+class TickStore:
+    """Tick histories per asset, memory-mapped under TICK_HISTORY_DIR when it is set."""
+
+    def __init__(self, directory=TICK_HISTORY_DIR, capacity=TICK_HISTORY_SIZE):
+        self.directory = directory
+        self.capacity = capacity
+        self._histories = {}
+
+    def _path(self, asset):
+        return os.path.join(self.directory, f"{asset}.ticks") if self.directory else None
+
+    def history(self, asset):
+        """Returns the history of an asset, creating it if there is none."""
+        history = self._histories.get(asset)
+        if history is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            history = self._histories[asset] = TickHistory(self.capacity, self._path(asset))
+        return history
+
+    def find(self, asset):
+        """Returns the history of an asset if one was recorded, by this process or on disk, without creating one."""
+        history = self._histories.get(asset)
+        if history is None:
+            path = self._path(asset)
+            if path is None or not os.path.exists(path):
+                return None
+            history = self._histories[asset] = TickHistory(self.capacity, path)
+        return history
+
+    def record(self, quotes):
+        """
+        Appends a tick per asset, unless the quote is already the newest tick.
+
+        :param quotes: Dictionary of asset to a (price in wei, unix timestamp it was fetched at) tuple,
+                       or to None if the price is unknown
+        """
+        for asset, quote in quotes.items():
+            if quote is not None:
+                price, timestamp = quote
+                self.history(asset).append(timestamp, price)
+
+    def flush(self):
+        for history in self._histories.values():
+            history.flush()
+
+
+tick_store = TickStore()
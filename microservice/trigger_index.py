@@ -0,0 +1,160 @@
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import math
+
+TARGET_REACHED = "Target price reached"
+STOP_LOSS_HIT = "Stop loss hit"
+END_TIME_REACHED = "End time reached"
+
+
+def evaluate(price, now, target_price, stop_loss, end_time):
+    """
+    Returns the outcome a pool would resolve with at the given price and time,
+    using the same precedence as PredictionMarket.resolvePool, or None.
+    """
+    if price >= target_price:
+        return TARGET_REACHED
+    if price <= stop_loss:
+        return STOP_LOSS_HIT
+    if end_time <= now:
+        return END_TIME_REACHED
+    return None
+
+
+class TriggerIndex:
+    """
+    Index of active pools by the thresholds that resolve them.
+
+    Pools are kept in one list sorted by target price, one sorted by stop loss and
+    a min-heap on end time, so a price tick only touches the pools it triggers:
+    O(log n + k) per tick for k triggered pools.
+    """
+
+    def __init__(self):
+        self._pools = {}
+        self._by_target = []
+        self._by_stop = []
+        self._by_end = []
+        self._stale = 0
+
+    def __len__(self):
+        return len(self._pools)
+
+    def __contains__(self, pool_id):
+        return pool_id in self._pools
+
+    def add(self, pool_id, target_price, stop_loss, end_time):
+        if pool_id in self._pools:
+            self.remove(pool_id)
+        self._pools[pool_id] = (target_price, stop_loss, end_time)
+        insort(self._by_target, (target_price, pool_id))
+        insort(self._by_stop, (stop_loss, pool_id))
+        heapq.heappush(self._by_end, (end_time, pool_id))
+
+    def remove(self, pool_id):
+        entry = self._pools.pop(pool_id, None)
+        if entry is None:
+            return
+        target_price, stop_loss, _ = entry
+        del self._by_target[bisect_left(self._by_target, (target_price, pool_id))]
+        del self._by_stop[bisect_left(self._by_stop, (stop_loss, pool_id))]
+
+        # End-time entries are removed lazily and compacted once half the heap is stale.
+        self._stale += 1
+        if self._stale > len(self._by_end) // 2:
+            self._by_end = [(end_time, pid) for pid, (_, _, end_time) in self._pools.items()]
+            heapq.heapify(self._by_end)
+            self._stale = 0
+
+    def rebuild(self, pools):
+        """Replace the index contents with an iterable of (pool_id, target_price, stop_loss, end_time)."""
+        self._pools = {pool_id: (tp, sl, end_time) for pool_id, tp, sl, end_time in pools}
+        self._by_target = sorted((tp, pool_id) for pool_id, (tp, _, _) in self._pools.items())
+        self._by_stop = sorted((sl, pool_id) for pool_id, (_, sl, _) in self._pools.items())
+        self._by_end = [(end_time, pool_id) for pool_id, (_, _, end_time) in self._pools.items()]
+        heapq.heapify(self._by_end)
+        self._stale = 0
+
+    def _expired(self, now):
+        """Walks only the part of the heap whose end time is <= now."""
+        heap = self._by_end
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            end_time, pool_id = heap[i]
+            if end_time > now:
+                continue
+            entry = self._pools.get(pool_id)
+            if entry is not None and entry[2] == end_time:
+                yield pool_id
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    stack.append(child)
+
+    def triggered(self, price, now):
+        """
+        Returns the pools that must be resolved at the given price and time.
+
+        :param price: Current price in wei
+        :param now: Current unix timestamp
+        :return: Dictionary of pool id to outcome, in resolvePool precedence
+        """
+        result = {}
+        for _, pool_id in self._by_target[:bisect_right(self._by_target, (price, math.inf))]:
+            result[pool_id] = TARGET_REACHED
+        for _, pool_id in self._by_stop[bisect_left(self._by_stop, (price, -math.inf)):]:
+            result.setdefault(pool_id, STOP_LOSS_HIT)
+        for pool_id in self._expired(now):
+            result.setdefault(pool_id, END_TIME_REACHED)
+        return result
+
+    def crossed(self, high, low, now):
+        """
+        Returns the pools that some price between low and high, or the time, would resolve.
+
+        :param high: Highest price in wei since the last check
+        :param low: Lowest price in wei since the last check
+        :param now: Current unix timestamp
+        :return: Set of pool ids whose target is at most high, whose stop loss is at least low or that have ended
+        """
+        pool_ids = {pool_id for _, pool_id in self._by_target[:bisect_right(self._by_target, (high, math.inf))]}
+        pool_ids.update(pool_id for _, pool_id in self._by_stop[bisect_left(self._by_stop, (low, -math.inf)):])
+        pool_ids.update(self._expired(now))
+        return pool_ids
+
+    def thresholds(self, pool_id):
+        """Returns the (target_price, stop_loss, end_time) of an indexed pool."""
+        return self._pools[pool_id]
+
+    def nearest(self, price, now):
+        """
+        Returns the thresholds that will fire next, ignoring pools already triggered.
+
+        :param price: Current price in wei
+        :param now: Current unix timestamp
+        :return: Tuple of (lowest target price above price, highest stop loss below price,
+                 earliest end time after now), each None if there is none
+        """
+        i = bisect_right(self._by_target, (price, math.inf))
+        next_target = self._by_target[i][0] if i < len(self._by_target) else None
+        j = bisect_left(self._by_stop, (price, -math.inf))
+        next_stop = self._by_stop[j - 1][0] if j > 0 else None
+
+        # Ended pools and stale entries hide the next end time below them in the heap.
+        heap = self._by_end
+        next_end = None
+        stack = [0] if heap else []
+        while stack:
+            i = stack.pop()
+            end_time, pool_id = heap[i]
+            if next_end is not None and end_time >= next_end:
+                continue
+            entry = self._pools.get(pool_id)
+            if end_time > now and entry is not None and entry[2] == end_time:
+                next_end = end_time
+                continue
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    stack.append(child)
+        return next_target, next_stop, next_end
+
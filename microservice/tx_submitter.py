@@ -0,0 +1,285 @@
+from eth_account import Account
+from rpc import batch_request
+import asyncio
+import fcntl
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+CANCEL_GAS = 21000
+
+
+def replacement_fee(fee):
+    """Raises a fee by an eighth and at least 1 wei; nodes only replace queued transactions paying 10% more."""
+    return fee + fee // 8 + 1
+
+
+class SignerLock:
+    """
+    Exclusive lock on a local file held while a process signs and broadcasts for an account.
+
+    The API and the bot sign with the same key, so they take turns: each reads the
+    pending nonce only once the other's transactions are broadcast. The lock is polled
+    rather than waited on in a thread, so a cancelled submission never leaves it held.
+    The file also carries state the next holder must act on, whichever process it is.
+    Without a path it only keeps that state in memory.
+    """
+
+    def __init__(self, path=None, poll_interval=0.05):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._file = None
+        self._state = None
+
+    def read(self):
+        """Returns the state recorded by the last holder, None if there is none."""
+        if self.path is None:
+            return self._state
+        self._file.seek(0)
+        text = self._file.read()
+        return json.loads(text) if text.strip() else None
+
+    def write(self, state):
+        """Records a JSON-serializable state for the next holder; None clears it."""
+        if self.path is None:
+            self._state = state
+            return
+        self._file.truncate(0)
+        if state is not None:
+            self._file.write(json.dumps(state))
+        self._file.flush()
+
+    async def __aenter__(self):
+        if self.path is None:
+            return self
+        file = open(self.path, "a+")
+        try:
+            while True:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(self.poll_interval)
+        except BaseException:
+            file.close()
+            raise
+        self._file = file
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class TransactionSubmitter:
+    """
+    Signs and broadcasts contract transactions for one account.
+
+    Each batch starts from the node's pending transaction count, read under a
+    SignerLock, so processes sharing the key never sign the same nonce; within a
+    batch nonces are assigned locally so many transactions can be signed and sent
+    back to back. Fees, gas limits and the balance come from a FeeOracle and
+    broadcasts go out as JSON-RPC batches.
+
+    When a broadcast in a batch fails, the later transactions the node accepted
+    would sit queued behind the missing nonce and run whenever it is filled, so
+    they are reported as failed and cancelled with self-transfers at replacement
+    fees. A cancellation that cannot be broadcast is recorded in the SignerLock and
+    retried before the next batch of any process signs anything.
+    """
+
+    def __init__(self, web3, contract, private_key, chain_id, fee_oracle, chunk_size=100, lock_path=None):
+        """
+        :param web3: Connected AsyncWeb3 instance
+        :param contract: Contract the transactions are sent to
+        :param private_key: Signing key of the sending account
+        :param chain_id: Chain id used for signing
+        :param fee_oracle: FeeOracle serving fees, gas limits and the balance
+        :param chunk_size: Maximum number of requests per batch
+        :param lock_path: File locked while signing, shared by every process using the key on this host
+        """
+        self.web3 = web3
+        self.contract = contract
+        self.account = Account.from_key(private_key)
+        self.chain_id = chain_id
+        self.fee_oracle = fee_oracle
+        self.chunk_size = chunk_size
+        self._nonce = None
+        self._lock = asyncio.Lock()
+        self._signer_lock = SignerLock(lock_path)
+
+    @property
+    def address(self):
+        return self.account.address
+
+    async def _resync_nonce(self):
+        nonce = await self.web3.eth.get_transaction_count(self.address, 'pending')
+        if self._nonce is not None and nonce != self._nonce:
+            # Another process sent transactions, or some of ours were dropped.
+            logger.info(f"Nonce for {self.address} resynced from {self._nonce} to {nonce}")
+        self._nonce = nonce
+
+    async def simulate(self, calls):
+        """
+        Dry-runs contract calls from the sending account with eth_call and estimates their
+        gas, all in one batch.
+
+        :param calls: List of (function name, args) tuples
+        :return: List of (error, gas limit) tuples: error is None for each call that would succeed,
+                 otherwise the error it would revert with and the gas limit None
+        """
+        requests = []
+        for name, args in calls:
+            transaction = {'from': self.address, 'to': self.contract.address,
+                           'data': self.contract.encode_abi(name, args=args)}
+            requests += [('eth_call', [transaction, 'latest']), ('eth_estimateGas', [transaction])]
+        responses = await batch_request(self.web3, requests, self.chunk_size)
+
+        results = []
+        for call, estimate in zip(responses[::2], responses[1::2]):
+            error = call if 'error' in call else estimate if 'error' in estimate else None
+            if error is not None:
+                results.append((error['error'].get('message') or "reverted", None))
+            else:
+                results.append((None, self.fee_oracle.gas_limit(estimate['result'])))
+        return results
+
+    async def submit_many(self, calls, on_signed=None, gas_limits=None):
+        """
+        Signs and broadcasts one transaction per contract call.
+
+        :param calls: List of (function name, args) tuples
+        :param on_signed: Optional callback(index in calls, transaction hash) run for every signed
+                          transaction before any of them is broadcast
+        :param gas_limits: Optional gas limit per call, e.g. from simulate(); the fee oracle's otherwise
+        :return: List of per-transaction result dictionaries, in the order of calls
+        """
+        async with self._lock:
+            try:
+                max_fee_per_gas, max_priority_fee_per_gas = await self.fee_oracle.fees()
+                balance = await self.fee_oracle.balance(self.address)
+                calldata = [self.contract.encode_abi(name, args=args) for name, args in calls]
+                if gas_limits is None:
+                    gas_limits = await self.fee_oracle.gas_limits(
+                        self.address, self.contract.address,
+                        [(name, data) for (name, _), data in zip(calls, calldata)]
+                    )
+
+                async with self._signer_lock:
+                    await self._resync_nonce()
+                    if not await self._cancel_stale(max_fee_per_gas, max_priority_fee_per_gas):
+                        message = "Earlier transactions of this account are queued behind a missing nonce and could not be cancelled"
+                        return [{"status": "error", "message": message} for _ in calls]
+
+                    results = [None] * len(calls)
+                    signed = []
+                    for i, (data, gas) in enumerate(zip(calldata, gas_limits)):
+                        if isinstance(gas, str):
+                            results[i] = {"status": "error", "message": gas}
+                            continue
+
+                        total_gas_fee = gas * max_fee_per_gas
+                        if balance < total_gas_fee:
+                            results[i] = {"status": "error", "message": f"Insufficient funds for gas. Required: {self.web3.from_wei(total_gas_fee, 'ether')} ETH, Available: {self.web3.from_wei(balance, 'ether')} ETH"}
+                            continue
+                        balance -= total_gas_fee
+
+                        txn = {
+                            'type': 2,
+                            'chainId': self.chain_id,
+                            'nonce': self._nonce,
+                            'to': self.contract.address,
+                            'value': 0,
+                            'data': data,
+                            'gas': gas,
+                            'maxFeePerGas': max_fee_per_gas,
+                            'maxPriorityFeePerGas': max_priority_fee_per_gas,
+                        }
+                        signed.append((i, self._nonce, gas, self.account.sign_transaction(txn), total_gas_fee))
+                        self._nonce += 1
+
+                    if on_signed is not None:
+                        for i, _, _, signed_txn, _ in signed:
+                            on_signed(i, self.web3.to_hex(signed_txn.hash))
+
+                    responses = await batch_request(self.web3, [
+                        ('eth_sendRawTransaction', [self.web3.to_hex(signed_txn.raw_transaction)])
+                        for _, _, _, signed_txn, _ in signed
+                    ], self.chunk_size)
+
+                    first_failed = None
+                    queued = False
+                    for (i, nonce, gas, _, total_gas_fee), response in zip(signed, responses):
+                        if 'error' in response:
+                            results[i] = {"status": "error", "nonce": nonce, "message": response['error'].get('message')}
+                            if first_failed is None:
+                                first_failed = nonce
+                        elif first_failed is not None:
+                            queued = True
+                            results[i] = {"status": "error", "nonce": nonce,
+                                          "message": f"Cancelled: nonce {first_failed} before it failed to broadcast"}
+                        else:
+                            self.fee_oracle.spend(total_gas_fee)
+                            results[i] = {"status": "submitted", "nonce": nonce, "gas": gas, "transaction_hash": response['result']}
+
+                    if queued:
+                        self._nonce = first_failed
+                        self._signer_lock.write({"start": first_failed, "end": signed[-1][1] + 1,
+                                                 "max_fee_per_gas": max_fee_per_gas,
+                                                 "max_priority_fee_per_gas": max_priority_fee_per_gas})
+                        try:
+                            await self._cancel_stale(max_fee_per_gas, max_priority_fee_per_gas)
+                        except Exception as e:
+                            logger.error(f"Error cancelling transactions queued behind nonce {first_failed}: {str(e)}")
+
+            except Exception:
+                # The node may have accepted any part of the batch, so the local nonce means nothing now.
+                self._nonce = None
+                raise
+
+        return results
+
+    async def _cancel_stale(self, max_fee_per_gas, max_priority_fee_per_gas):
+        """
+        Cancels the queued transactions recorded in the SignerLock, from the pending nonce on.
+
+        :return: True if there were none or all were cancelled; False if new transactions must
+                 not be signed yet, since filling the missing nonce would run the queued ones
+        """
+        stale = self._signer_lock.read()
+        if stale is None:
+            return True
+        nonces = range(max(self._nonce, stale["start"]), stale["end"])
+        if nonces:
+            max_fee_per_gas = replacement_fee(max(max_fee_per_gas, stale["max_fee_per_gas"]))
+            max_priority_fee_per_gas = replacement_fee(max(max_priority_fee_per_gas, stale["max_priority_fee_per_gas"]))
+            # A retry has to replace whatever this attempt gets accepted.
+            self._signer_lock.write({**stale, "max_fee_per_gas": max_fee_per_gas,
+                                     "max_priority_fee_per_gas": max_priority_fee_per_gas})
+            responses = await batch_request(self.web3, [
+                ('eth_sendRawTransaction', [self.web3.to_hex(self.account.sign_transaction({
+                    'type': 2,
+                    'chainId': self.chain_id,
+                    'nonce': nonce,
+                    'to': self.address,
+                    'value': 0,
+                    'gas': CANCEL_GAS,
+                    'maxFeePerGas': max_fee_per_gas,
+                    'maxPriorityFeePerGas': max_priority_fee_per_gas,
+                }).raw_transaction)])
+                for nonce in nonces
+            ], self.chunk_size)
+            accepted = sum('error' not in response for response in responses)
+            self.fee_oracle.spend(accepted * CANCEL_GAS * max_fee_per_gas)
+            if accepted < len(nonces):
+                logger.error(f"Could not cancel all of nonces {nonces.start} to {nonces.stop - 1} for {self.address}; "
+                             f"new transactions wait until they are.")
+                return False
+            logger.warning(f"Cancelled nonces {nonces.start} to {nonces.stop - 1} for {self.address}, "
+                           f"queued behind a failed broadcast.")
+            self._nonce = nonces.stop
+        self._signer_lock.write(None)
+        return True